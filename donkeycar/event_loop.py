@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+One asyncio event loop for all the I/O-bound parts of a vehicle.
+
+Web servers, sockets and other network parts spend nearly all their time
+waiting. Rather than each of them running a thread or an event loop of its
+own, they can share the single loop a Vehicle runs on a thread of its own.
+
+A part opts in with coroutine methods:
+
+    async def start_async(self)
+        Awaited once on the loop when the vehicle starts, to start servers,
+        connections or background tasks. Errors stop the vehicle.
+
+    async def run_async(self, *inputs)
+        Scheduled on the loop in place of run() on each drive loop. The drive
+        loop does not wait for it and saves its outputs on the first loop
+        that finds it done, see Vehicle.add.
+"""
+import asyncio
+import threading
+from threading import Thread
+
+
+def is_coroutine_method(part, name):
+    """ whether part has a method called name defined with async def """
+    return asyncio.iscoroutinefunction(getattr(part, name, None))
+
+
+class EventLoopThread:
+    """
+    An asyncio event loop running on a daemon thread, fed coroutines from
+    other threads.
+    """
+    def __init__(self, name='event-loop'):
+        self.name = name
+        self.loop = None
+        self.thread = None
+
+    @property
+    def running(self):
+        return self.loop is not None
+
+    def start(self):
+        """ start the loop thread, unless it is running already """
+        if self.loop is not None:
+            return
+        self.loop = asyncio.new_event_loop()
+        started = threading.Event()
+        self.thread = Thread(target=self.run, args=(self.loop, started),
+                             name=self.name, daemon=True)
+        self.thread.start()
+        started.wait()
+
+    def run(self, loop, started):
+        asyncio.set_event_loop(loop)
+        loop.call_soon(started.set)
+        try:
+            loop.run_forever()
+        finally:
+            # give the tasks still running a chance to clean up
+            tasks = asyncio.all_tasks(loop)
+            for task in tasks:
+                task.cancel()
+            loop.run_until_complete(
+                asyncio.gather(*tasks, return_exceptions=True))
+            loop.run_until_complete(loop.shutdown_asyncgens())
+            loop.close()
+
+    def submit(self, coro):
+        """
+        Schedule coro on the loop from any thread. Returns a
+        concurrent.futures.Future of its result.
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def call_soon(self, callback, *args):
+        """ call callback(*args) on the loop thread, from any thread """
+        self.loop.call_soon_threadsafe(callback, *args)
+
+    def stop(self, timeout=2.0):
+        """
+        Stop the loop once the callbacks already queued ran, cancel its
+        tasks and wait up to timeout seconds for the thread to end.
+        """
+        if self.loop is None:
+            return
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout)
+        if self.thread.is_alive():
+            print('WARN::Vehicle: event loop thread did not stop within '
+                  '{:.1f}s'.format(timeout))
+        self.loop = None
+        self.thread = None
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Checks of the channels wired between the parts of a vehicle.
+
+Nothing ties the outputs of one part to the inputs of another but their
+names, so a typo or a part left out of a template goes unnoticed: the
+reader just gets None from memory. PartGraph looks at the part list as a
+whole and finds the channels nobody reads, the channels nobody writes and
+the channels written by more than one part, and which parts do no work the
+drive loop needs.
+"""
+from prettytable import PrettyTable
+
+from .memory import HISTORY_KEY
+from .profiler import part_name
+
+
+def channel(key):
+    """ the channel behind an input name like 'channel[-2]' """
+    match = HISTORY_KEY.match(key)
+    if match:
+        return match.group('key')
+    return key
+
+
+def reads(entry):
+    """ the channels a part entry reads, its run condition included """
+    keys = {channel(key) for key in entry['inputs']}
+    if entry.get('run_condition'):
+        keys.add(entry['run_condition'])
+    return keys
+
+
+class PartGraph:
+    """
+    The channels between the part entries of a vehicle, in the order they
+    run, with what looks wrong about them:
+
+    unconsumed  - channels written but read by no part
+    missing     - channels read but written by no part, nor set in memory
+                  before the start
+    overwritten - (channel, earlier part, later part, read in between)
+                  for each part writing a channel an earlier part wrote.
+                  A part that also reads the channel, like a filter on the
+                  throttle, changes it in place and is not counted.
+    """
+    def __init__(self, parts, mem=None):
+        self.parts = parts
+        self.readers = {}
+        self.writers = {}
+        for entry in parts:
+            for key in reads(entry):
+                self.readers.setdefault(key, []).append(entry)
+            for key in entry['outputs']:
+                self.writers.setdefault(key, []).append(entry)
+
+        self.unconsumed = sorted(key for key in self.writers
+                                 if key not in self.readers)
+        self.missing = sorted(key for key in self.readers
+                              if key not in self.writers and
+                              (mem is None or mem.get([key])[0] is None))
+        self.overwritten = []
+        for key, writers in sorted(self.writers.items()):
+            if len(writers) > 1:
+                self.overwritten += self.find_overwrites(key)
+
+    def find_overwrites(self, key):
+        found = []
+        last = None
+        read = False
+        for entry in self.parts:
+            entry_reads = key in reads(entry)
+            if key in entry['outputs']:
+                if last is not None and not entry_reads:
+                    found.append((key, last, entry, read))
+                last = entry
+                read = False
+            elif entry_reads:
+                read = True
+        return found
+
+    def dead_parts(self):
+        """
+        Part entries that can be skipped: those with outputs that no other
+        part, short of the ones skipped, reads. Parts without outputs, and
+        parts with a true side_effects attribute, like the tub writer, are
+        always kept.
+        """
+        dead = set()
+        changed = True
+        while changed:
+            changed = False
+            for entry in self.parts:
+                if id(entry) in dead or not entry['outputs'] or \
+                        getattr(entry['part'], 'side_effects', False):
+                    continue
+                read = any(reader is not entry and id(reader) not in dead
+                           for key in entry['outputs']
+                           for reader in self.readers.get(key, []))
+                if not read:
+                    dead.add(id(entry))
+                    changed = True
+        return [entry for entry in self.parts if id(entry) in dead]
+
+    def report(self):
+        """ print a table of the problems found, if any """
+        def names(entries):
+            return ', '.join(part_name(entry['part']) for entry in entries)
+
+        rows = []
+        for key in self.unconsumed:
+            rows.append(['not read', key, names(self.writers[key])])
+        for key in self.missing:
+            rows.append(['never written', key, names(self.readers[key])])
+        for key, earlier, later, read in self.overwritten:
+            check = 'overwritten' if read else 'overwritten unread'
+            rows.append([check, key, names([earlier, later])])
+        if not rows:
+            return
+        pt = PrettyTable()
+        pt.field_names = ['check', 'channel', 'parts']
+        pt.align = 'l'
+        for row in rows:
+            pt.add_row(row)
+        print('Part graph:')
+        print(pt)
@@ -8,7 +8,8 @@ import os
 from threading import Thread
 
 import donkeycar as dk
-from donkeycar.parts.datastore import Tub
+from donkeycar.parts.datastore import Tub, load_json_record, convert_tub, \
+    pack_tub, unpack_tub
 from donkeycar.utils import *
 from donkeycar.management.tub import TubManager
 from donkeycar.management.joystick_creator import CreateJoystick
@@ -491,8 +492,7 @@ class ShowPredictionPlots(BaseCommand):
         print('processing %d records:' % num_records)
 
         for record_path in records:
-            with open(record_path, 'r') as fp:
-                record = json.load(fp)
+            record = load_json_record(record_path)
             img_filename = os.path.join(tub_paths, record['cam/image_array'])
             img = load_scaled_image_arr(img_filename, cfg)
             user_angle = float(record["user/angle"])
@@ -586,6 +586,111 @@ class TubAugment(BaseCommand):
         self.augment(args.tubs, args.inplace)
 
 
+class TubConvert(BaseCommand):
+    def parse_args(self, args):
+        parser = argparse.ArgumentParser(prog='tubconvert', usage='%(prog)s [options]')
+        parser.add_argument('tubs', nargs='+', help='paths to tubs')
+        parser.add_argument('--chunk_records', type=int, default=1000, help='records per catalog chunk file')
+        parser.add_argument('--keep_json', action='store_true', help='keep the record_N.json files')
+        parsed_args = parser.parse_args(args)
+        return parsed_args
+
+    def convert(self, tub_paths, chunk_records=1000, keep_json=False):
+        '''
+        Convert tubs with a record_N.json file per record to the catalog
+        format, in place.
+        '''
+        cfg = load_config('config.py')
+        tubs = gather_tubs(cfg, tub_paths)
+
+        for tub in tubs:
+            convert_tub(tub.path, chunk_records=chunk_records, keep_json=keep_json)
+
+    def run(self, args):
+        args = self.parse_args(args)
+        self.convert(args.tubs, args.chunk_records, args.keep_json)
+
+
+class TubColumns(BaseCommand):
+    def parse_args(self, args):
+        parser = argparse.ArgumentParser(prog='tubcolumns', usage='%(prog)s [options]')
+        parser.add_argument('tubs', nargs='+', help='paths to tubs')
+        parsed_args = parser.parse_args(args)
+        return parsed_args
+
+    def write_columns(self, tub_paths):
+        '''
+        Write the column sidecar of tubs that have none up to date, so
+        their records are loaded for training without being read.
+        '''
+        cfg = load_config('config.py')
+        tubs = gather_tubs(cfg, tub_paths)
+
+        for tub in tubs:
+            if tub.get_columns() is not None:
+                print('{}: columns up to date'.format(tub.path))
+            else:
+                tub.save_columns()
+                loaded = tub.get_columns()
+                if loaded is not None:
+                    ixs, columns, skipped = loaded
+                    print('{}: wrote {} columns of {} records'.format(
+                        tub.path, len(columns), len(ixs)))
+                    if skipped:
+                        print('  skipped: ' + ', '.join(skipped))
+            tub.shutdown()
+
+    def run(self, args):
+        args = self.parse_args(args)
+        self.write_columns(args.tubs)
+
+
+class TubPack(BaseCommand):
+    def parse_args(self, args):
+        parser = argparse.ArgumentParser(prog='tubpack', usage='%(prog)s [options]')
+        parser.add_argument('tubs', nargs='+', help='paths to tubs')
+        parser.add_argument('--shard_mb', type=int, default=128, help='megabytes of images per shard file')
+        parser.add_argument('--keep_files', action='store_true', help='keep the image files')
+        parsed_args = parser.parse_args(args)
+        return parsed_args
+
+    def pack(self, tub_paths, shard_mb=128, keep_files=False):
+        '''
+        Pack the image files of tubs into a few shard files, in place.
+        '''
+        cfg = load_config('config.py')
+        tubs = gather_tubs(cfg, tub_paths)
+
+        for tub in tubs:
+            pack_tub(tub.path, shard_mb=shard_mb, keep_files=keep_files)
+
+    def run(self, args):
+        args = self.parse_args(args)
+        self.pack(args.tubs, args.shard_mb, args.keep_files)
+
+
+class TubUnpack(BaseCommand):
+    def parse_args(self, args):
+        parser = argparse.ArgumentParser(prog='tubunpack', usage='%(prog)s [options]')
+        parser.add_argument('tubs', nargs='+', help='paths to tubs')
+        parsed_args = parser.parse_args(args)
+        return parsed_args
+
+    def unpack(self, tub_paths):
+        '''
+        Write the packed images of tubs back to an image file each.
+        '''
+        cfg = load_config('config.py')
+        tubs = gather_tubs(cfg, tub_paths)
+
+        for tub in tubs:
+            unpack_tub(tub.path)
+
+    def run(self, args):
+        args = self.parse_args(args)
+        self.unpack(args.tubs)
+
+
 def execute_from_command_line():
     """
     This is the function linked to the "donkey" terminal command.
@@ -599,6 +704,10 @@ def execute_from_command_line():
             'tubplot': ShowPredictionPlots,
             'tubcheck': TubCheck,
             'tubaugment': TubAugment,
+            'tubconvert': TubConvert,
+            'tubcolumns': TubColumns,
+            'tubpack': TubPack,
+            'tubunpack': TubUnpack,
             'makemovie': MakeMovieShell,            
             'createjs': CreateJoystick,
             'consync': ConSync,
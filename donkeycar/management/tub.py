@@ -4,10 +4,12 @@ tub.py
 Manage tubs
 '''
 
-import os, sys, time
+import os
 import json
+import mimetypes
 import tornado.web
-from stat import S_ISREG, ST_MTIME, ST_MODE, ST_CTIME, ST_ATIME
+from donkeycar.parts.datastore import Tub, load_json_record
+from donkeycar.parts.shards import read_image_file
 
 
 class TubManager:
@@ -33,7 +35,7 @@ class WebServer(tornado.web.Application):
             (r"/tubs/?(?P<tub_id>[^/]+)?", TubView),
             (r"/api/tubs/?(?P<tub_id>[^/]+)?", TubApi, dict(data_path=data_path)),
             (r"/static/(.*)", tornado.web.StaticFileHandler, {"path": static_file_path}),
-            (r"/tub_data/(.*)", tornado.web.StaticFileHandler, {"path": data_path}),
+            (r"/tub_data/(.*)", TubDataHandler, {"path": data_path}),
             ]
 
         settings = {'debug': True}
@@ -67,6 +69,38 @@ class TubView(tornado.web.RequestHandler):
         self.render("tub_web/tub.html", **data)
 
 
+class TubDataHandler(tornado.web.StaticFileHandler):
+    '''
+    The files of the tubs, and the records of catalog tubs and the images
+    of packed tubs, which have no file of their own.
+    '''
+
+    def get(self, path, include_body=True):
+        root = os.path.abspath(self.root)
+        file_path = os.path.abspath(os.path.join(root, path))
+        if os.path.exists(file_path) or not file_path.startswith(root + os.sep):
+            return super().get(path, include_body)
+        name = os.path.basename(file_path)
+        try:
+            if name.startswith('record_'):
+                data = json.dumps(load_json_record(file_path)).encode('utf-8')
+                content_type = 'application/json'
+            else:
+                data = read_image_file(file_path)
+                content_type = mimetypes.guess_type(name)[0]
+        except (FileNotFoundError, ValueError, IndexError):
+            raise tornado.web.HTTPError(404)
+        self.set_header("Content-Type", content_type or 'application/octet-stream')
+        if include_body:
+            self.write(data)
+
+    def compute_etag(self):
+        # None when served from a catalog or shards rather than a file
+        if getattr(self, 'absolute_path', None) is None:
+            return None
+        return super().compute_etag()
+
+
 class TubApi(tornado.web.RequestHandler):
 
     def initialize(self, data_path):
@@ -79,22 +113,11 @@ class TubApi(tornado.web.RequestHandler):
         return os.path.join(tub_path, "record_" + frame_id + ".json")
 
     def clips_of_tub(self, tub_path):
-        seqs = [ int(f.split("_")[0]) for f in os.listdir(tub_path) if f.endswith('.jpg') ]
-        seqs.sort()
-
-        entries = ((os.stat(self.image_path(tub_path, seq))[ST_ATIME], seq) for seq in seqs)
-
-        (last_ts, seq) = next(entries)
-        clips = [[seq]]
-        for next_ts, next_seq in entries:
-            #if next_ts - last_ts > 100:  #greater than 1s apart
-            #    clips.append([next_seq])
-            #else:
-            #    clips[-1].append(next_seq)
-            clips[-1].append(next_seq)
-            last_ts = next_ts
-
-        return clips
+        # the record numbers from the index of the tub, not a directory listing
+        tub = Tub(tub_path)
+        seqs = tub.get_index(shuffled=False)
+        tub.shutdown()
+        return [seqs]
 
     def get(self, tub_id):
         clips = self.clips_of_tub(os.path.join(self.data_path, tub_id))
@@ -111,6 +134,10 @@ class TubApi(tornado.web.RequestHandler):
         old_frames = list(itertools.chain(*old_clips))
         new_frames = list(itertools.chain(*new_clips['clips']))
         frames_to_delete = [str(item) for item in old_frames if item not in new_frames]
+        tub = Tub(tub_path)
         for frm in frames_to_delete:
-            os.remove(self.record_path(tub_path, frm))
-            os.remove(self.image_path(tub_path, frm))
+            # packed images stay in their shard, without a record
+            if os.path.exists(self.image_path(tub_path, frm)):
+                os.remove(self.image_path(tub_path, frm))
+            tub.remove_record(int(frm))
+        tub.shutdown()
@@ -5,56 +5,405 @@ Created on Sun Jun 25 11:07:48 2017
 
 @author: wroscoe
 """
+import re
+import threading
+import time
+from functools import partial
+from collections.abc import MutableMapping
+from operator import itemgetter
+
+import numpy as np
+
+
+# input names like 'distanceC[-2]' (one past value) or
+# 'cam/image_array[-3:]' (a window of the latest values)
+HISTORY_KEY = re.compile(r'^(?P<key>.+)\[-(?P<back>[1-9][0-9]*)(?P<window>:?)\]$')
+
+
+class History:
+    """
+    Fixed-depth ring buffer of the values written to a channel, with the
+    time.monotonic() timestamp and vehicle tick of each write.
+
+    Every value is written twice, depth entries apart, so the latest n
+    values are always one contiguous slice and window() returns a view
+    rather than a copy. A view is only valid until the channel is written
+    again. Until the buffer has filled, the first value stands in for the
+    missing older ones. None is not recorded.
+    """
+    def __init__(self, depth):
+        self.depth = depth
+        self.count = 0
+        self.values = None
+        self.times = np.zeros(2 * depth)
+        self.ticks = np.zeros(2 * depth, dtype=np.int64)
+
+    def __len__(self):
+        return min(self.count, self.depth)
+
+    def push(self, value, tick):
+        if value is None:
+            return
+        now = time.monotonic()
+        if self.values is None or not self._fits(value):
+            self._allocate(value)
+            self.times[:] = now
+            self.ticks[:] = tick
+        ix = self.count % self.depth
+        for i in (ix, ix + self.depth):
+            self.values[i] = value
+            self.times[i] = now
+            self.ticks[i] = tick
+        self.count += 1
+
+    def _fits(self, value):
+        if self.values.dtype == object:
+            return True
+        return np.shape(value) == self.values.shape[1:] \
+            and not isinstance(value, str)
+
+    def _allocate(self, value):
+        if isinstance(value, np.ndarray):
+            self.values = np.empty((2 * self.depth,) + value.shape,
+                                   dtype=value.dtype)
+            self.values[:] = value
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            self.values = np.full(2 * self.depth, value, dtype=np.float64)
+        else:
+            self.values = np.empty(2 * self.depth, dtype=object)
+            for i in range(2 * self.depth):
+                self.values[i] = value
+        self.count = 0
+
+    def _position(self, back):
+        # buffer index of the value written back writes ago, counting the
+        # latest one as 1
+        if not 0 < back <= self.depth:
+            raise IndexError('history of depth %d has no entry -%d'
+                             % (self.depth, back))
+        return (self.count - 1) % self.depth + self.depth + 1 - back
+
+    def __getitem__(self, k):
+        """ history[-1] is the latest value, history[-2] the one before """
+        if self.count == 0:
+            return None
+        return self.values[self._position(-k)]
+
+    def window(self, n):
+        """ the latest n values, oldest first, as a view of the buffer """
+        if self.count == 0:
+            return None
+        start = self._position(n)
+        return self.values[start:start + n]
+
+    def window_copy(self, n):
+        """ the latest n values, oldest first, as a copy """
+        window = self.window(n)
+        return None if window is None else window.copy()
+
+    def age(self, k=-1):
+        """ seconds since the value at k was written """
+        return time.monotonic() - self.times[self._position(-k)]
+
+    def tick(self, k=-1):
+        """ vehicle tick in which the value at k was written """
+        return int(self.ticks[self._position(-k)])
+
+
+class Handoff:
+    """
+    Latest value passed from the thread of a threaded part to the drive
+    loop, with a sequence number and the time.monotonic() capture time.
+
+    The writer publishes each value as one immutable (seq, stamp, value)
+    record, swapped in by a single reference assignment. This gives what a
+    triple buffer does in C: the writer never waits for the reader, and the
+    reader always sees a value together with its own sequence number and
+    stamp, never a mix of two writes.
+
+    The drive loop reads with take(), which also counts new, dropped (never
+    taken) and repeated values and records the age of the values taken. A
+    Vehicle reports these in the profiler for every Handoff attribute of a
+    part.
+    """
+    def __init__(self):
+        self.record = (0, None, None)
+        self.ready = threading.Condition()
+        self.taken_seq = 0
+        self.new = 0
+        self.dropped = 0
+        self.repeated = 0
+        self.on_take = None
+
+    def put(self, value, stamp=None):
+        seq = self.record[0] + 1
+        self.record = (seq, time.monotonic() if stamp is None else stamp,
+                       value)
+        with self.ready:
+            self.ready.notify_all()
+        return seq
+
+    @property
+    def seq(self):
+        return self.record[0]
+
+    def latest(self):
+        """ the latest value, None before the first put """
+        return self.record[2]
+
+    def newer_than(self, seq):
+        """ the latest (seq, stamp, value) record if newer than seq """
+        record = self.record
+        if record[0] > seq:
+            return record
+        return None
+
+    def age(self):
+        """ seconds since the latest value was captured """
+        stamp = self.record[1]
+        if stamp is None:
+            return None
+        return time.monotonic() - stamp
+
+    def wait_newer(self, seq, timeout=None):
+        """
+        Wait until there is a value newer than seq and return its record,
+        or None after timeout seconds.
+        """
+        with self.ready:
+            if self.ready.wait_for(lambda: self.record[0] > seq, timeout):
+                return self.record
+        return None
+
+    def take(self):
+        """
+        The latest value, as read by the drive loop, keeping count of the
+        values it missed or saw twice.
+        """
+        seq, stamp, value = self.record
+        if seq == 0:
+            return None
+        taken = self.taken_seq
+        if seq == taken:
+            self.repeated += 1
+        else:
+            self.new += 1
+            self.dropped += seq - taken - 1
+            self.taken_seq = seq
+        if self.on_take is not None:
+            self.on_take(self, time.monotonic() - stamp)
+        return value
+
+    @property
+    def drop_rate(self):
+        """ share of the values written that the drive loop never took """
+        total = self.new + self.dropped
+        return self.dropped / total if total else 0.0
+
 
 class Memory:
     """
     A convenience class to save key/value pairs.
+
+    Each channel name is given an integer slot the first time it is seen,
+    and values are kept in a list indexed by slot. The Vehicle resolves
+    channel names to slots once, when a part is added, and then reads and
+    writes them through the functions returned by getter() and setter().
+    d is a live dict-like view of the channels, writes to it go to memory.
+
+    Channels can also keep a History of their past values. Reading
+    'channel[-2]' gives the value before the latest one and 'channel[-3:]'
+    the latest three stacked into one array.
     """
     def __init__(self, *args, **kw):
-        self.d = {}
-    
+        self.slots = {}
+        self.objects = []
+        self.histories = {}
+        # incremented by the Vehicle on every drive loop
+        self.tick = 0
+
+    def slot(self, key):
+        """
+        Return the (store, index) location of a channel, giving it an
+        object slot if it has none yet.
+        """
+        ix = self.slots.get(key)
+        if ix is None:
+            ix = len(self.objects)
+            self.slots[key] = ix
+            self.objects.append(None)
+        return self.objects, ix
+
+    def history(self, key, depth):
+        """
+        Keep the last depth values written to a channel, and return its
+        History.
+        """
+        history = self.histories.get(key)
+        if history is None or history.depth < depth:
+            history = History(depth)
+            self.histories[key] = history
+        return history
+
+    def reader(self, key, copy=False):
+        """
+        Return a function that reads a single channel, or past values of
+        it for keys like 'channel[-2]' and 'channel[-3:]'. A window is a
+        view of the history, only valid until the channel is written again,
+        unless copy is set.
+        """
+        match = HISTORY_KEY.match(key)
+        if match:
+            back = int(match.group('back'))
+            history = self.history(match.group('key'), back)
+            if match.group('window'):
+                if copy:
+                    return partial(history.window_copy, back)
+                return partial(history.window, back)
+            return partial(history.__getitem__, -back)
+
+        store, ix = self.slot(key)
+        return partial(store.__getitem__, ix)
+
+    def getter(self, keys, copy=False):
+        """
+        Return a function that reads the given channels as a sequence,
+        using index tuples computed now. With copy set, history windows
+        are copied, for parts that use their inputs after the drive loop
+        moved on.
+        """
+        if not keys:
+            return tuple
+        if len(keys) > 1 and not any(HISTORY_KEY.match(key) for key in keys):
+            get = itemgetter(*[self.slot(key)[1] for key in keys])
+            return partial(get, self.objects)
+
+        readers = [self.reader(key, copy) for key in keys]
+        return lambda: [read() for read in readers]
+
+    def setter(self, keys):
+        """
+        Return a function that writes the output of a part to the given
+        channels, with the same rules as put().
+        """
+        set_values = self._setter(keys)
+        histories = [self.histories.get(key) for key in keys]
+        if all(history is None for history in histories):
+            return set_values
+
+        if len(keys) == 1:
+            history = histories[0]
+
+            def set_and_record(value):
+                set_values(value)
+                history.push(value, self.tick)
+        else:
+            def set_and_record(values):
+                set_values(values)
+                for history, value in zip(histories, values):
+                    if history is not None:
+                        history.push(value, self.tick)
+
+        return set_and_record
+
+    def _setter(self, keys):
+        objects = self.objects
+        ixs = [self.slot(key)[1] for key in keys]
+
+        if len(keys) == 1:
+            return partial(objects.__setitem__, ixs[0])
+
+        def set_many(values):
+            for ix, value in zip(ixs, values):
+                objects[ix] = value
+
+        return set_many
+
+    @property
+    def d(self):
+        return MemoryView(self)
+
     def __setitem__(self, key, value):
         if type(key) is not tuple:
             print('tuples')
             key = (key,)
             value=(value,)
-        
+
         for i, k in enumerate(key):
-            self.d[k] = value[i]
-        
+            self._write(k, value[i])
+
     def __getitem__(self, key):
         if type(key) is tuple:
-            return [self.d[k] for k in key]
+            return [self._read(k) for k in key]
         else:
-            return self.d[key]
-        
+            return self._read(key)
+
+    def _read(self, key):
+        if key not in self.slots and HISTORY_KEY.match(key):
+            return self.reader(key)()
+        return self.objects[self.slots[key]]
+
+    def _write(self, key, value):
+        store, ix = self.slot(key)
+        store[ix] = value
+        history = self.histories.get(key)
+        if history is not None:
+            history.push(value, self.tick)
+
     def update(self, new_d):
-        self.d.update(new_d)
-        
+        for key, value in new_d.items():
+            self._write(key, value)
+
     def put(self, keys, inputs):
         if len(keys) > 1:
             for i, key in enumerate(keys):
                 try:
-                    self.d[key] = inputs[i]
+                    value = inputs[i]
                 except IndexError as e:
                     error = str(e) + ' issue with keys: ' + str(key)
                     raise IndexError(error)
-        
+                self._write(key, value)
+
         else:
-            self.d[keys[0]] = inputs
+            self._write(keys[0], inputs)
 
-            
-            
     def get(self, keys):
-        result = [self.d.get(k) for k in keys]
+        result = [self._read(k) if k in self.slots
+                  or HISTORY_KEY.match(k) else None for k in keys]
         return result
-    
+
     def keys(self):
         return self.d.keys()
-    
+
     def values(self):
         return self.d.values()
-    
+
     def items(self):
-        return self.d.items()
-        
\ No newline at end of file
+        return [(k, self.objects[ix]) for k, ix in self.slots.items()]
+
+
+class MemoryView(MutableMapping):
+    """
+    The channels of a Memory as a dict. Reads and writes go to the memory,
+    so writes are seen by the parts and kept in the channel histories.
+    Channels keep their slot once given one and can not be deleted.
+    """
+    def __init__(self, mem):
+        self.mem = mem
+
+    def __getitem__(self, key):
+        if key not in self.mem.slots:
+            raise KeyError(key)
+        return self.mem._read(key)
+
+    def __setitem__(self, key, value):
+        self.mem._write(key, value)
+
+    def __delitem__(self, key):
+        raise TypeError('memory channels can not be deleted: %r' % key)
+
+    def __iter__(self):
+        return iter(list(self.mem.slots))
+
+    def __len__(self):
+        return len(self.mem.slots)
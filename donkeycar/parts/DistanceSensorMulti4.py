@@ -117,11 +117,14 @@ class DistanceSensorMulti4():
         print("In DistanceSensorMulti update")
         while self.running:
             #DMSlisten +=1
-            self.listenToDistanceSensor()
+            self.update_once()
             #self.listenToDistanceSensor(self.distanceLL, self.distanceL, self.distanceC, self.distanceR, self.distanceRR)
             #print ("Update LL: %.1f cm" % self.distanceLL +"L: %.1f cm" % self.distanceL +"  " "C: %.1f cm" % self.distanceC + "  " "R: %.1f cm" % self.distanceR + "  " "RR: %.1f cm" % self.distanceRR)
             #print ("UpdatePrev LL: %.1f cm" % self.prev_distanceLL +"L: %.1f cm" % self.prev_distanceL +"  " "C: %.1f cm" % self.prev_distanceC + "  " "R: %.1f cm" % self.prev_distanceR + "  " "RR: %.1f cm" % self.prev_distanceRR)
 
+    def update_once(self): #1回分の距離測定、VehicleからはDISTANCE_SENSOR_UPDATE_HZで呼ばれる
+        self.listenToDistanceSensor()
+
     def listenToDistanceSensor(self):    
     #def listenToDistanceSensor(self, distanceLL, distanceL, distanceC, distanceR, distanceRR):
         #前回測定値を保持
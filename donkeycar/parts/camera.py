@@ -3,18 +3,66 @@ import time
 import numpy as np
 from PIL import Image
 import glob
+from donkeycar import startup
+from donkeycar.memory import Handoff
 from donkeycar.utils import rgb2gray
 
 class BaseCamera:
 
+    def __init__(self):
+        self.frame = None
+        self.frames = Handoff()
+        self.frames_waited = 0
+        self.warm_until = None
+
+    def warm_up(self, seconds):
+        '''
+        let the sensor settle for seconds from now, dropping the frames
+        captured meanwhile, instead of sleeping through it while the other
+        parts could be set up
+        '''
+        self.warm_until = time.monotonic() + seconds
+
+    def wait_warm_up(self):
+        ''' sleep until the camera warmed up '''
+        if self.warm_until is not None:
+            time.sleep(max(0.0, self.warm_until - time.monotonic()))
+            self.warm_until = None
+
     def run_threaded(self):
-        return self.frame
+        frame = self.frames.take()
+        return self.frame if frame is None else frame
+
+    def put_frame(self, frame):
+        '''
+        publish a new frame, stamped with its capture time, and wake up a
+        drive loop waiting for it
+        '''
+        if self.warm_until is not None:
+            if time.monotonic() < self.warm_until:
+                return
+            self.warm_until = None
+        self.frame = frame
+        if self.frames.put(frame) == 1:
+            startup.profiler.milestone('first camera frame')
+
+    def wait_for_frame(self, timeout=None):
+        '''
+        wait until a frame arrives that was not waited for yet.
+        returns False if none arrived within timeout seconds.
+        '''
+        record = self.frames.wait_newer(self.frames_waited, timeout)
+        if record is None:
+            return False
+        self.frames_waited = record[0]
+        return True
 
 class PiCamera(BaseCamera):
     def __init__(self, image_w=160, image_h=120, image_d=3, framerate=20, vflip=False, hflip=False):
         from picamera.array import PiRGBArray
         from picamera import PiCamera
-        
+
+        super().__init__()
         resolution = (image_w, image_h)
         # initialize the camera and stream
         self.camera = PiCamera() #PiCamera gets resolution (height, width)
@@ -33,10 +81,11 @@ class PiCamera(BaseCamera):
         self.image_d = image_d
 
         print('PiCamera loaded.. .warming camera')
-        time.sleep(2)
+        self.warm_up(2)
 
 
     def run(self):
+        self.wait_warm_up()
         f = next(self.stream)
         frame = f.array
         self.rawCapture.truncate(0)
@@ -49,11 +98,12 @@ class PiCamera(BaseCamera):
         for f in self.stream:
             # grab the frame from the stream and clear the stream in
             # preparation for the next frame
-            self.frame = f.array
+            frame = f.array
             self.rawCapture.truncate(0)
 
             if self.image_d == 1:
-                self.frame = rgb2gray(self.frame)
+                frame = rgb2gray(frame)
+            self.put_frame(frame)
 
             # if the thread indicator variable is set, stop the thread
             if not self.on:
@@ -92,7 +142,7 @@ class Webcam(BaseCamera):
 
         print('WebcamVideoStream loaded.. .warming camera')
 
-        time.sleep(2)
+        self.warm_up(2)
 
     def update(self):
         from datetime import datetime, timedelta
@@ -105,9 +155,10 @@ class Webcam(BaseCamera):
                 # self.frame = list(pygame.image.tostring(snapshot, "RGB", False))
                 snapshot = self.cam.get_image()
                 snapshot1 = pygame.transform.scale(snapshot, self.resolution)
-                self.frame = pygame.surfarray.pixels3d(pygame.transform.rotate(pygame.transform.flip(snapshot1, True, False), 90))
+                frame = pygame.surfarray.pixels3d(pygame.transform.rotate(pygame.transform.flip(snapshot1, True, False), 90))
                 if self.image_d == 1:
-                    self.frame = rgb2gray(self.frame)
+                    frame = rgb2gray(frame)
+                self.put_frame(frame)
 
             stop = datetime.now()
             s = 1 / self.framerate - (stop - start).total_seconds()
@@ -116,9 +167,6 @@ class Webcam(BaseCamera):
 
         self.cam.stop()
 
-    def run_threaded(self):
-        return self.frame
-
     def shutdown(self):
         # indicate that the thread should be stopped
         self.on = False
@@ -143,6 +191,7 @@ class CSICamera(BaseCamera):
         gstreamer_flip = 2 - flip vertically
         gstreamer_flip = 3 - rotate CW 90
         '''
+        super().__init__()
         self.w = image_w
         self.h = image_h
         self.running = True
@@ -178,15 +227,12 @@ class CSICamera(BaseCamera):
     def poll_camera(self):
         import cv2
         self.ret , frame = self.camera.read()
-        self.frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        self.put_frame(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
 
     def run(self):
         self.poll_camera()
         return self.frame
 
-    def run_threaded(self):
-        return self.frame
-    
     def shutdown(self):
         self.running = False
         print('stoping CSICamera')
@@ -203,6 +249,7 @@ class V4LCamera(BaseCamera):
     '''
     def __init__(self, image_w=160, image_h=120, image_d=3, framerate=20, dev_fn="/dev/video0", fourcc='MJPG'):
 
+        super().__init__()
         self.running = True
         self.frame = None
         self.image_w = image_w
@@ -245,7 +292,7 @@ class V4LCamera(BaseCamera):
             # Wait for the device to fill the buffer.
             select.select((self.video,), (), ())
             image_data = self.video.read_and_queue()
-            self.frame = jpg_conv.run(image_data)
+            self.put_frame(jpg_conv.run(image_data))
 
 
     def shutdown(self):
@@ -256,13 +303,20 @@ class V4LCamera(BaseCamera):
 
 class MockCamera(BaseCamera):
     '''
-    Fake camera. Returns only a single static frame
+    Fake camera. Returns only a single static frame. When threaded it
+    is published again at the update_hz it is added with; add it with
+    update_hz=cam.framerate to stand in for a real camera.
     '''
-    def __init__(self, image_w=160, image_h=120, image_d=3, image=None):
+    def __init__(self, image_w=160, image_h=120, image_d=3, image=None, framerate=20):
+        super().__init__()
         if image is not None:
             self.frame = image
         else:
             self.frame = np.array(Image.new('RGB', (image_w, image_h)))
+        self.framerate = framerate
+
+    def update_once(self):
+        self.put_frame(self.frame)
 
     def update(self):
         pass
@@ -275,6 +329,7 @@ class ImageListCamera(BaseCamera):
     Use the images from a tub as a fake camera output
     '''
     def __init__(self, path_mask='~/mycar/data/**/*.jpg'):
+        super().__init__()
         self.image_filenames = glob.glob(os.path.expanduser(path_mask), recursive=True)
     
         def get_image_index(fnm):
@@ -0,0 +1,490 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Append-only catalog of the records of a tub.
+
+A tub used to keep each record in a record_<ix>.json file of its own, so a
+day of driving leaves hundreds of thousands of small files, which makes
+listing, copying and loading the tub slow. A catalog appends the records
+as lines of JSON to a few chunk files instead:
+
+    catalog_0.catalog         {"_index": 1, "user/angle": 0.1, ...}
+                              {"_index": 2, "user/angle": 0.2, ...}
+    catalog_0.catalog_index   (1, 0), (2, 58), ...
+    catalog_1.catalog         once catalog_0 holds chunk_records lines
+    ...
+
+Next to each chunk, its index holds the record number and byte offset of
+every line as two little-endian int64, so opening a catalog reads the small
+index files only and a record is read with one seek. Nothing is ever
+rewritten: deleting a record appends a line marking it deleted, indexed
+with -1 - its offset, and writing the record again later brings it back.
+
+Lines and index entries are flushed to the operating system every
+flush_every records. The fsync policy decides when they are forced to the
+disk: on every flush, when a chunk is full and on close, or never. After a
+crash, the lines written past the last index entry are indexed again when
+the catalog is opened, and a partly written last line is skipped. Only a
+catalog appended to repairs its files, so reading a tub still being
+written changes nothing.
+
+A catalog can be appended to and read from several threads, like the
+workers of a TubWriter writing in the background.
+
+Tubs that keep a file per record have a RecordIndex of their record
+numbers instead, so they are not listed every time they are opened.
+"""
+import glob
+import json
+import os
+import struct
+import threading
+import zlib
+
+import numpy as np
+
+INDEX_ENTRY = struct.Struct('<qq')
+
+
+def line_offset(offset):
+    """ the offset of a line from its index entry, deleted or not """
+    return offset if offset >= 0 else -1 - offset
+
+
+def chunk_number(path):
+    name = os.path.basename(path)
+    return int(name.split('.')[0].split('_')[1])
+
+
+class Catalog:
+    """
+    The records of the tub at path, by record number.
+
+    Parameters
+    ----------
+        path : str
+            Directory of the tub.
+        chunk_records : int
+            Lines per chunk file before the next one is started.
+        flush_every : int
+            Flush the chunk and its index to the operating system every
+            flush_every appended records.
+        fsync : str
+            When to force the flushed data to the disk: 'flush' on every
+            flush, 'chunk' when a chunk is full and on close, 'never'
+            leaves it to the operating system.
+    """
+    FSYNC_POLICIES = ('flush', 'chunk', 'never')
+
+    def __init__(self, path, chunk_records=1000, flush_every=1,
+                 fsync='chunk'):
+        assert fsync in self.FSYNC_POLICIES, \
+            "fsync is not one of %r: %r" % (self.FSYNC_POLICIES, fsync)
+        assert chunk_records > 0, \
+            "chunk_records is not positive: %r" % chunk_records
+        self.path = path
+        self.chunk_records = chunk_records
+        self.flush_every = max(1, int(flush_every))
+        self.fsync = fsync
+        self.offsets = {}
+        self.chunk_sizes = {}
+        self.readers = {}
+        self.writer = None
+        self.index_writer = None
+        self.chunk = None
+        self.unflushed = 0
+        self.repair = None
+        self.lock = threading.RLock()
+        self.load()
+
+    @staticmethod
+    def exists(path):
+        return bool(glob.glob(os.path.join(path, 'catalog_*.catalog')))
+
+    def chunk_path(self, chunk):
+        return os.path.join(self.path, 'catalog_%d.catalog' % chunk)
+
+    def index_path(self, chunk):
+        return self.chunk_path(chunk) + '_index'
+
+    def chunks(self):
+        paths = glob.glob(os.path.join(self.path, 'catalog_*.catalog'))
+        return sorted(chunk_number(p) for p in paths)
+
+    def load(self):
+        chunks = self.chunks()
+        for chunk in chunks:
+            entries = self.read_index(chunk)
+            if chunk == chunks[-1]:
+                entries = self.recover(chunk, entries)
+            for ix, offset in entries:
+                if offset < 0:
+                    self.offsets.pop(ix, None)
+                else:
+                    self.offsets[ix] = (chunk, offset)
+            self.chunk_sizes[chunk] = len(entries)
+        self.loaded_stamp = self.stamp()
+
+    def read_index(self, chunk):
+        try:
+            data = np.fromfile(self.index_path(chunk), dtype='<i8')
+        except (FileNotFoundError, ValueError):
+            return []
+        # drop a partly written last entry
+        data = data[:len(data) // 2 * 2].reshape(-1, 2)
+        return [(int(ix), int(offset)) for ix, offset in data]
+
+    def recover(self, chunk, entries):
+        '''
+        add the complete lines of the last chunk written after its last
+        index entry to its entries. What to repair before appending to the
+        chunk is kept in self.repair.
+        '''
+        path = self.chunk_path(chunk)
+        size = os.path.getsize(path)
+        entries = [(ix, offset) for ix, offset in entries
+                   if line_offset(offset) < size]
+        recovered = []
+        with open(path, 'rb') as f:
+            if entries:
+                # skip to the end of the last indexed line
+                f.seek(line_offset(entries[-1][1]))
+                if not f.readline().endswith(b'\n'):
+                    f.seek(line_offset(entries.pop()[1]))
+            end = f.tell()
+            for line in iter(f.readline, b''):
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    record = json.loads(line.decode('utf-8'))
+                    ix = record['_index']
+                except (ValueError, KeyError):
+                    break
+                recovered.append(
+                    (ix, -1 - end if record.get('_deleted') else end))
+                end = f.tell()
+        self.repair = (chunk, end, entries + recovered)
+        return entries + recovered
+
+    def repair_chunk(self):
+        '''
+        cut off a partly written last line of the last chunk and rewrite
+        its index to match its lines
+        '''
+        chunk, end, entries = self.repair
+        self.repair = None
+        path = self.chunk_path(chunk)
+        if os.path.getsize(path) > end:
+            print('Catalog: cutting off {} bytes of a partly written record '
+                  'in {}'.format(os.path.getsize(path) - end, path))
+            with open(path, 'r+b') as f:
+                f.truncate(end)
+        index_path = self.index_path(chunk)
+        index = b''.join(INDEX_ENTRY.pack(ix, offset)
+                         for ix, offset in entries)
+        if not os.path.exists(index_path) or \
+                os.path.getsize(index_path) != len(index):
+            with open(index_path, 'wb') as f:
+                f.write(index)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __contains__(self, ix):
+        return ix in self.offsets
+
+    def indexes(self):
+        """ the record numbers in the catalog, in ascending order """
+        with self.lock:
+            return sorted(self.offsets)
+
+    def version(self):
+        """ the lines written, more with every record appended or deleted """
+        with self.lock:
+            return sum(self.chunk_sizes.values())
+
+    def stamp(self):
+        """
+        size and mtime of the index of the last chunk, and of the next one
+        if it was started, which change with every record appended or
+        deleted, by this catalog or another one of the same tub
+        """
+        chunk = max(self.chunk_sizes) if self.chunk_sizes else -1
+        stamp = []
+        for index_path in (self.index_path(chunk), self.index_path(chunk + 1)):
+            try:
+                st = os.stat(index_path)
+            except FileNotFoundError:
+                stamp.append(None)
+                continue
+            stamp.append((st.st_size, st.st_mtime_ns))
+        return tuple(stamp)
+
+    def current(self):
+        """
+        whether a catalog only read from still has all the records of the
+        tub, none being appended or deleted since it was opened
+        """
+        return self.stamp() == self.loaded_stamp
+
+    def read(self, ix):
+        """ the record ix as a dict, KeyError when there is none """
+        with self.lock:
+            chunk, offset = self.offsets[ix]
+            if chunk == self.chunk and self.unflushed:
+                self.flush()
+            f = self.readers.get(chunk)
+            if f is None:
+                f = self.readers[chunk] = open(self.chunk_path(chunk), 'rb')
+            f.seek(offset)
+            line = f.readline()
+        record = json.loads(line.decode('utf-8'))
+        del record['_index']
+        return record
+
+    def append(self, ix, record):
+        """ write record as record number ix """
+        line = json.dumps(dict(record, _index=ix))
+        self.write_line(ix, line)
+
+    def delete(self, ix):
+        """ mark record ix as deleted """
+        with self.lock:
+            if ix not in self.offsets:
+                return
+            self.write_line(ix, json.dumps({'_index': ix, '_deleted': True}),
+                            deleted=True)
+
+    def write_line(self, ix, line, deleted=False):
+        data = line.encode('utf-8') + b'\n'
+        with self.lock:
+            if self.writer is None or \
+                    self.chunk_sizes[self.chunk] >= self.chunk_records:
+                self.next_chunk()
+            offset = self.writer.tell()
+            self.writer.write(data)
+            self.index_writer.write(
+                INDEX_ENTRY.pack(ix, -1 - offset if deleted else offset))
+            self.chunk_sizes[self.chunk] += 1
+            if deleted:
+                self.offsets.pop(ix, None)
+            else:
+                self.offsets[ix] = (self.chunk, offset)
+            self.unflushed += 1
+            if self.unflushed >= self.flush_every:
+                self.flush()
+
+    def next_chunk(self):
+        '''
+        open the last chunk for appending, or a new one when it is full
+        '''
+        chunks = self.chunks()
+        if self.writer is not None:
+            self.close_writer(self.fsync != 'never')
+        if self.repair is not None:
+            self.repair_chunk()
+        if chunks and self.chunk_sizes.get(chunks[-1], 0) < self.chunk_records:
+            chunk = chunks[-1]
+        else:
+            chunk = chunks[-1] + 1 if chunks else 0
+        self.chunk = chunk
+        self.chunk_sizes.setdefault(chunk, 0)
+        self.writer = open(self.chunk_path(chunk), 'ab')
+        self.index_writer = open(self.index_path(chunk), 'ab')
+
+    def flush(self):
+        with self.lock:
+            if self.writer is None:
+                return
+            self.writer.flush()
+            self.index_writer.flush()
+            if self.fsync == 'flush':
+                os.fsync(self.writer.fileno())
+                os.fsync(self.index_writer.fileno())
+            self.unflushed = 0
+
+    def close_writer(self, sync):
+        self.flush()
+        if sync:
+            os.fsync(self.writer.fileno())
+            os.fsync(self.index_writer.fileno())
+        self.writer.close()
+        self.index_writer.close()
+        self.writer = None
+        self.index_writer = None
+        self.chunk = None
+
+    def close(self):
+        """ flush and close the files, fsync them unless fsync is 'never' """
+        with self.lock:
+            if self.writer is not None:
+                self.close_writer(self.fsync != 'never')
+            for f in self.readers.values():
+                f.close()
+            self.readers = {}
+
+
+class RecordIndex:
+    """
+    Persistent index of the record numbers of a tub keeping a
+    record_<ix>.json file per record, so opening and counting the tub does
+    not list its directory.
+
+    The index file holds an entry, in the layout of a catalog index, each
+    time a record is written, with offset 0, or removed, with offset -1.
+    Every entry is flushed as it is written, so the index is at least as
+    new as the files it lists. The index is checked against the record
+    files at its end when opened: the last record it lists has to have its
+    file, and the next record numbers none. Otherwise, because records were
+    written or erased without it, like by an older donkeycar, or the
+    process died in between, or when the index is missing or cut short,
+    the record files are listed again by scan. The index is rewritten only
+    with the next record written or removed, so opening a tub to read it
+    never writes to it, and on a read only disk it is kept in memory.
+    Files that are no records, like images, the column sidecar or shards,
+    leave the index alone. A record file deleted from the middle of the
+    tub by other means is dropped from the index when it is found missing.
+
+    Parameters
+    ----------
+        path : str
+            Directory of the tub.
+        scan : function
+            Returns the record numbers of the record files in path.
+        record_path : function
+            Returns the path of the file of a record number.
+    """
+    NAME = 'json_records.index'
+    # a reopened tub numbers its first record two past the last one
+    LOOK_AHEAD = 2
+
+    def __init__(self, path, scan, record_path):
+        self.path = path
+        self.index_path = os.path.join(path, self.NAME)
+        self.scan = scan
+        self.record_path = record_path
+        self.ixs = set()
+        self.entries = 0
+        self.writer = None
+        self.lock = threading.RLock()
+        self.rebuilt = False
+        # whether the index file lists the records in ixs
+        self.saved = True
+        self.read_only = False
+        self.load()
+
+    def stale(self):
+        """
+        whether the record files at the end of the index differ from it
+        """
+        # an empty tub numbers its first record 0
+        last = max(self.ixs) if self.ixs else -1
+        if last >= 0 and not os.path.exists(self.record_path(last)):
+            return True
+        return any(os.path.exists(self.record_path(last + i))
+                   for i in range(1, self.LOOK_AHEAD + 1))
+
+    def load(self):
+        try:
+            data = np.fromfile(self.index_path, dtype='<i8')
+        except (FileNotFoundError, ValueError):
+            data = None
+        if data is not None and len(data) % 2 == 0:
+            entries = data.reshape(-1, 2)
+            self.entries = len(entries)
+            if (entries[:, 1] == 0).all():
+                self.ixs = set(entries[:, 0].tolist())
+            else:
+                for ix, offset in entries.tolist():
+                    if offset < 0:
+                        self.ixs.discard(ix)
+                    else:
+                        self.ixs.add(ix)
+            if not self.stale():
+                return
+        self.rebuild()
+
+    def rebuild(self):
+        """ list the record files again, to save with the next entry """
+        self.ixs = set(self.scan())
+        self.entries = len(self.ixs)
+        self.rebuilt = True
+        self.saved = False
+
+    def save(self):
+        """
+        rewrite the index file with the records in the index. Returns
+        whether it could.
+        """
+        with self.lock:
+            self.close()
+            index = b''.join(INDEX_ENTRY.pack(ix, 0)
+                             for ix in sorted(self.ixs))
+            tmp_path = self.index_path + '.tmp'
+            try:
+                with open(tmp_path, 'wb') as f:
+                    f.write(index)
+                os.replace(tmp_path, self.index_path)
+            except OSError as e:
+                self.not_writable(e)
+                return False
+            self.entries = len(self.ixs)
+            self.saved = True
+            return True
+
+    def not_writable(self, error):
+        # a tub on a read only disk is listed every time it is opened
+        print('RecordIndex: could not write {}: {}'.format(
+            self.index_path, error))
+        self.read_only = True
+
+    def __len__(self):
+        return len(self.ixs)
+
+    def __contains__(self, ix):
+        return ix in self.ixs
+
+    def indexes(self):
+        """ the record numbers in the index, in ascending order """
+        with self.lock:
+            return sorted(self.ixs)
+
+    def version(self):
+        """
+        changes with every record written, written again or removed, and
+        when the index is rebuilt with other records
+        """
+        with self.lock:
+            ixs = np.array(sorted(self.ixs), dtype='<i8')
+            return '%d-%08x' % (self.entries, zlib.crc32(ixs.tobytes()))
+
+    def add(self, ix):
+        """ index record ix, once its file is written """
+        with self.lock:
+            # an entry for a record written again too, to change version()
+            self.write_entry(ix, 0)
+            self.ixs.add(ix)
+
+    def remove(self, ix):
+        """ drop record ix from the index, once its file is deleted """
+        with self.lock:
+            if ix in self.ixs:
+                self.write_entry(ix, -1)
+                self.ixs.discard(ix)
+
+    def write_entry(self, ix, offset):
+        if not self.read_only and (self.saved or self.save()):
+            try:
+                if self.writer is None:
+                    self.writer = open(self.index_path, 'ab')
+                self.writer.write(INDEX_ENTRY.pack(ix, offset))
+                self.writer.flush()
+            except OSError as e:
+                self.not_writable(e)
+        self.entries += 1
+
+    def close(self):
+        with self.lock:
+            if self.writer is not None:
+                self.writer.close()
+                self.writer = None
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Column sidecar of the records of a tub.
+
+Reading the angles and throttles of a tub for training or a histogram
+means parsing every record, hundreds of thousands of small JSON objects.
+The sidecar keeps each channel of the records in a .npy file of its own
+next to the records instead:
+
+    columns.json                   the channels, their record count and
+                                   the version of the records they hold
+    columns__index.npy             the record numbers
+    columns_user-angle.npy         float64, one value per record
+    columns_user-mode.npy          unicode strings
+    columns_cam-image_array.npy    the names of the image files
+    columns_location-one_hot_state_array.npy   a row per record
+
+Loading the sidecar memory maps the files, so a channel is read from the
+disk only as far as it is used. Channels of numbers, with NaN where a
+record has none, of strings or of vectors of one length go in the sidecar.
+Other channels are listed as skipped, and the records are read to get
+them.
+
+The sidecar holds the version of the records it was written from, a
+number changing whenever the tub writes a record, new or again, or
+removes one, and is only used as long as the tub has that version.
+Records edited by other means than the tub leave the version alone.
+"""
+import json
+import os
+
+import numpy as np
+
+META_NAME = 'columns.json'
+INDEX_KEY = '_index'
+
+
+def column_path(path, key):
+    return os.path.join(path, 'columns_%s.npy' % key.replace('/', '-'))
+
+
+def to_column(values):
+    """ the values of a channel as an array, None when they do not fit one """
+    if all(isinstance(v, str) for v in values):
+        return np.array(values, dtype=str)
+    if all(v is None or isinstance(v, (bool, int, float)) for v in values):
+        if any(v is None for v in values):
+            return np.array([np.nan if v is None else v for v in values],
+                            dtype=np.float64)
+        column = np.array(values)
+        # ints too large for int64 become objects
+        return column if column.dtype.kind in 'biuf' else None
+    if all(isinstance(v, list) for v in values):
+        try:
+            column = np.array(values)
+        except ValueError:
+            # vectors of different lengths
+            return None
+        if column.ndim == 2 and column.dtype.kind in 'biuf':
+            return column
+    return None
+
+
+def write_columns(path, version, ixs, records):
+    """
+    Write the sidecar of the tub at path from records, the dicts of the
+    record numbers ixs of the tub at version. Returns the channels written.
+    """
+    meta_path = os.path.join(path, META_NAME)
+    # readers find no sidecar rather than half of one
+    if os.path.exists(meta_path):
+        os.unlink(meta_path)
+    keys = list(dict.fromkeys(k for record in records for k in record))
+    columns = {INDEX_KEY: np.array(ixs, dtype=np.int64)}
+    skipped = []
+    for key in keys:
+        column = to_column([record.get(key) for record in records])
+        if column is None:
+            skipped.append(key)
+        else:
+            columns[key] = column
+    for key, column in columns.items():
+        np.save(column_path(path, key), column)
+    meta = {'version': version, 'count': len(ixs),
+            'columns': [k for k in keys if k in columns], 'skipped': skipped}
+    tmp_path = meta_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, meta_path)
+    return meta['columns']
+
+
+def load_columns(path, version):
+    """
+    The sidecar of the tub at path, when it holds the records of version,
+    as (record numbers, {channel: column}, skipped channels) with memory
+    mapped columns, None otherwise.
+    """
+    try:
+        with open(os.path.join(path, META_NAME), 'r') as f:
+            meta = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    if version is None or meta.get('version') != version:
+        return None
+    # an empty file can not be mapped
+    mmap_mode = 'r' if meta['count'] else None
+    try:
+        ixs = np.load(column_path(path, INDEX_KEY), mmap_mode=mmap_mode)
+        columns = {key: np.load(column_path(path, key), mmap_mode=mmap_mode)
+                   for key in meta['columns']}
+    except (FileNotFoundError, ValueError):
+        return None
+    return ixs, columns, meta['skipped']
+
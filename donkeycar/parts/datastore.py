@@ -12,12 +12,16 @@ import json
 import datetime
 import random
 import glob
+import threading
+from collections import deque
 import numpy as np
-import pandas as pd
 
 from PIL import Image
 
 from donkeycar.parts.augment import augment_pil_image
+from donkeycar.parts.catalog import Catalog, RecordIndex
+from donkeycar.parts.columns import load_columns, write_columns
+from donkeycar.parts.shards import open_image, pack_images, unpack_images
 from donkeycar.utils import arr_to_img
 
 
@@ -35,15 +39,36 @@ class Tub(object):
     >>> types = ['float', 'image']
     >>> t=Tub(path=path, inputs=inputs, types=types)
 
+    New tubs append their records to a catalog, see
+    donkeycar.parts.catalog, unless tub_format is 'json', which writes a
+    record_<ix>.json file per record like older tubs, with a RecordIndex
+    of the record numbers. Tubs of either format are read the same way.
+    chunk_records, flush_every and fsync are passed to the catalog.
+
+    The channels of the records can be kept in a column sidecar too, see
+    donkeycar.parts.columns, which get_df loads without reading the
+    records, as long as no record was written or removed since. The image
+    files can be packed into shards, see donkeycar.parts.shards, and are
+    read from them all the same.
+
+    The start time of a new tub and the timestamps of its records are taken
+    from clock, time.time by default, like the clock of a replay.
     """
 
-    def __init__(self, path, inputs=None, types=None, user_meta=[]):
+    def __init__(self, path, inputs=None, types=None, user_meta=[],
+                 tub_format='catalog', chunk_records=1000, flush_every=1,
+                 fsync='chunk', clock=None):
 
         self.path = os.path.expanduser(path)
+        self.clock = clock or time.time
         #print('path_in_tub:', self.path)
         self.meta_path = os.path.join(self.path, 'meta.json')
         self.exclude_path = os.path.join(self.path, "exclude.json")
         self.df = None
+        self.catalog = None
+        self.record_index = None
+        catalog_options = dict(chunk_records=chunk_records,
+                               flush_every=flush_every, fsync=fsync)
 
         exists = os.path.exists(self.path)
 
@@ -63,6 +88,15 @@ class Tub(object):
             except FileNotFoundError:
                 self.exclude = set()
 
+            if self.meta.get('format') == 'catalog':
+                catalog_options['chunk_records'] = \
+                    self.meta.get('chunk_records', chunk_records)
+                self.catalog = Catalog(self.path, **catalog_options)
+            else:
+                self.record_index = RecordIndex(self.path,
+                                                self.scan_record_files,
+                                                self.get_json_record_path)
+
             try:
                 self.current_ix = self.get_last_ix() + 1
             except ValueError:
@@ -71,15 +105,24 @@ class Tub(object):
             if 'start' in self.meta:
                 self.start_time = self.meta['start']
             else:
-                self.start_time = time.time()
+                self.start_time = self.clock()
                 self.meta['start'] = self.start_time
 
         elif not exists and inputs:
             print('Tub does NOT exist. Creating new tub...')
-            self.start_time = time.time()
+            self.start_time = self.clock()
             #create log and save meta
             os.makedirs(self.path)
             self.meta = {'inputs': inputs, 'types': types, 'start': self.start_time}
+            if tub_format == 'catalog':
+                self.meta['format'] = 'catalog'
+                self.meta['chunk_records'] = chunk_records
+                self.catalog = Catalog(self.path, **catalog_options)
+            else:
+                self.record_index = RecordIndex(self.path,
+                                                self.scan_record_files,
+                                                self.get_json_record_path)
+                self.record_index.save()
             for kv in user_meta:
                 kvs = kv.split(":")
                 if len(kvs) == 2:
@@ -97,19 +140,83 @@ class Tub(object):
             raise AttributeError(msg)
 
     def get_last_ix(self):
-        index = self.get_index()           
+        index = self.get_index(shuffled=False)
         return max(index)
 
     def update_df(self):
-        df = pd.DataFrame([self.get_json_record(i) for i in self.get_index(shuffled=False)])
+        # pandas is only needed for training, not to record on the car
+        import pandas as pd
+        loaded = self.get_columns()
+        if loaded is not None and not loaded[2]:
+            self.df = self.columns_df(loaded[1])
+            return
+        version = self.columns_version()
+        ixs = self.get_index(shuffled=False)
+        records = [self.load_json_data(i) for i in ixs]
+        if loaded is None:
+            self.save_columns(ixs, records, version)
+        df = pd.DataFrame([self.make_record_paths_absolute(r) for r in records])
         self.df = df
 
+    def columns_version(self):
+        """ changes whenever the tub writes, rewrites or removes a record """
+        if self.catalog is not None:
+            return self.catalog.version()
+        return self.record_index.version()
+
+    def get_columns(self):
+        """
+        The column sidecar of the tub as (record numbers, {channel: column},
+        skipped channels), None when there is none up to date.
+        """
+        return load_columns(self.path, self.columns_version())
+
+    def save_columns(self, ixs=None, records=None, version=None):
+        """
+        Write the column sidecar of the tub from records, the records of
+        ixs as saved at version, or from all the records of the tub.
+        """
+        if records is None:
+            version = self.columns_version()
+            ixs = self.get_index(shuffled=False)
+            records = [self.load_json_data(ix) for ix in ixs]
+        try:
+            write_columns(self.path, version, ixs, records)
+        except OSError as e:
+            print('Tub: could not write the columns of {}: {}'.format(self.path, e))
+
+    def columns_df(self, columns):
+        import pandas as pd
+        data = {}
+        for key, column in columns.items():
+            if column.ndim == 2:
+                data[key] = column.tolist()
+            elif column.dtype.kind == 'U':
+                # as make_record_paths_absolute
+                data[key] = [os.path.join(self.path, v) if '.' in v else v
+                             for v in column.tolist()]
+            else:
+                data[key] = column
+        return pd.DataFrame(data)
+
     def get_df(self):
         if self.df is None:
             self.update_df()
         return self.df
 
     def get_index(self, shuffled=True):
+        if self.catalog is not None:
+            nums = self.catalog.indexes()
+        elif self.record_index is not None:
+            nums = self.record_index.indexes()
+        else:
+            nums = self.scan_record_files()
+        if shuffled:
+            random.shuffle(nums)
+        return nums
+
+    def scan_record_files(self):
+        """ the record numbers of the record files, in ascending order """
         files = next(os.walk(self.path))[2]
         record_files = [f for f in files if f[:6] == 'record']
 
@@ -122,13 +229,7 @@ class Tub(object):
             return num
 
         nums = [get_file_ix(f) for f in record_files]
-        
-        if shuffled:
-            random.shuffle(nums)
-        else:
-            nums = sorted(nums)
-            
-        return nums 
+        return sorted(nums)
 
     @property
     def inputs(self):
@@ -142,11 +243,19 @@ class Tub(object):
         input_types = dict(zip(self.inputs, self.types))
         return input_types.get(key)
 
-    def write_json_record(self, json_data):
-        path = self.get_json_record_path(self.current_ix)
+    def write_json_record(self, json_data, ix=None):
+        if ix is None:
+            ix = self.current_ix
+        path = self.get_json_record_path(ix)
         try:
-            with open(path, 'w') as fp:
-                json.dump(json_data, fp)
+            if self.catalog is not None:
+                self.catalog.append(ix, json_data)
+                return
+            # indexed one at a time, so the index stays newer than the files
+            with self.record_index.lock:
+                with open(path, 'w') as fp:
+                    json.dump(json_data, fp)
+                self.record_index.add(ix)
 
         except TypeError:
             print('troubles with record:', json_data)
@@ -157,9 +266,9 @@ class Tub(object):
             raise
 
     def get_num_records(self):
-        import glob
-        files = glob.glob(os.path.join(self.path, 'record_*.json'))
-        return len(files)
+        if self.catalog is not None:
+            return len(self.catalog)
+        return len(self.record_index)
 
     def make_record_paths_absolute(self, record_dict):
         # make paths absolute
@@ -197,8 +306,14 @@ class Tub(object):
         '''
         remove data associate with a record
         '''
+        if self.catalog is not None:
+            self.catalog.delete(ix)
+            return
         record = self.get_json_record_path(ix)
-        os.unlink(record)
+        with self.record_index.lock:
+            if os.path.exists(record):
+                os.unlink(record)
+            self.record_index.remove(ix)
 
     def put_record(self, data):
         """
@@ -206,9 +321,18 @@ class Tub(object):
         return a record with references to the saved values that can
         be saved in a csv.
         """
-        json_data = {}
         self.current_ix += 1
-        
+        milliseconds = int(round((self.clock() - self.start_time) * 1000))
+        self.write_record(self.current_ix, data, milliseconds)
+        return self.current_ix
+
+    def write_record(self, ix, data, milliseconds):
+        """
+        Encode and save the values of record ix, taken milliseconds after
+        the start of the tub.
+        """
+        json_data = {}
+
         for key, val in data.items():
             typ = self.get_input_type(key)
 
@@ -226,14 +350,14 @@ class Tub(object):
 
             elif typ == 'image_array':
                 img = Image.fromarray(np.uint8(val))
-                name = self.make_file_name(key, ext='.jpg')
+                name = self.make_file_name(key, ext='.jpg', ix=ix)
                 img.save(os.path.join(self.path, name))
                 json_data[key]=name
 
             elif typ == 'gray16_array':
                 # save np.uint16 as a 16bit png
                 img = Image.fromarray(np.uint16(val))
-                name = self.make_file_name(key, ext='.png')
+                name = self.make_file_name(key, ext='.png', ix=ix)
                 img.save(os.path.join(self.path, name))
                 json_data[key]=name
 
@@ -241,10 +365,9 @@ class Tub(object):
                 msg = 'Tub does not know what to do with this type {}'.format(typ)
                 raise TypeError(msg)
 
-        json_data['milliseconds'] = int((time.time() - self.start_time) * 1000)
+        json_data['milliseconds'] = milliseconds
 
-        self.write_json_record(json_data)
-        return self.current_ix
+        self.write_json_record(json_data, ix)
 
     def erase_last_n_records(self, num_erase):
         """
@@ -263,31 +386,56 @@ class Tub(object):
 
     def erase_record(self, i):
         json_path = self.get_json_record_path(i)
-        if os.path.exists(json_path):
-            os.unlink(json_path)
         img_filename = '%d_cam-image_array_.jpg' % i
         img_path = os.path.join(self.path, img_filename)
         if os.path.exists(img_path):
             os.unlink(img_path)
+        if self.catalog is not None:
+            self.catalog.delete(i)
+        elif os.path.exists(json_path):
+            with self.record_index.lock:
+                os.unlink(json_path)
+                self.record_index.remove(i)
 
     def get_json_record_path(self, ix):
+        """
+        Path of the record file of record ix. The records of a catalog tub
+        have no file of their own, load_json_record() reads them by this
+        path all the same.
+        """
         return os.path.join(self.path, 'record_' + str(ix) + '.json')
 
     def get_json_record(self, ix):
+        json_data = self.load_json_data(ix)
+        record_dict = self.make_record_paths_absolute(json_data)
+        return record_dict
+
+    def load_json_data(self, ix):
+        """ record ix as saved, with paths relative to the tub """
         path = self.get_json_record_path(ix)
         try:
-            with open(path, 'r') as fp:
-                json_data = json.load(fp)
+            if self.catalog is not None:
+                json_data = self.catalog.read(ix)
+            else:
+                with open(path, 'r') as fp:
+                    json_data = json.load(fp)
         except UnicodeDecodeError:
             raise Exception('bad record: %d. You may want to run `python manage.py check --fix`' % ix)
         except FileNotFoundError:
+            if self.record_index is not None:
+                # deleted by other means than the tub
+                try:
+                    self.record_index.remove(ix)
+                except OSError:
+                    pass
             raise
+        except KeyError:
+            # not in the catalog
+            raise FileNotFoundError(path)
         except:
             print("Unexpected error:", sys.exc_info()[0])
             raise
-
-        record_dict = self.make_record_paths_absolute(json_data)
-        return record_dict
+        return json_data
 
     def get_record(self, ix):
         json_data = self.get_json_record(ix)
@@ -300,18 +448,17 @@ class Tub(object):
             typ = self.get_input_type(key)
             # load objects that were saved as separate files
             if typ == 'image_array':
-                img = Image.open((val))
+                img = open_image(val)
                 val = np.array(img)
             data[key] = val
         return data
 
     def gather_records(self):
-        ri = lambda fnm: int(os.path.basename(fnm).split('_')[1].split('.')[0])
-        record_paths = glob.glob(os.path.join(self.path, 'record_*.json'))
-        if len(self.exclude) > 0:
-            record_paths = [f for f in record_paths if ri(f) not in self.exclude]
-        record_paths.sort(key=ri)
-        return record_paths
+        # load_json_record() trusts the catalog it keeps of this tub until
+        # the next gather, rather than checking it on every record
+        _drop_stale_record_catalog(self.path)
+        return [self.get_json_record_path(ix) for ix in self.get_index(shuffled=False)
+                if ix not in self.exclude]
 
     def make_file_name(self, key, ext='.png', ix=None):
         this_ix = ix
@@ -327,7 +474,10 @@ class Tub(object):
         shutil.rmtree(self.path)
 
     def shutdown(self):
-        pass
+        if self.catalog is not None:
+            self.catalog.close()
+        if self.record_index is not None:
+            self.record_index.close()
 
     def excluded(self, index):
         return index in self.exclude
@@ -434,8 +584,51 @@ class Tub(object):
 
 
 class TubWriter(Tub):
-    def __init__(self, *args, **kwargs):
+    """
+    Part saving its inputs as a record of the tub on every run.
+
+    With queue_size 0 the record is encoded and written within run. With a
+    queue_size, run only puts the record in a queue of that many records
+    and returns, and workers threads encode the images and write the
+    records in the background, so a slow SD card does not hold up the
+    drive loop. When the queue is full, policy decides what happens:
+    'drop_oldest' drops the oldest queued record, 'drop_newest' drops the
+    record given to run, 'block' waits for a worker to take one.
+
+    run returns the number of records of the tub, counting the queued ones.
+    The queue depth and the records dropped are reported by the part
+    profiler next to the timings of the part.
+
+    With columns set, the column sidecar of the tub is written on shutdown.
+    """
+    # writes records whether or not tub/num_records is read
+    side_effects = True
+    POLICIES = ('block', 'drop_oldest', 'drop_newest')
+
+    def __init__(self, *args, queue_size=0, workers=1, policy='drop_oldest',
+                 columns=False, **kwargs):
         super(TubWriter, self).__init__(*args, **kwargs)
+        assert policy in self.POLICIES, \
+            "policy is not one of %r: %r" % (self.POLICIES, policy)
+        self.queue_size = queue_size
+        self.policy = policy
+        self.columns = columns
+        self.queue = deque()
+        self.queue_changed = threading.Condition()
+        self.in_flight = 0
+        self.max_depth = 0
+        self.dropped = 0
+        self.evicted = 0
+        self.write_errors = 0
+        self.running = True
+        self.workers = []
+        if queue_size:
+            for i in range(max(1, workers)):
+                t = threading.Thread(target=self.write_queued,
+                                     name='TubWriter-%d' % i)
+                t.daemon = True
+                t.start()
+                self.workers.append(t)
 
     def run(self, *args):
         """
@@ -444,21 +637,111 @@ class TubWriter(Tub):
         """
         assert len(self.inputs) == len(args)
         record = dict(zip(self.inputs, args))
-        self.put_record(record)
-        return self.current_ix
+        if not self.queue_size:
+            self.put_record(record)
+            return self.current_ix
+        self.queue_record(record)
+        return self.current_ix - self.evicted
+
+    def queue_record(self, record):
+        milliseconds = int(round((self.clock() - self.start_time) * 1000))
+        with self.queue_changed:
+            if len(self.queue) >= self.queue_size:
+                if self.policy == 'drop_newest':
+                    self.dropped += 1
+                    return
+                if self.policy == 'drop_oldest':
+                    self.queue.popleft()
+                    self.dropped += 1
+                    self.evicted += 1
+                else:
+                    while len(self.queue) >= self.queue_size:
+                        self.queue_changed.wait()
+            self.current_ix += 1
+            self.queue.append((self.current_ix, record, milliseconds))
+            self.max_depth = max(self.max_depth, len(self.queue))
+            self.queue_changed.notify_all()
+
+    def write_queued(self):
+        while True:
+            with self.queue_changed:
+                while self.running and not self.queue:
+                    self.queue_changed.wait()
+                if not self.queue:
+                    return
+                ix, record, milliseconds = self.queue.popleft()
+                self.in_flight += 1
+                self.queue_changed.notify_all()
+            try:
+                self.write_record(ix, record, milliseconds)
+            except Exception as e:
+                self.write_errors += 1
+                print('TubWriter: could not write record {}: {}'.format(ix, e))
+            finally:
+                with self.queue_changed:
+                    self.in_flight -= 1
+                    self.queue_changed.notify_all()
+
+    def flush(self):
+        """ wait until the queued records are written """
+        with self.queue_changed:
+            while self.queue or self.in_flight:
+                self.queue_changed.wait()
+
+    def profile_counters(self):
+        """ queue depth and dropped records for the part profiler """
+        if not self.queue_size:
+            return {}
+        return {'queued': len(self.queue), 'max queued': self.max_depth,
+                'dropped': self.dropped, 'write errors': self.write_errors}
+
+    def erase_last_n_records(self, num_erase):
+        self.flush()
+        super(TubWriter, self).erase_last_n_records(num_erase)
+
+    def shutdown(self):
+        self.flush()
+        with self.queue_changed:
+            self.running = False
+            self.queue_changed.notify_all()
+        for t in self.workers:
+            t.join()
+        self.workers = []
+        if self.dropped or self.write_errors:
+            print('TubWriter: {} records dropped, {} could not be written'
+                  .format(self.dropped, self.write_errors))
+        if self.columns:
+            self.save_columns()
+        super(TubWriter, self).shutdown()
 
 
 class TubReader(Tub):
     def __init__(self, path, *args, **kwargs):
-        super(TubReader, self).__init__(*args, **kwargs)
+        super(TubReader, self).__init__(path, *args, **kwargs)
+        self.read_index = self.get_index(shuffled=False)
+        self.read_pos = 0
+
+    def read_next(self):
+        """
+        The next record in the order they were recorded, None once all
+        were read.
+        """
+        if self.read_pos >= len(self.read_index):
+            return None
+        record_dict = self.get_record(self.read_index[self.read_pos])
+        self.read_pos += 1
+        return record_dict
 
     def run(self, *args):
         """
         API function needed to use as a Donkey part.
-        Accepts keys to read from the tub and retrieves them sequentially.
+        Accepts keys to read from the tub and retrieves them sequentially,
+        all the inputs of the tub when no keys are given. Gives None values
+        once every record was read.
         """
-        record_dict = self.get_record()
-        record = [record_dict[key] for key in args]
+        keys = args or self.inputs
+        record_dict = self.read_next() or {}
+        record = [record_dict.get(key) for key in keys]
         return record
 
 
@@ -490,9 +773,9 @@ class TubHandler:
         tub_path = os.path.join(self.path, name)
         return tub_path
 
-    def new_tub_writer(self, inputs, types, user_meta=[]):
+    def new_tub_writer(self, inputs, types, user_meta=[], **kwargs):
         tub_path = self.create_tub_path()
-        tw = TubWriter(path=tub_path, inputs=inputs, types=types, user_meta=user_meta)
+        tw = TubWriter(path=tub_path, inputs=inputs, types=types, user_meta=user_meta, **kwargs)
         return tw
 
 
@@ -595,7 +878,7 @@ class TubTimeStacker(TubImageStacker):
 
                 # load only the first image saved as separate files
                 if typ == 'image' and i == 0:
-                    val = Image.open(os.path.join(self.path, val))
+                    val = open_image(os.path.join(self.path, val))
                     data[key] = val                    
                 elif typ == 'image_array' and i == 0:
                     d = super(TubTimeStacker, self).get_record(ix)
@@ -623,12 +906,12 @@ class TubGroup(Tub):
             record_count += len(t.df)
             self.input_types.update(dict(zip(t.inputs, t.types)))
 
-        print('joining the tubs {} records together. This could take {} minutes.'
-              .format(record_count, int(record_count / 300000)))
+        print('joining the tubs {} records together.'.format(record_count))
 
         self.meta = {'inputs': list(self.input_types.keys()),
                      'types': list(self.input_types.values())}
 
+        import pandas as pd
         self.df = pd.concat([t.df for t in tubs], axis=0, join='inner')
 
     def find_tub_paths(self, path):
@@ -646,3 +929,150 @@ class TubGroup(Tub):
             paths = self.find_tub_paths(path)
             resolved_paths += paths
         return resolved_paths
+
+
+_record_tubs = {}
+
+
+def _drop_stale_record_catalog(tub_path):
+    """
+    Close the catalog load_json_record() keeps of the tub at tub_path when
+    the tub was written to since it was opened.
+    """
+    catalog = _record_tubs.get(tub_path)
+    if catalog is not None and not catalog.current():
+        del _record_tubs[tub_path]
+        catalog.close()
+
+
+def load_json_record(record_path):
+    """
+    Load the record at a path given by Tub.gather_records(), from its file
+    or, for a catalog tub, from the catalog of the tub it is in. Paths in
+    the record are left relative to the tub, as in the file. The catalog is
+    kept open for the next records, and looked at again for records it
+    does not have and on the next gather_records() of the tub.
+    """
+    tub_path = os.path.dirname(record_path)
+    ix = int(os.path.basename(record_path).split('_')[1].split('.')[0])
+    catalog = _record_tubs.get(tub_path)
+    if catalog is not None:
+        try:
+            return catalog.read(ix)
+        except KeyError:
+            # appended since, or gone
+            _drop_stale_record_catalog(tub_path)
+            if tub_path in _record_tubs:
+                raise FileNotFoundError(record_path)
+    else:
+        try:
+            with open(record_path, 'r') as fp:
+                return json.load(fp)
+        except FileNotFoundError:
+            pass
+    if not Catalog.exists(tub_path):
+        raise FileNotFoundError(record_path)
+    with open(os.path.join(tub_path, 'meta.json'), 'r') as f:
+        meta = json.load(f)
+    catalog = Catalog(tub_path, meta.get('chunk_records', 1000))
+    _record_tubs[tub_path] = catalog
+    try:
+        return catalog.read(ix)
+    except KeyError:
+        raise FileNotFoundError(record_path)
+
+
+def load_column_records(tub_path):
+    """
+    The records of the tub at tub_path by record number, read from its
+    column sidecar, as load_json_record() gives them. None when the tub has
+    no sidecar up to date or it leaves out some channels. Values a record
+    has none of, NaN in the sidecar, are left out of the record.
+    """
+    tub = Tub(tub_path)
+    loaded = tub.get_columns()
+    tub.shutdown()
+    if loaded is None or loaded[2]:
+        return None
+    ixs, columns, _ = loaded
+    values = {key: column.tolist() for key, column in columns.items()}
+    with_nan = [key for key, column in columns.items()
+                if column.ndim == 1 and column.dtype.kind == 'f'
+                and np.isnan(column).any()]
+    records = {}
+    for i, ix in enumerate(ixs.tolist()):
+        record = {key: column[i] for key, column in values.items()}
+        for key in with_nan:
+            if record[key] != record[key]:
+                del record[key]
+        records[ix] = record
+    return records
+
+
+def convert_tub(path, chunk_records=1000, keep_json=False):
+    """
+    Convert the tub at path from a record_<ix>.json file per record to a
+    catalog, in place. The record files are deleted once the catalog is
+    written and synced, unless keep_json is set. Returns the number of
+    records converted.
+    """
+    tub = Tub(path)
+    if tub.catalog is not None:
+        print('{} is a catalog tub already'.format(tub.path))
+        return 0
+    # left over from a conversion that did not finish
+    for leftover in glob.glob(os.path.join(tub.path, 'catalog_*.catalog*')):
+        os.unlink(leftover)
+
+    index = tub.get_index(shuffled=False)
+    catalog = Catalog(tub.path, chunk_records=chunk_records,
+                      flush_every=chunk_records)
+    for ix in index:
+        with open(tub.get_json_record_path(ix), 'r') as fp:
+            catalog.append(ix, json.load(fp))
+    catalog.close()
+
+    tub.meta['format'] = 'catalog'
+    tub.meta['chunk_records'] = chunk_records
+    meta_tmp = tub.meta_path + '.tmp'
+    with open(meta_tmp, 'w') as f:
+        json.dump(tub.meta, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(meta_tmp, tub.meta_path)
+
+    tub.shutdown()
+    if not keep_json:
+        for ix in index:
+            os.unlink(tub.get_json_record_path(ix))
+        index_path = os.path.join(tub.path, RecordIndex.NAME)
+        if os.path.exists(index_path):
+            os.unlink(index_path)
+    print('Converted {} records of {} to a catalog'.format(len(index), tub.path))
+    return len(index)
+
+
+def pack_tub(path, shard_mb=128, keep_files=False):
+    """
+    Pack the image files of the tub at path into shards of shard_mb
+    megabytes, in place. Pack a tub once it is recorded, not while it is.
+    Returns the number of images packed.
+    """
+    tub = Tub(path)
+    count = pack_images(tub.path, shard_bytes=shard_mb * 1024 * 1024,
+                        keep_files=keep_files)
+    tub.shutdown()
+    print('Packed {} images of {}'.format(count, tub.path))
+    return count
+
+
+def unpack_tub(path):
+    """
+    Write the packed images of the tub at path back to image files and
+    delete its shards. Returns the number of image files written.
+    """
+    tub = Tub(path)
+    count = unpack_images(tub.path)
+    tub.shutdown()
+    print('Unpacked {} images of {}'.format(count, tub.path))
+    return count
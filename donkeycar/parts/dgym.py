@@ -3,13 +3,15 @@ import os
 import time
 import gym
 import gym_donkeycar
+from donkeycar.parts.camera import BaseCamera
 
 def is_exe(fpath):
     return os.path.isfile(fpath) and os.access(fpath, os.X_OK)
 
-class DonkeyGymEnv(object):
+class DonkeyGymEnv(BaseCamera):
 
     def __init__(self, sim_path, host="127.0.0.1", port=9091, headless=0, env_name="donkey-generated-track-v0", sync="asynchronous", conf={}, delay=0):
+        super().__init__()
         os.environ['DONKEY_SIM_PATH'] = sim_path
         os.environ['DONKEY_SIM_PORT'] = str(port)
         os.environ['DONKEY_SIM_HEADLESS'] = str(headless)
@@ -36,7 +38,11 @@ class DonkeyGymEnv(object):
 
     def update(self):
         while self.running:
-            self.frame, _, _, self.info = self.env.step(self.action)
+            self.update_once()
+
+    def update_once(self):
+        frame, _, _, self.info = self.env.step(self.action)
+        self.put_frame(frame)
 
     def run_threaded(self, steering, throttle):
         if steering is None or throttle is None:
@@ -45,7 +51,7 @@ class DonkeyGymEnv(object):
         if self.delay > 0.0:
             time.sleep(self.delay / 1000.0)
         self.action = [steering, throttle]
-        return self.frame
+        return super().run_threaded()
 
     def shutdown(self):
         self.running = False
@@ -92,6 +92,12 @@ class ImgStack:
         return np.dot(rgb[...,:3], [0.299, 0.587, 0.114])
         
     def run(self, img_arr):
+        if img_arr.ndim == 4:
+            # a window of frames read from the vehicle memory,
+            # like 'cam/image_array[-3:]', already oldest first
+            gray = self.rgb2gray(img_arr)
+            return np.moveaxis(gray, 0, -1).astype(np.dtype('B'))
+
         width, height, _ = img_arr.shape        
         gray = self.rgb2gray(img_arr)
         
@@ -481,16 +481,23 @@ class KerasRNN_LSTM(KerasPilot):
                   loss='mse')
 
     def run(self, img_arr):
-        if img_arr.shape[2] == 3 and self.image_d == 1:
-            img_arr = dk.utils.rgb2gray(img_arr)
+        if img_arr.ndim == 4:
+            # a window of frames read from the vehicle memory,
+            # like 'cam/normalized/cropped[-3:]'
+            if img_arr.shape[3] == 3 and self.image_d == 1:
+                img_arr = dk.utils.rgb2gray(img_arr)
+            img_arr = img_arr.reshape(1, self.seq_length, self.image_h, self.image_w, self.image_d )
+        else:
+            if img_arr.shape[2] == 3 and self.image_d == 1:
+                img_arr = dk.utils.rgb2gray(img_arr)
+
+            while len(self.img_seq) < self.seq_length:
+                self.img_seq.append(img_arr)
 
-        while len(self.img_seq) < self.seq_length:
+            self.img_seq = self.img_seq[1:]
             self.img_seq.append(img_arr)
 
-        self.img_seq = self.img_seq[1:]
-        self.img_seq.append(img_arr)
-        
-        img_arr = np.array(self.img_seq).reshape(1, self.seq_length, self.image_h, self.image_w, self.image_d )
+            img_arr = np.array(self.img_seq).reshape(1, self.seq_length, self.image_h, self.image_w, self.image_d )
         outputs = self.model.predict([img_arr])
         steering = outputs[0][0]
         throttle = outputs[0][1]
@@ -556,17 +563,23 @@ class Keras3D_CNN(KerasPilot):
         self.model.compile(loss='mean_squared_error', optimizer=self.optimizer, metrics=['accuracy'])
 
     def run(self, img_arr):
+        if img_arr.ndim == 4:
+            # a window of frames read from the vehicle memory,
+            # like 'cam/normalized/cropped[-3:]'
+            if img_arr.shape[3] == 3 and self.image_d == 1:
+                img_arr = dk.utils.rgb2gray(img_arr)
+            img_arr = img_arr.reshape(1, self.seq_length, self.image_h, self.image_w, self.image_d )
+        else:
+            if img_arr.shape[2] == 3 and self.image_d == 1:
+                img_arr = dk.utils.rgb2gray(img_arr)
 
-        if img_arr.shape[2] == 3 and self.image_d == 1:
-            img_arr = dk.utils.rgb2gray(img_arr)
+            while len(self.img_seq) < self.seq_length:
+                self.img_seq.append(img_arr)
 
-        while len(self.img_seq) < self.seq_length:
+            self.img_seq = self.img_seq[1:]
             self.img_seq.append(img_arr)
 
-        self.img_seq = self.img_seq[1:]
-        self.img_seq.append(img_arr)
-        
-        img_arr = np.array(self.img_seq).reshape(1, self.seq_length, self.image_h, self.image_w, self.image_d )
+            img_arr = np.array(self.img_seq).reshape(1, self.seq_length, self.image_h, self.image_w, self.image_d )
         outputs = self.model.predict([img_arr])
         steering = outputs[0][0]
         throttle = outputs[0][1]
@@ -4,10 +4,11 @@ class AiLaunch():
     '''
     This part will apply a large thrust on initial activation. This is to help
     in racing to start fast and then the ai will take over quickly when it's
-    up to speed.
+    up to speed. The launch is timed with clock, time.time by default.
     '''
 
-    def __init__(self, launch_duration=1.0, launch_throttle=1.0, keep_enabled=False):
+    def __init__(self, launch_duration=1.0, launch_throttle=1.0, keep_enabled=False, clock=None):
+        self.clock = clock or time.time
         self.active = False
         self.enabled = False
         self.timer_start = None
@@ -32,9 +33,9 @@ class AiLaunch():
         if (mode == "local"  or (mode == "local_angle" and ai_throttle > 0)) and self.enabled:
             if not self.active:
                 self.active = True
-                self.timer_start = time.time()
+                self.timer_start = self.clock()
             else:
-                duration = time.time() - self.timer_start
+                duration = self.clock() - self.timer_start
                 if duration > self.timer_duration:
                     self.active = False
                     self.enabled = False
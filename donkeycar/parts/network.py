@@ -1,7 +1,9 @@
+import asyncio
 import socket
 import zlib, pickle
 import zmq
 import time
+from donkeycar.memory import Handoff
 
 class ZMQValuePub(object):
     '''
@@ -91,9 +93,22 @@ class UDPValuePub(object):
     def shutdown(self):
         self.sock.close()
 
+class DatagramReceiver(asyncio.DatagramProtocol):
+    '''
+    Passes the datagrams received on the event loop to a callback
+    '''
+    def __init__(self, callback):
+        self.callback = callback
+
+    def datagram_received(self, data, addr):
+        self.callback(data)
+
+
 class UDPValueSub(object):
     '''
-    Use UDP to listen for broadcase packets
+    Use UDP to listen for broadcase packets.
+    Added to a vehicle without threaded=True, the packets are received on
+    the event loop of the vehicle and run() returns the last value.
     '''
     def __init__(self, name, port = 37021, def_value=None):
         self.client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM) # UDP
@@ -103,9 +118,17 @@ class UDPValueSub(object):
         self.name = name
         self.last = def_value
         self.running = True
+        self.loop = None
+        self.transport = None
+
+    async def start_async(self):
+        self.loop = asyncio.get_running_loop()
+        self.transport, _ = await self.loop.create_datagram_endpoint(
+            lambda: DatagramReceiver(self.receive), sock=self.client)
 
     def run(self):
-        self.poll()
+        if self.transport is None:
+            self.poll()
         return self.last
 
     def run_threaded(self):
@@ -113,10 +136,16 @@ class UDPValueSub(object):
 
     def update(self):
         while self.running:
-            self.poll()
+            self.update_once()
+
+    def update_once(self):
+        self.poll()
 
     def poll(self):
         data, addr = self.client.recvfrom(1024 * 65)
+        self.receive(data)
+
+    def receive(self, data):
         #print("got", len(data), "bytes")
         if len(data) > 0:
             p = zlib.decompress(data)
@@ -128,13 +157,19 @@ class UDPValueSub(object):
 
     def shutdown(self):
         self.running = False
-        self.client.close()
+        if self.transport is not None:
+            # the transport closes the socket, on the loop thread
+            self.loop.call_soon_threadsafe(self.transport.close)
+        else:
+            self.client.close()
 
 import select
 
 class TCPServeValue(object):
     '''
-    Use tcp to serve values on local network
+    Use tcp to serve values on local network.
+    Added to a vehicle, the clients are served from the event loop of the
+    vehicle and the drive loop never waits on the sockets.
     '''
     def __init__(self, name, port = 3233):
         self.name = name
@@ -147,6 +182,32 @@ class TCPServeValue(object):
         self.sock.listen(3)
         print("serving value:", name, "on port:", port)
         self.clients = []
+        self.loop = None
+        self.server = None
+        self.writers = []
+
+    async def start_async(self):
+        self.loop = asyncio.get_running_loop()
+        self.server = await asyncio.start_server(self.on_connect,
+                                                 sock=self.sock)
+
+    def on_connect(self, reader, writer):
+        print("got connection from", writer.get_extra_info('peername'))
+        self.writers.append(writer)
+
+    async def run_async(self, values):
+        if not self.writers:
+            return
+        packet = { "name": self.name, "val" : values }
+        p = pickle.dumps(packet)
+        z = zlib.compress(p)
+        for writer in list(self.writers):
+            if writer.is_closing():
+                print("client dropped connection")
+                self.writers.remove(writer)
+            elif writer.transport.get_write_buffer_size() == 0:
+                # like select, skip the clients still busy with the last value
+                writer.write(z)
 
     def send(self, sock, msg):
         try:
@@ -188,12 +249,18 @@ class TCPServeValue(object):
                 self.clients.remove(sock)
 
     def shutdown(self):
-        self.sock.close()
+        if self.server is not None:
+            self.loop.call_soon_threadsafe(self.server.close)
+        else:
+            self.sock.close()
 
 
 class TCPClientValue(object):
     '''
-    Use tcp to get values on local network
+    Use tcp to get values on local network. run() returns each value once,
+    and None when nothing new was received.
+    Added to a vehicle, the values are read on the event loop of the
+    vehicle and the drive loop never waits on the socket.
     '''
     def __init__(self, name, host, port=3233):
         self.name = name
@@ -203,6 +270,68 @@ class TCPClientValue(object):
         self.connect()
         self.timeout = 0.05
         self.lastread = time.time()
+        self.loop = None
+        self.task = None
+        self.values = Handoff()
+
+    async def start_async(self):
+        self.loop = asyncio.get_running_loop()
+        self.task = self.loop.create_task(self.read_async())
+
+    async def read_async(self):
+        '''
+        keep reading values from the server, connecting again when it drops
+        '''
+        while True:
+            try:
+                if self.sock is not None:
+                    reader, writer = await asyncio.open_connection(sock=self.sock)
+                else:
+                    print("attempting connect to", self.addr)
+                    reader, writer = await asyncio.open_connection(*self.addr)
+            except OSError:
+                print('server down')
+                self.sock = None
+                await asyncio.sleep(3.0)
+                continue
+            # the socket belongs to the stream now
+            self.sock = None
+            try:
+                await self.read_values(reader)
+            finally:
+                writer.close()
+
+    async def read_values(self, reader):
+        # each value comes as a zlib stream of its own, so the end of a
+        # stream is the end of the value
+        stream = zlib.decompressobj()
+        packet = b''
+        while True:
+            try:
+                data = await asyncio.wait_for(reader.read(64 * 1024), 5.0)
+            except asyncio.TimeoutError:
+                print("error: no data from server. may have died")
+                return
+            except OSError:
+                data = b''
+            if len(data) == 0:
+                print("connection closed")
+                return
+            while data:
+                try:
+                    packet += stream.decompress(data)
+                    if not stream.eof:
+                        break
+                    obj = pickle.loads(packet)
+                except Exception as e:
+                    print(e)
+                    print("error: server may have died")
+                    return
+                if self.name == obj['name']:
+                    self.values.put(obj['val'])
+                data = stream.unused_data
+                stream = zlib.decompressobj()
+                packet = b''
 
     def connect(self):
         print("attempting connect to", self.addr)
@@ -254,6 +383,12 @@ class TCPClientValue(object):
  
     def run(self):
 
+        if self.task is not None:
+            # read on the event loop
+            if self.values.seq == self.values.taken_seq:
+                return None
+            return self.values.take()
+
         time_since_last_read = abs(time.time() - self.lastread)
         
         if self.sock is None:
@@ -300,7 +435,10 @@ class TCPClientValue(object):
         return None
 
     def shutdown(self):
-        self.sock.close()
+        if self.task is not None:
+            self.loop.call_soon_threadsafe(self.task.cancel)
+        elif self.sock is not None:
+            self.sock.close()
 
 class MQTTValuePub(object):
     '''
@@ -0,0 +1,175 @@
+import time
+from collections import deque
+
+
+class SlowParts(object):
+    '''
+    Shedding step that runs the selected parts factor times less often.
+    select is called with each part entry of the vehicle.
+    '''
+    def __init__(self, vehicle, select, name, factor=2):
+        self.vehicle = vehicle
+        self.select = select
+        self.name = name
+        self.factor = factor
+        self.slowed = []
+
+    def shed(self):
+        self.slowed = [entry for entry in self.vehicle.parts
+                       if self.select(entry)]
+        for entry in self.slowed:
+            entry['divisor'] = entry.get('divisor', 1) * self.factor
+        self.vehicle.plan = None
+
+    def restore(self):
+        for entry in self.slowed:
+            entry['divisor'] = max(1, entry['divisor'] // self.factor)
+        self.slowed = []
+        self.vehicle.plan = None
+
+
+class PauseFpv(object):
+    '''
+    Shedding step that stops the jpeg encoding of the FPV video of the web
+    servers (LocalWebController, WebFpv) added to the vehicle.
+    '''
+    name = 'fpv'
+
+    def __init__(self, vehicle):
+        self.vehicle = vehicle
+
+    def set_paused(self, paused):
+        for entry in self.vehicle.parts:
+            if hasattr(entry['part'], 'fpv_paused'):
+                entry['part'].fpv_paused = paused
+
+    def shed(self):
+        self.set_paused(True)
+
+    def restore(self):
+        self.set_paused(False)
+
+
+class LowerLoopRate(object):
+    '''
+    Shedding step that runs the drive loop at factor times its rate, the
+    parts added with a rate_hz keeping theirs.
+    '''
+    name = 'loop_hz'
+
+    def __init__(self, vehicle, factor=0.75):
+        self.vehicle = vehicle
+        self.factor = factor
+        self.rate_hz = None
+
+    def shed(self):
+        self.rate_hz = self.vehicle.rate_hz
+        self.vehicle.set_rate(self.rate_hz * self.factor)
+
+    def restore(self):
+        self.vehicle.set_rate(self.rate_hz)
+
+
+def build_steps(vehicle, names):
+    '''
+    Make the shedding steps for a list of names, in the same order:
+    low_rate_parts - parts added with a rate_hz run half as often
+    fpv            - the FPV video is paused
+    recording      - the tub writer records every other loop
+    loop_hz        - the drive loop runs at 3/4 of its rate
+    '''
+    steps = []
+    for name in names:
+        if name == 'low_rate_parts':
+            steps.append(SlowParts(vehicle, lambda entry: entry.get('rate_hz'), name))
+        elif name == 'fpv':
+            steps.append(PauseFpv(vehicle))
+        elif name == 'recording':
+            steps.append(SlowParts(vehicle, lambda entry: 'tub/num_records' in entry['outputs'], name))
+        elif name == 'loop_hz':
+            steps.append(LowerLoopRate(vehicle))
+        else:
+            raise ValueError('unknown overload shedding step: %s' % name)
+    return steps
+
+
+class OverloadController(object):
+    '''
+    Part that watches the drive loop and sheds load when it can not keep
+    its rate, one step at a time in the given priority order, then brings
+    the load back step by step, last shed first, once there is headroom.
+
+    Every window_s seconds of loops it looks at the share of loops that
+    overran their deadline and at the load, the average time spent in the
+    parts over the loop period. It sheds the next step when the overruns
+    pass shed_overruns or the load passes shed_load, and restores the last
+    one after restore_windows windows in a row without overruns and a load
+    under restore_load.
+
+    Its outputs are the number of steps shed and their names, for
+    telemetry, and every decision is printed and kept in events.
+    '''
+    # sheds load whether or not its outputs are read
+    side_effects = True
+
+    def __init__(self, vehicle, steps, window_s=1.0, shed_overruns=0.2,
+                 shed_load=0.95, restore_load=0.6, restore_windows=3):
+        self.vehicle = vehicle
+        self.steps = steps
+        self.window_s = window_s
+        self.shed_overruns = shed_overruns
+        self.shed_load = shed_load
+        self.restore_load = restore_load
+        self.restore_windows = restore_windows
+        self.level = 0
+        self.calm = 0
+        self.ticks = 0
+        self.last = None
+        self.events = deque(maxlen=100)
+
+    def shed_names(self):
+        return ','.join(step.name for step in self.steps[:self.level])
+
+    def run(self):
+        timer = self.vehicle.timer
+        if timer is None:
+            return self.level, self.shed_names()
+        self.ticks += 1
+        if self.ticks < self.window_s * timer.rate_hz:
+            return self.level, self.shed_names()
+        self.ticks = 0
+
+        loop = self.vehicle.profiler.loop
+        now = (timer.count, timer.overruns, loop.count, loop.total)
+        last, self.last = self.last, now
+        if last is None:
+            return self.level, self.shed_names()
+        loops = max(1, now[0] - last[0])
+        overruns = (now[1] - last[1]) / loops
+        work_ns = (now[3] - last[3]) / max(1, now[2] - last[2])
+        load = work_ns / timer.period_ns
+
+        if (overruns > self.shed_overruns or load > self.shed_load) \
+                and self.level < len(self.steps):
+            step = self.steps[self.level]
+            step.shed()
+            self.level += 1
+            self.calm = 0
+            self.on_decision('shed', step, overruns, load)
+        elif overruns == 0 and load < self.restore_load:
+            self.calm += 1
+            if self.calm >= self.restore_windows and self.level > 0:
+                self.level -= 1
+                step = self.steps[self.level]
+                step.restore()
+                self.calm = 0
+                self.on_decision('restore', step, overruns, load)
+        else:
+            self.calm = 0
+        return self.level, self.shed_names()
+
+    def on_decision(self, action, step, overruns, load):
+        self.events.append((time.time(), action, step.name, overruns, load))
+        print('Overload: {} {} (overruns {:.0f}% of loops, load {:.0f}%)'
+              .format(action, step.name, overruns * 100, load * 100))
+        self.vehicle.profiler.counter(self, action)()
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Packed image shards of a tub.
+
+A tub keeps each camera frame in an image file of its own, like
+1234_cam-image_array_.jpg, so training opens a file per image and copying
+a tub copies as many small files. Packing the tub moves the encoded image
+files into a few large shard files instead:
+
+    images_0.shard          the bytes of the image files, one after the other
+    images_0.shard_index    (record number, name, offset, length) of each
+                            image, as four little-endian int64
+    images_1.shard          once images_0 holds shard_bytes
+    ...
+    shards.json             the shards and the names after the record
+                            numbers, like cam-image_array_.jpg
+
+Opening the shards reads their small indexes, then an image is read with
+one seek. The images are stored as they were encoded, nothing is decoded
+or encoded again, and unpacking writes the same files back.
+
+An image file takes precedence over a packed image of the same name, so
+images written to a tub after it was packed, or rewritten after their
+record was erased, are read from their files. Packing the tub again adds
+them in new shards.
+"""
+import glob
+import io
+import json
+import os
+import struct
+import threading
+
+import numpy as np
+from PIL import Image
+
+META_NAME = 'shards.json'
+INDEX_ENTRY = struct.Struct('<qqqq')
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png')
+SHARD_BYTES = 128 * 1024 * 1024
+# record number and name in one sort key
+KEY_SPAN = 2 ** 40
+
+
+def shard_number(path):
+    name = os.path.basename(path)
+    return int(name.split('.')[0].split('_')[1])
+
+
+def image_files(path):
+    """ (record number, name, file name) of the image files in path """
+    files = []
+    for file_name in os.listdir(path):
+        if not file_name.lower().endswith(IMAGE_EXTS):
+            continue
+        ix, _, name = file_name.partition('_')
+        if ix.isdigit() and name:
+            files.append((int(ix), name, file_name))
+    return sorted(files)
+
+
+class ImageShards:
+    """
+    The packed images of the tub at path, by file name. A tub that is not
+    packed has no images in its shards.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.meta_path = os.path.join(path, META_NAME)
+        self.mtime = None
+        self.names = []
+        self.name_ids = {}
+        self.shards = []
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.table = np.zeros((0, 5), dtype=np.int64)
+        self.readers = {}
+        self.lock = threading.Lock()
+        self.load()
+
+    @staticmethod
+    def exists(path):
+        return os.path.exists(os.path.join(path, META_NAME))
+
+    def shard_path(self, shard):
+        return os.path.join(self.path, 'images_%d.shard' % shard)
+
+    def index_path(self, shard):
+        return self.shard_path(shard) + '_index'
+
+    def load(self):
+        try:
+            self.mtime = os.stat(self.meta_path).st_mtime_ns
+            with open(self.meta_path, 'r') as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            return
+        self.names = meta['names']
+        self.name_ids = {name: i for i, name in enumerate(self.names)}
+        self.shards = meta['shards']
+        tables = [self.table]
+        for shard in self.shards:
+            entries = np.fromfile(self.index_path(shard), dtype='<i8')
+            entries = entries.reshape(-1, 4)
+            shards = np.full((len(entries), 1), shard, dtype=np.int64)
+            tables.append(np.hstack([shards, entries]))
+        table = np.concatenate(tables)
+        keys = table[:, 2] * KEY_SPAN + table[:, 1]
+        # the images packed last come last among those of the same name
+        order = np.argsort(keys, kind='stable')
+        self.keys = keys[order]
+        self.table = table[order]
+
+    def current(self):
+        """ whether the tub was not packed or unpacked since loading """
+        try:
+            mtime = os.stat(self.meta_path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        return mtime == self.mtime
+
+    def __len__(self):
+        return len(self.table)
+
+    def __contains__(self, file_name):
+        return self.find(file_name) is not None
+
+    def find(self, file_name):
+        ix, _, name = file_name.partition('_')
+        if not ix.isdigit() or name not in self.name_ids:
+            return None
+        key = self.name_ids[name] * KEY_SPAN + int(ix)
+        i = np.searchsorted(self.keys, key, side='right') - 1
+        if i < 0 or self.keys[i] != key:
+            return None
+        return self.table[i].tolist()
+
+    def read(self, file_name):
+        """ the bytes of the packed image file_name, FileNotFoundError if none """
+        entry = self.find(file_name)
+        if entry is None:
+            raise FileNotFoundError(os.path.join(self.path, file_name))
+        shard, _, _, offset, length = entry
+        with self.lock:
+            f = self.readers.get(shard)
+            if f is None:
+                f = self.readers[shard] = open(self.shard_path(shard), 'rb')
+            f.seek(offset)
+            return f.read(length)
+
+    def file_names(self):
+        """ the file names of the packed images, the last packed of each """
+        last = np.ones(len(self.keys), dtype=bool)
+        last[:-1] = self.keys[1:] != self.keys[:-1]
+        return ['%d_%s' % (ix, self.names[name])
+                for _, ix, name, _, _ in self.table[last].tolist()]
+
+    def close(self):
+        with self.lock:
+            for f in self.readers.values():
+                f.close()
+            self.readers = {}
+
+
+def pack_images(path, shard_bytes=SHARD_BYTES, keep_files=False):
+    """
+    Move the image files of the tub at path into new shards, after the
+    ones it has. The image files are deleted once the shards are written
+    and synced, unless keep_files is set. Returns the number of images
+    packed.
+    """
+    shards = ImageShards(path)
+    # left over from a pack that did not finish
+    for leftover in glob.glob(os.path.join(path, 'images_*.shard*')):
+        if shard_number(leftover) not in shards.shards:
+            os.unlink(leftover)
+    files = image_files(path)
+    if not files:
+        return 0
+
+    names = list(shards.names)
+    name_ids = dict(shards.name_ids)
+    shard = max(shards.shards) + 1 if shards.shards else 0
+    new_shards = []
+    writer = index_writer = None
+    packed = 0
+
+    def close_shard():
+        for f in (writer, index_writer):
+            f.flush()
+            os.fsync(f.fileno())
+            f.close()
+
+    for ix, name, file_name in files:
+        with open(os.path.join(path, file_name), 'rb') as f:
+            data = f.read()
+        if file_name in shards and shards.read(file_name) == data:
+            # kept after packing it before
+            continue
+        if writer is None or writer.tell() >= shard_bytes:
+            if writer is not None:
+                close_shard()
+            writer = open(shards.shard_path(shard), 'wb')
+            index_writer = open(shards.index_path(shard), 'wb')
+            new_shards.append(shard)
+            shard += 1
+        if name not in name_ids:
+            name_ids[name] = len(names)
+            names.append(name)
+        index_writer.write(
+            INDEX_ENTRY.pack(ix, name_ids[name], writer.tell(), len(data)))
+        writer.write(data)
+        packed += 1
+    shards.close()
+
+    if writer is not None:
+        close_shard()
+        meta = {'names': names, 'shards': shards.shards + new_shards}
+        tmp_path = shards.meta_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, shards.meta_path)
+
+    if not keep_files:
+        for _, _, file_name in files:
+            os.unlink(os.path.join(path, file_name))
+    return packed
+
+
+def unpack_images(path):
+    """
+    Write the packed images of the tub at path back to image files, those
+    that have no file, and delete the shards. Returns the number of image
+    files written.
+    """
+    shards = ImageShards(path)
+    count = 0
+    for file_name in shards.file_names():
+        file_path = os.path.join(path, file_name)
+        if os.path.exists(file_path):
+            continue
+        with open(file_path, 'wb') as f:
+            f.write(shards.read(file_name))
+        count += 1
+    shards.close()
+    if os.path.exists(shards.meta_path):
+        os.unlink(shards.meta_path)
+    for shard_file in glob.glob(os.path.join(path, 'images_*.shard*')):
+        os.unlink(shard_file)
+    return count
+
+
+_tub_shards = {}
+
+
+def read_image_file(path):
+    """
+    The bytes of the image file at path, read from the file, or from the
+    shards of its tub when it was packed. FileNotFoundError when there is
+    neither.
+    """
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        pass
+    tub_path, file_name = os.path.split(path)
+    shards = _tub_shards.get(tub_path)
+    if shards is None:
+        shards = _tub_shards[tub_path] = ImageShards(tub_path)
+    try:
+        return shards.read(file_name)
+    except FileNotFoundError:
+        if shards.current():
+            raise
+    # packed again since
+    shards.close()
+    shards = _tub_shards[tub_path] = ImageShards(tub_path)
+    return shards.read(file_name)
+
+
+def open_image(path):
+    """ the PIL image of the image file at path, see read_image_file """
+    return Image.open(io.BytesIO(read_image_file(path)))
@@ -1,4 +1,5 @@
 import tensorflow as tf
+from donkeycar.scheduling import tflite_threads
 
 def keras_model_to_tflite(in_filename, out_filename, data_gen=None):
     verStr = tf.__version__
@@ -47,7 +48,12 @@ class TFLitePilot(object):
     
     def load(self, model_path):
         # Load TFLite model and allocate tensors.
-        self.interpreter = tf.lite.Interpreter(model_path=model_path)
+        num_threads = tflite_threads()
+        if num_threads:
+            self.interpreter = tf.lite.Interpreter(model_path=model_path,
+                                                   num_threads=num_threads)
+        else:
+            self.interpreter = tf.lite.Interpreter(model_path=model_path)
         self.interpreter.allocate_tensors()
 
         # Get input and output tensors.
@@ -16,7 +16,6 @@ import json
 import time
 import asyncio
 
-import requests
 from tornado.ioloop import IOLoop
 from tornado.web import Application, RedirectHandler, StaticFileHandler, \
     RequestHandler
@@ -35,6 +34,7 @@ class RemoteWebServer():
     '''
     
     def __init__(self, remote_url, connection_timeout=.25):
+        import requests
 
         self.control_url = remote_url
         self.time = 0.
@@ -66,6 +66,7 @@ class RemoteWebServer():
         Posts current car sensor data to webserver and returns
         angle and throttle recommendations. 
         '''
+        import requests
         
         data = {}
         response = None
@@ -118,6 +119,11 @@ class LocalWebController(tornado.web.Application):
         
         self.num_records = 0
         self.wsclients = []
+        # the server and its loop, once started by update or start_async
+        self.server = None
+        self.ioloop = None
+        # set by the overload controller to stop encoding the video
+        self.fpv_paused = False
 
 
         handlers = [
@@ -135,10 +141,16 @@ class LocalWebController(tornado.web.Application):
               "your car.".format(gethostname()))
 
     def update(self):
-        ''' Start the tornado webserver. '''
+        ''' Start the tornado webserver on an event loop of its own. '''
         asyncio.set_event_loop(asyncio.new_event_loop())
-        self.listen(self.port)
-        IOLoop.instance().start()
+        self.server = self.listen(self.port)
+        self.ioloop = IOLoop.current()
+        self.ioloop.start()
+
+    async def start_async(self):
+        ''' Start the tornado webserver on the event loop of the vehicle. '''
+        self.server = self.listen(self.port)
+        self.ioloop = IOLoop.current()
 
     def run_threaded(self, img_arr=None, num_records=0):
         self.img_arr = img_arr
@@ -146,18 +158,23 @@ class LocalWebController(tornado.web.Application):
 
         # Send record count to websocket clients
         if (self.num_records is not None and self.recording is True):
-            if self.num_records % 10 == 0:
-                for wsclient in self.wsclients:
-                    wsclient.write_message(json.dumps({'num_records': self.num_records}))
+            if self.num_records % 10 == 0 and self.wsclients:
+                # websockets may only be written from the server's loop
+                self.ioloop.add_callback(self.send_num_records,
+                                         self.num_records)
         
         return self.angle, self.throttle, self.mode, self.recording
         
-    def run(self, img_arr=None):
-        self.img_arr = img_arr
-        return self.angle, self.throttle, self.mode, self.recording
+    def run(self, img_arr=None, num_records=0):
+        return self.run_threaded(img_arr, num_records)
+
+    def send_num_records(self, num_records):
+        for wsclient in self.wsclients:
+            wsclient.write_message(json.dumps({'num_records': num_records}))
 
     def shutdown(self):
-        pass
+        if self.server is not None:
+            self.ioloop.add_callback(self.server.stop)
 
 
 class DriveAPI(RequestHandler):
@@ -209,14 +226,19 @@ class VideoAPI(RequestHandler):
                         "multipart/x-mixed-replace;boundary=--boundarydonotcross")
 
         served_image_timestamp = time.time()
+        served_img_arr = None
         my_boundary = "--boundarydonotcross\n"
         while True:
 
             interval = .01
+            img_arr = getattr(self.application, 'img_arr', None)
+            # encode each new frame once, and none while paused
             if served_image_timestamp + interval < time.time() and \
-                    hasattr(self.application, 'img_arr'):
+                    img_arr is not None and img_arr is not served_img_arr and \
+                    not getattr(self.application, 'fpv_paused', False):
 
-                img = utils.arr_to_binary(self.application.img_arr)
+                img = utils.arr_to_binary(img_arr)
+                served_img_arr = img_arr
                 self.write(my_boundary)
                 self.write("Content-type: image/jpeg\r\n")
                 self.write("Content-length: %s\r\n\r\n" % len(img))
@@ -248,6 +270,10 @@ class WebFpv(Application):
 
     def __init__(self, port=8890):
         self.port = port
+        # set by the overload controller to stop encoding the video
+        self.fpv_paused = False
+        self.server = None
+        self.ioloop = None
         this_dir = os.path.dirname(os.path.realpath(__file__))
         self.static_file_path = os.path.join(this_dir, 'templates', 'static')
 
@@ -265,10 +291,16 @@ class WebFpv(Application):
               "view the car camera".format(gethostname(), self.port))
 
     def update(self):
-        """ Start the tornado webserver. """
+        """ Start the tornado webserver on an event loop of its own. """
         asyncio.set_event_loop(asyncio.new_event_loop())
-        self.listen(self.port)
-        IOLoop.instance().start()
+        self.server = self.listen(self.port)
+        self.ioloop = IOLoop.current()
+        self.ioloop.start()
+
+    async def start_async(self):
+        """ Start the tornado webserver on the event loop of the vehicle. """
+        self.server = self.listen(self.port)
+        self.ioloop = IOLoop.current()
 
     def run_threaded(self, img_arr=None):
         self.img_arr = img_arr
@@ -277,7 +309,8 @@ class WebFpv(Application):
         self.img_arr = img_arr
 
     def shutdown(self):
-        pass
+        if self.server is not None:
+            self.ioloop.add_callback(self.server.stop)
 
 
 
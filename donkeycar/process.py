@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Running parts in a child process, out of reach of the GIL of the drive loop.
+
+The drive loop and the child exchange the channels of the part through
+shared memory instead of pipes, so frames are never pickled. Each channel
+is a small struct holding the latest scalar, and a ring of slots for
+arrays. One side only ever writes a channel and the other only reads it,
+so a sequence number written around every update (a seqlock) is all the
+synchronisation needed.
+"""
+import multiprocessing
+import os
+import pickle
+import threading
+import time
+import traceback
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+class SharedChannel:
+    """
+    Latest value of one channel, in shared memory.
+
+    None, booleans, integers and floats are kept in the header. Arrays are
+    copied into the next slot of a ring of slots, each of slot_bytes, and
+    the header then points at it, so a reader copying out a frame is never
+    overwritten by the next one. Other values are pickled into a slot. A
+    value larger than slot_bytes raises ValueError.
+    """
+    NONE, BOOL, INT, FLOAT, ARRAY, OBJECT = range(6)
+    HEADER_BYTES = 256
+    MAX_DIMS = 8
+
+    # header fields, as int64 indices
+    SEQ, KIND, SLOT, DTYPE, NDIM, NBYTES, INT_VALUE, SHAPE = range(8)
+    FLOAT_VALUE = 16
+
+    def __init__(self, slot_bytes=1 << 20, slots=3):
+        self.slot_bytes = slot_bytes
+        self.slots = slots
+        self.shm = shared_memory.SharedMemory(
+            create=True, size=self.HEADER_BYTES + slots * slot_bytes)
+        self.header = np.ndarray(self.SHAPE + self.MAX_DIMS, dtype=np.int64,
+                                 buffer=self.shm.buf)
+        self.floats = np.ndarray(1, dtype=np.float64, buffer=self.shm.buf,
+                                 offset=self.FLOAT_VALUE * 8)
+        self.payload = np.ndarray(slots * slot_bytes, dtype=np.uint8,
+                                  buffer=self.shm.buf,
+                                  offset=self.HEADER_BYTES)
+        self.header[:] = 0
+        self.header[self.SLOT] = -1
+        self.last_seq = 0
+        self.last_value = None
+        self.last_written = None
+
+    def write(self, value):
+        same_object = value is self.last_written and value is not None
+        self.last_written = value
+        header = self.header
+        if value is None:
+            kind = self.NONE
+        elif isinstance(value, (bool, np.bool_)):
+            kind = self.BOOL
+        elif isinstance(value, (int, np.integer)):
+            kind = self.INT
+        elif isinstance(value, (float, np.floating)):
+            kind = self.FLOAT
+        elif isinstance(value, np.ndarray) and value.dtype.char not in 'OV' \
+                and value.ndim <= self.MAX_DIMS:
+            kind = self.ARRAY
+        else:
+            kind = self.OBJECT
+            value = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+        slot = header[self.SLOT]
+        if kind == self.ARRAY:
+            value = np.ascontiguousarray(value)
+            raw = value.reshape(-1).view(np.uint8)
+        elif kind == self.OBJECT:
+            raw = np.frombuffer(value, dtype=np.uint8)
+        if kind >= self.ARRAY and same_object \
+                and self.holds(kind, value, raw):
+            # the same frame again on every loop, readers keep their copy
+            return
+        if kind >= self.ARRAY:
+            # fill the next slot before anyone is told about it
+            nbytes = raw.size
+            if nbytes > self.slot_bytes:
+                raise ValueError('value of %d bytes does not fit a shared '
+                                 'memory slot of %d bytes'
+                                 % (nbytes, self.slot_bytes))
+            slot = (slot + 1) % self.slots
+            start = slot * self.slot_bytes
+            self.payload[start:start + nbytes] = raw
+
+        seq = header[self.SEQ]
+        header[self.SEQ] = seq + 1
+        header[self.KIND] = kind
+        header[self.SLOT] = slot
+        if kind == self.FLOAT:
+            self.floats[0] = value
+        elif kind in (self.BOOL, self.INT):
+            header[self.INT_VALUE] = int(value)
+        elif kind == self.ARRAY:
+            header[self.DTYPE] = ord(value.dtype.char)
+            header[self.NDIM] = value.ndim
+            header[self.NBYTES] = nbytes
+            header[self.SHAPE:self.SHAPE + value.ndim] = value.shape
+        elif kind == self.OBJECT:
+            header[self.NBYTES] = nbytes
+        header[self.SEQ] = seq + 2
+
+    def holds(self, kind, value, raw):
+        """
+        whether the channel holds value already, as raw bytes, so an array
+        changed in place since it was written is written again
+        """
+        header = self.header
+        if header[self.KIND] != kind or header[self.NBYTES] != raw.size:
+            return False
+        if kind == self.ARRAY and (
+                header[self.DTYPE] != ord(value.dtype.char)
+                or header[self.NDIM] != value.ndim
+                or tuple(header[self.SHAPE:self.SHAPE + value.ndim])
+                != value.shape):
+            return False
+        start = int(header[self.SLOT]) * self.slot_bytes
+        return np.array_equal(self.payload[start:start + raw.size], raw)
+
+    def read(self):
+        """
+        Return the latest value. Arrays are copied out of shared memory,
+        and a value that did not change since the last read is returned
+        again without copying.
+        """
+        header = self.header
+        while True:
+            seq = int(header[self.SEQ])
+            if seq == self.last_seq:
+                return self.last_value
+            if seq % 2:
+                # the writer is half way through
+                time.sleep(0)
+                continue
+            kind = int(header[self.KIND])
+            if kind == self.NONE:
+                value = None
+            elif kind == self.BOOL:
+                value = bool(header[self.INT_VALUE])
+            elif kind == self.INT:
+                value = int(header[self.INT_VALUE])
+            elif kind == self.FLOAT:
+                value = float(self.floats[0])
+            else:
+                start = int(header[self.SLOT]) * self.slot_bytes
+                nbytes = int(header[self.NBYTES])
+                data = self.payload[start:start + nbytes].copy()
+                if kind == self.ARRAY:
+                    ndim = int(header[self.NDIM])
+                    shape = tuple(header[self.SHAPE:self.SHAPE + ndim])
+                    value = data.view(np.dtype(chr(header[self.DTYPE])))
+                    value = value.reshape(shape)
+                else:
+                    value = data
+            if int(header[self.SEQ]) != seq:
+                # overwritten while copying, try again
+                continue
+            if kind == self.OBJECT:
+                value = pickle.loads(value.tobytes())
+            self.last_seq = seq
+            self.last_value = value
+            return value
+
+    def close(self, unlink=False):
+        del self.header, self.floats, self.payload
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+class ProcessPart:
+    """
+    Stand-in for a part that runs in a child process.
+
+    The part is handed to the child by forking, so it needs no pickling but
+    only works where the fork start method exists (Linux and macOS), and
+    start() is best called before any thread of the process is. Every
+    time the drive loop runs the stand-in, it copies the inputs into shared
+    memory, asks the child for a new run and returns the latest outputs the
+    child has published, like a threaded part does. A threaded part also
+    runs its update() thread inside the child, or calls its update_once()
+    at no more than update_hz when given.
+
+    Runs are asked for by writing a byte to a pipe, which never blocks the
+    drive loop, even when the child is busy. The child stops when asked to
+    by shutdown(), or when the pipe is closed because the drive loop
+    process died.
+    """
+    def __init__(self, part, inputs=[], outputs=[], threaded=False,
+                 update_hz=None, slot_bytes=1 << 20, slots=3):
+        self.part = part
+        self.update_hz = update_hz
+        self.name = part.__class__.__name__
+        self.report_name = self.name + ' (process)'
+        self.threaded = threaded
+        self.inputs = [SharedChannel(slot_bytes, slots) for _ in inputs]
+        self.outputs = [SharedChannel(slot_bytes, slots) for _ in outputs]
+        self.wake_r, self.wake_w = os.pipe()
+        os.set_blocking(self.wake_w, False)
+        context = multiprocessing.get_context('fork')
+        self.stopping = context.RawValue('b', 0)
+        self.process = context.Process(target=self.serve, name=self.name)
+        self.process.daemon = True
+
+    def start(self):
+        '''
+        fork the child, once. Threads are not forked along, so a lock one
+        of them holds stays locked in the child for good; fork before any
+        thread is started.
+        '''
+        if self.process.pid is not None:
+            return
+        others = [t.name for t in threading.enumerate()
+                  if t is not threading.current_thread()]
+        if others:
+            print('WARN::ProcessPart: forking the process of {} while the '
+                  'threads {} are running'.format(self.name,
+                                                  ', '.join(others)))
+        self.process.start()
+        os.close(self.wake_r)
+        self.wake_r = None
+
+    def run(self, *args):
+        for channel, value in zip(self.inputs, args):
+            channel.write(value)
+        try:
+            os.write(self.wake_w, b'\0')
+        except BlockingIOError:
+            # the child has plenty of requests waiting already
+            pass
+        if not self.outputs:
+            return None
+        if len(self.outputs) == 1:
+            return self.outputs[0].read()
+        return tuple(channel.read() for channel in self.outputs)
+
+    def run_threaded(self, *args):
+        return self.run(*args)
+
+    def serve(self):
+        '''
+        body of the child process
+        '''
+        part = self.part
+        os.close(self.wake_w)
+        try:
+            if self.threaded:
+                target = part.update
+                if self.update_hz:
+                    target = self.update_at_rate
+                t = threading.Thread(target=target, name=self.name)
+                t.daemon = True
+                t.start()
+                method = part.run_threaded
+            else:
+                method = part.run
+
+            while True:
+                # one run for any number of requests queued up
+                if not os.read(self.wake_r, 4096) or self.stopping.value:
+                    break
+                values = method(*[channel.read() for channel in self.inputs])
+                if values is None:
+                    # keep the last outputs, as the drive loop does
+                    continue
+                if len(self.outputs) == 1:
+                    values = (values,)
+                for channel, value in zip(self.outputs, values):
+                    channel.write(value)
+        except Exception:
+            traceback.print_exc()
+        finally:
+            shutdown = getattr(part, 'shutdown', None)
+            if shutdown is not None:
+                shutdown()
+
+    def update_at_rate(self):
+        period = 1.0 / self.update_hz
+        deadline = time.monotonic()
+        while not self.stopping.value:
+            self.part.update_once()
+            deadline = max(deadline + period, time.monotonic())
+            time.sleep(max(0.0, deadline - time.monotonic()))
+
+    def shutdown(self, timeout=2.0):
+        self.stopping.value = 1
+        try:
+            os.write(self.wake_w, b'\0')
+        except BlockingIOError:
+            pass
+        os.close(self.wake_w)
+        if self.wake_r is not None:
+            os.close(self.wake_r)
+        if self.process.pid is not None:
+            self.process.join(timeout)
+            if self.process.is_alive():
+                print('Terminating process of part {}'.format(self.name))
+                self.process.terminate()
+                self.process.join()
+        for channel in self.inputs + self.outputs:
+            channel.close(unlink=True)
@@ -0,0 +1,456 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Profiling of the parts run by the Vehicle drive loop.
+
+Timings are kept in fixed-memory streaming histograms, so the profiler can
+stay on for a whole session without growing or slowing down.
+
+Memory allocations can be tracked too, with tracemalloc, to find the part
+that leaks or churns memory in a long session. Tracing slows down every
+allocation of the process, so it is off unless asked for.
+"""
+import inspect
+import json
+import threading
+import time
+import tracemalloc
+from prettytable import PrettyTable
+
+
+def part_name(p):
+    """
+    Name of a part in reports and traces: its class name, unless the part
+    stands in for another one and gives a report_name.
+    """
+    return getattr(p, 'report_name', None) or p.__class__.__name__
+
+
+class StreamingHistogram:
+    """
+    Fixed-memory log-linear histogram in the style of HdrHistogram.
+
+    Values are non-negative integers, nanoseconds in the profiler. Every
+    power of two is split into 2 ** sub_bucket_bits linear buckets, so
+    percentiles are within 2 ** -sub_bucket_bits relative error (about 3%
+    by default) whatever the number of samples, and recording is O(1).
+    Values of 2 ** max_bits and more are counted in the last bucket.
+    """
+    def __init__(self, sub_bucket_bits=5, max_bits=40):
+        self.sub_bucket_bits = sub_bucket_bits
+        self.max_bits = max_bits
+        self.counts = [0] * ((max_bits - sub_bucket_bits + 1) << sub_bucket_bits)
+        self.highest = (1 << max_bits) - 1
+        self.count = 0
+        self.total = 0
+        self.min = self.highest
+        self.max = 0
+
+    def index(self, value):
+        shift = value.bit_length() - self.sub_bucket_bits
+        if shift <= 0:
+            return value
+        return (shift << self.sub_bucket_bits) + (value >> shift)
+
+    def bucket_value(self, index):
+        # the middle of the range of values counted in a bucket
+        shift = index >> self.sub_bucket_bits
+        if shift == 0:
+            return index
+        sub = index & ((1 << self.sub_bucket_bits) - 1)
+        return (sub << shift) + (1 << (shift - 1))
+
+    def record(self, value):
+        if value < 0:
+            value = 0
+        elif value > self.highest:
+            value = self.highest
+        shift = value.bit_length() - self.sub_bucket_bits
+        if shift <= 0:
+            self.counts[value] += 1
+        else:
+            self.counts[(shift << self.sub_bucket_bits) + (value >> shift)] += 1
+        self.count += 1
+        self.total += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, pct):
+        if self.count == 0:
+            return 0
+        target = max(1, int(round(pct / 100.0 * self.count)))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(max(self.bucket_value(index), self.min), self.max)
+        return self.max
+
+    def copy(self):
+        hist = StreamingHistogram.__new__(StreamingHistogram)
+        hist.__dict__.update(self.__dict__)
+        hist.counts = list(self.counts)
+        return hist
+
+
+class AllocationStats:
+    """
+    Memory allocated by the sampled calls of a part method, in bytes.
+
+    net is what the calls allocated and did not free by the time they
+    returned, summed over the samples, so a part that keeps growing a list
+    or a cache shows a net that keeps growing. peak is the most memory in
+    use during a call above what was in use before it, the churn of the
+    part. tracemalloc counts the allocations of the whole process, so
+    other threads allocating at the same time are counted in too.
+    """
+    def __init__(self):
+        self.samples = 0
+        self.net = 0
+        self.peak_total = 0
+        self.peak_max = 0
+
+    def record(self, net, peak):
+        self.samples += 1
+        self.net += net
+        self.peak_total += peak
+        if peak > self.peak_max:
+            self.peak_max = peak
+
+    def copy(self):
+        stats = AllocationStats()
+        stats.__dict__.update(self.__dict__)
+        return stats
+
+
+class PartProfiler:
+    def __init__(self):
+        self.records = {}
+        self.counters = {}
+        self.handoffs = {}
+        self.starts = {}
+        self.loop = StreamingHistogram()
+        self.alloc_every = None
+        self.allocations = {}
+        self.alloc_baseline = None
+        self.alloc_started = False
+
+    def profile_part(self, p):
+        self.records[p] = StreamingHistogram()
+        self.counters[p] = {}
+
+    def recorder(self, p):
+        """
+        Return a function recording one run time of part p, in ns.
+        """
+        return self.records[p].record
+
+    def counter(self, p, name):
+        """
+        Return a function adding one, or its argument, to the counter of
+        events called name for part p, reported next to its timings.
+        """
+        counters = self.counters.setdefault(p, {})
+        counters.setdefault(name, 0)
+
+        def count(n=1):
+            counters[name] += n
+        return count
+
+    def profile_handoff(self, p, name, handoff):
+        """
+        Report the age of the values the drive loop takes from a Handoff of
+        part p, and how many were new, dropped or repeated.
+        """
+        ages = StreamingHistogram()
+
+        def on_take(handoff, age):
+            ages.record(int(age * 1e9))
+
+        handoff.on_take = on_take
+        self.handoffs.setdefault(p, []).append((name, handoff, ages))
+
+    def track_allocations(self, every=100, frames=1):
+        """
+        Start tracemalloc, keeping frames frames of each allocation, and
+        measure every every-th call of the methods wrapped with
+        measure_allocations(). The memory in use now is the baseline the
+        growth by source file is reported against.
+        """
+        self.alloc_every = max(1, int(every))
+        self.alloc_started = not tracemalloc.is_tracing()
+        if self.alloc_started:
+            tracemalloc.start(frames)
+        self.alloc_baseline = tracemalloc.take_snapshot()
+
+    def stop_allocations(self):
+        """ stop tracemalloc, if track_allocations() started it """
+        if self.alloc_started:
+            tracemalloc.stop()
+            self.alloc_started = False
+        self.alloc_baseline = None
+
+    def measure_allocations(self, p, method, label=None):
+        """
+        Wrap method of part p to measure the memory it allocates, on every
+        alloc_every-th call. Returns method itself when allocations are not
+        tracked.
+        """
+        if not self.alloc_every:
+            return method
+        stats = self.allocations.setdefault((p, label), AllocationStats())
+        every = self.alloc_every
+        calls = [0]
+        traced_memory = tracemalloc.get_traced_memory
+        # only from Python 3.9, peaks are since the start of tracing before
+        reset_peak = getattr(tracemalloc, 'reset_peak', None)
+
+        def measured(*args):
+            calls[0] += 1
+            if calls[0] % every:
+                return method(*args)
+            if reset_peak is not None:
+                reset_peak()
+            before = traced_memory()[0]
+            try:
+                return method(*args)
+            finally:
+                current, peak = traced_memory()
+                stats.record(current - before,
+                             peak - before if reset_peak is not None else 0)
+
+        return measured
+
+    def allocation_snapshot(self):
+        """ copy the allocation stats, as (name, stats) pairs """
+        allocations = []
+        for (p, label), stats in list(self.allocations.items()):
+            name = part_name(p)
+            if label:
+                name += '.' + label
+            allocations.append((name, stats.copy()))
+        return allocations
+
+    def on_part_start(self, p):
+        self.starts[p] = time.perf_counter_ns()
+
+    def on_part_finished(self, p):
+        self.records[p].record(time.perf_counter_ns() - self.starts.pop(p))
+
+    def on_loop(self, duration):
+        self.loop.record(duration)
+
+    def snapshot(self):
+        """
+        Copy the histograms, so they can be reported from another thread
+        while the drive loop keeps recording.
+        """
+        parts = []
+        for p, hist in list(self.records.items()):
+            counters = dict(self.counters.get(p, {}))
+            # counters kept by the part itself, like a queue depth
+            profile_counters = getattr(p, 'profile_counters', None)
+            if profile_counters is not None:
+                counters.update(profile_counters())
+            handoffs = self.handoffs.get(p, [])
+            for name, handoff, _ in handoffs:
+                counters[name + ' new'] = handoff.new
+                counters[name + ' dropped'] = handoff.dropped
+                counters[name + ' drop %'] = 100.0 * handoff.drop_rate
+            parts.append((part_name(p), hist.copy(), counters))
+            for name, _, ages in handoffs:
+                parts.append(('%s.%s age' % (part_name(p), name),
+                              ages.copy(), {}))
+        return parts + [('(loop)', self.loop.copy(), {})]
+
+    def report(self, snapshot=None, allocations=None):
+        if snapshot is None:
+            snapshot = self.snapshot()
+            allocations = self.allocation_snapshot()
+        print("Part Profile Summary: (times in ms)")
+        pt = PrettyTable()
+        field_names = ["part", "max", "min", "avg"]
+        pctile = [50, 90, 99, 99.9]
+        field_names += [str(p) + '%' for p in pctile]
+        with_counters = any(counters for _, _, counters in snapshot)
+        if with_counters:
+            field_names.append("counters")
+        pt.field_names = field_names
+        for name, hist, counters in snapshot:
+            if hist.count == 0 and not counters:
+                continue
+            row = [name,
+                   "%.2f" % (hist.max / 1e6),
+                   "%.2f" % (hist.min / 1e6),
+                   "%.2f" % (hist.mean / 1e6)]
+            row += ["%.2f" % (hist.percentile(p) / 1e6) for p in pctile]
+            if with_counters:
+                row.append(", ".join(
+                    ("%s %.1f" if isinstance(value, float) else "%s %d")
+                    % (key, value) for key, value in sorted(counters.items())))
+            pt.add_row(row)
+        print(pt)
+        if allocations:
+            self.report_allocations(allocations)
+
+    def report_allocations(self, allocations):
+        print("Part Allocations: (KB, every {} calls sampled)"
+              .format(self.alloc_every))
+        pt = PrettyTable()
+        pt.field_names = ["part", "samples", "net", "net/call",
+                          "peak avg", "peak max"]
+        for name, stats in allocations:
+            if not stats.samples:
+                continue
+            pt.add_row([name, stats.samples,
+                        "%.1f" % (stats.net / 1024),
+                        "%.2f" % (stats.net / stats.samples / 1024),
+                        "%.1f" % (stats.peak_total / stats.samples / 1024),
+                        "%.1f" % (stats.peak_max / 1024)])
+        print(pt)
+
+    def allocation_growth(self, parts, limit=10):
+        """
+        The source files whose allocations changed the most since
+        track_allocations(), as (file, parts defined in it, size change,
+        block count change, size) rows. This counts the memory allocated on
+        any thread, like the threads of the web server or the workers of
+        budgeted parts. Take it before reporting, as formatting the reports
+        allocates too.
+        """
+        if self.alloc_baseline is None or not tracemalloc.is_tracing():
+            return []
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, tracemalloc.__file__),
+             tracemalloc.Filter(False, '<frozen importlib._bootstrap*>')])
+        files = {}
+        for p in parts:
+            try:
+                path = inspect.getsourcefile(type(p))
+            except (TypeError, OSError):
+                # built in, or defined in an interactive session
+                continue
+            files.setdefault(path, set()).add(part_name(p))
+        rows = []
+        for stat in snapshot.compare_to(self.alloc_baseline, 'filename')[:limit]:
+            path = stat.traceback[0].filename
+            rows.append((path, sorted(files.get(path, [])), stat.size_diff,
+                         stat.count_diff, stat.size))
+        return rows
+
+    def report_allocation_growth(self, growth):
+        if not growth:
+            return
+        print("Allocation Growth by Source File: (KB since the start)")
+        pt = PrettyTable()
+        pt.field_names = ["file", "parts", "growth", "blocks", "size"]
+        pt.align["file"] = "l"
+        for path, names, size_diff, count_diff, size in growth:
+            pt.add_row([path, ", ".join(names), "%.1f" % (size_diff / 1024),
+                        "%+d" % count_diff, "%.1f" % (size / 1024)])
+        print(pt)
+
+
+class Tracer:
+    """
+    Records when each part runs, for viewing as a timeline.
+
+    Spans go into a preallocated buffer per thread, so recording takes no
+    lock, and are written out as Chrome trace-event JSON that Perfetto
+    (ui.perfetto.dev) or chrome://tracing can open. Each thread keeps at
+    most max_events spans, later ones are counted as dropped. The cost of
+    recording a span is measured when the tracer is created and saved with
+    the trace.
+    """
+    def __init__(self, max_events=200000):
+        self.max_events = max_events
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.buffers = []
+        self.start_ns = time.perf_counter_ns()
+        self.overhead_ns = self.calibrate()
+
+    def calibrate(self, n=10000):
+        # time n spans into a scratch buffer, then throw them away
+        record = self.recorder('calibrate')
+        start = time.perf_counter_ns()
+        for _ in range(n):
+            now = time.perf_counter_ns()
+            record(now, now)
+        overhead = (time.perf_counter_ns() - start) / n
+        with self.lock:
+            self.buffers.remove(self.local.buffer)
+        del self.local.buffer
+        return overhead
+
+    def buffer(self):
+        try:
+            return self.local.buffer
+        except AttributeError:
+            thread = threading.current_thread()
+            buf = TraceBuffer(thread.name, thread.ident, self.max_events)
+            with self.lock:
+                self.buffers.append(buf)
+            self.local.buffer = buf
+            return buf
+
+    def recorder(self, name):
+        """
+        Return a function recording a span of name from start to end, both
+        time.perf_counter_ns() values, on the calling thread.
+        """
+        def record(start, end):
+            buf = self.buffer()
+            if buf.size < buf.max_events:
+                buf.spans[buf.size] = (name, start, end)
+                buf.size += 1
+            else:
+                buf.dropped += 1
+        return record
+
+    @property
+    def dropped(self):
+        return sum(buf.dropped for buf in self.buffers)
+
+    def events(self):
+        events = []
+        pid = 1
+        for buf in list(self.buffers):
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid,
+                           'tid': buf.ident, 'args': {'name': buf.name}})
+            for name, start, end in buf.spans[:buf.size]:
+                events.append({'name': name, 'ph': 'X', 'pid': pid,
+                               'tid': buf.ident,
+                               'ts': (start - self.start_ns) / 1000.0,
+                               'dur': (end - start) / 1000.0})
+        return events
+
+    def save(self, path):
+        events = self.events()
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events,
+                       'displayTimeUnit': 'ms',
+                       'otherData': {'overhead_ns_per_span': self.overhead_ns,
+                                     'dropped_spans': self.dropped}}, f)
+        print('Saved trace of {} spans to {} (recording overhead {:.2f} ms, {} dropped)'
+              .format(len(events), path,
+                      len(events) * self.overhead_ns / 1e6, self.dropped))
+
+
+class TraceBuffer:
+    """
+    Spans recorded by one thread.
+    """
+    def __init__(self, name, ident, max_events):
+        self.name = name
+        self.ident = ident
+        self.max_events = max_events
+        self.spans = [None] * max_events
+        self.size = 0
+        self.dropped = 0
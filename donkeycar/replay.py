@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Replay of a recorded tub through a vehicle, without the car.
+
+TubReplay is a part giving the channels of a tub one record per drive
+loop, in the order they were recorded, in place of the camera and the
+controller. The rest of the drive loop, the preprocessing, the pilot, the
+drive mode and the tub writer, runs as it does on the car, so it can be
+benchmarked and regression tested on a laptop:
+
+    replay = TubReplay('data/tub_1_20-08-01', realtime=False)
+    V = dk.vehicle.Vehicle()
+    V.add(replay, outputs=replay.keys, tick_on_frame=True)
+    ...
+    V.add(TubWriter('data/replayed', inputs, types, clock=replay.clock),
+          inputs=inputs, outputs=['tub/num_records'])
+    replay.drive(V)
+
+By default the loop runs as fast as the parts allow. With realtime=True it
+is paced by the timestamps of the records instead, speed times faster than
+they were recorded.
+
+replay.clock tells the time of the record being replayed. Parts given it
+as their clock, like a tub writer or AiLaunch, see the same time as on the
+car, and a tub written during the replay gets the same start and record
+timestamps as the one replayed. For parts that take no clock, the clock can
+stand in for time.time() within a with block:
+
+    with replay.clock:
+        replay.drive(V)
+
+This replaces time.time for the whole process, every thread included, and
+is best kept to replays run on their own. Modules that imported the
+function itself, with `from time import time`, keep the wall clock.
+"""
+import time
+
+from donkeycar.parts.datastore import TubReader
+
+
+class VirtualClock:
+    """
+    A stand-in for time.time() telling the time of the record being
+    replayed, to give as the clock of the parts taking one. Used as a
+    context manager, it replaces time.time() of the whole process until the
+    end of the block, which can not be nested.
+    """
+    def __init__(self, now):
+        self.now = now
+        self.real_time = None
+
+    def __call__(self):
+        return self.now
+
+    def __enter__(self):
+        if isinstance(time.time, VirtualClock):
+            raise RuntimeError('time.time is replaced by a clock already')
+        self.real_time = time.time
+        time.time = self
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            time.time = self.real_time
+        finally:
+            self.real_time = None
+
+
+class TubReplay:
+    """
+    Part giving the values of keys from each record of the tub at path, one
+    record per run, oldest first.
+
+    Parameters
+    ----------
+        path : str
+            The tub to replay.
+        keys : list
+            The channels to give, all the inputs of the tub by default.
+        realtime : bool
+            Pace the drive loop by the record timestamps rather than run
+            it as fast as it goes. Add the part with tick_on_frame=True.
+        speed : float
+            With realtime, how many times faster than recorded to replay.
+    """
+    def __init__(self, path, keys=None, realtime=False, speed=1.0):
+        self.reader = TubReader(path)
+        self.keys = keys or list(self.reader.inputs)
+        self.realtime = realtime
+        self.speed = speed
+        self.clock = VirtualClock(self.reader.start_time)
+        self.next_record = None
+        self.first_ms = None
+        self.wall_start = None
+        self.count = 0
+        self.elapsed = None
+        # the vehicle to stop after the last record, set by drive()
+        self.vehicle = None
+
+    def __len__(self):
+        return len(self.reader.read_index)
+
+    @property
+    def done(self):
+        return self.count >= len(self)
+
+    @property
+    def rate_hz(self):
+        """ the mean record rate of the tub, 20 Hz when it can not tell """
+        index = self.reader.read_index
+        if len(index) < 2:
+            return 20
+        first = self.reader.get_json_record(index[0])['milliseconds']
+        last = self.reader.get_json_record(index[-1])['milliseconds']
+        if last <= first:
+            return 20
+        return (len(index) - 1) * 1000.0 / (last - first)
+
+    def peek(self):
+        if self.next_record is None:
+            self.next_record = self.reader.read_next()
+        return self.next_record
+
+    def run(self):
+        record = self.peek()
+        self.next_record = None
+        if record is None:
+            values = [None] * len(self.keys)
+        else:
+            self.count += 1
+            ms = record['milliseconds']
+            if self.first_ms is None:
+                self.first_ms = ms
+                self.wall_start = time.monotonic()
+            self.clock.now = self.reader.start_time + ms / 1000.0
+            values = [record.get(key) for key in self.keys]
+            if self.done and self.vehicle is not None:
+                # the parts after the replay still run on the last record
+                self.vehicle.on = False
+        if len(values) == 1:
+            return values[0]
+        return values
+
+    def wait_for_frame(self, timeout=None):
+        """
+        Called by the drive loop before the next tick. Returns right away,
+        unless realtime is set, then sleeps until the next record is due,
+        however long past timeout that is, so no record is skipped or given
+        twice.
+        """
+        if not self.realtime or self.wall_start is None:
+            return True
+        record = self.peek()
+        if record is None:
+            return True
+        due = self.wall_start + \
+            (record['milliseconds'] - self.first_ms) / 1000.0 / self.speed
+        delay = due - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        return True
+
+    def drive(self, V, **kwargs):
+        """
+        Start the vehicle V and stop it once every record was replayed.
+        Keyword arguments go to Vehicle.start, rate_hz defaults to the
+        record rate of the tub.
+        """
+        assert any(entry['part'] is self and entry['tick_on_frame']
+                   for entry in V.parts), \
+            "add the replay to the vehicle with tick_on_frame=True"
+        assert len(self) > 0, "no records to replay in %s" % self.reader.path
+        kwargs.setdefault('rate_hz', self.rate_hz)
+        start = time.perf_counter()
+        self.vehicle = V
+        try:
+            V.start(**kwargs)
+        finally:
+            self.vehicle = None
+        self.elapsed = time.perf_counter() - start
+        recorded = (self.clock.now - self.reader.start_time) - \
+            (self.first_ms or 0) / 1000.0
+        print('Replayed {} records in {:.2f}s, {:.1f} records/s, {:.1f}x the '
+              'recorded speed'.format(self.count, self.elapsed,
+                                      self.count / self.elapsed,
+                                      recorded / self.elapsed))
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+CPU affinity and real-time priority for the threads of a vehicle.
+
+On Linux every thread can be given its own set of cores and scheduling
+policy. Pinning the drive loop to a core of its own, away from the camera,
+the inference thread pool and the web server, keeps them from preempting
+it, and SCHED_FIFO lets it run the moment its sleep ends.
+"""
+import os
+import threading
+
+
+class SchedulingProfile:
+    """
+    Where the threads of a vehicle run.
+
+    Parameters
+    ----------
+        default_cpus : list
+            Cores for the whole process, set by apply_to_process() before
+            the model and the part threads are created, so every thread
+            not pinned otherwise, the TensorFlow thread pools included,
+            inherits them.
+        loop_cpus : list
+            Cores for the drive loop thread.
+        part_cpus : dict
+            Cores for the update thread of threaded parts, by part class
+            name.
+        realtime_priority : int
+            When given, run the drive loop thread under SCHED_FIFO at this
+            priority (1-99). Needs root or CAP_SYS_NICE; without them the
+            loop keeps the normal policy and a warning is printed.
+        inference_threads : int
+            Number of threads TensorFlow and TFLite use for inference,
+            set by apply_to_inference() before the model is built.
+    """
+    def __init__(self, default_cpus=None, loop_cpus=None, part_cpus=None,
+                 realtime_priority=None, inference_threads=None):
+        self.default_cpus = default_cpus
+        self.loop_cpus = loop_cpus
+        self.part_cpus = part_cpus or {}
+        self.realtime_priority = realtime_priority
+        self.inference_threads = inference_threads
+
+    @classmethod
+    def from_config(cls, settings):
+        """ make a profile from a dict like the SCHED_PROFILE config """
+        if not settings:
+            return None
+        return cls(**settings)
+
+    def apply_to_process(self):
+        """
+        Pin the calling thread, and so the threads it creates from now on,
+        to default_cpus, and record the thread count of TFLite pilots.
+        TensorFlow is not imported here, so the pilot can still be loaded
+        in the background.
+        """
+        if self.default_cpus:
+            set_affinity(self.default_cpus, 'process')
+        if self.inference_threads:
+            set_tflite_threads(self.inference_threads)
+
+    def apply_to_inference(self):
+        """ called from the thread loading the pilot, before it builds it """
+        if self.inference_threads:
+            set_tensorflow_threads(self.inference_threads)
+
+    def apply_to_loop(self):
+        """ called from the drive loop thread when the vehicle starts """
+        if self.loop_cpus:
+            set_affinity(self.loop_cpus, 'drive loop')
+        if self.realtime_priority:
+            set_realtime(self.realtime_priority, 'drive loop')
+
+    def apply_to_part(self, name):
+        """ called from the update thread of a threaded part """
+        cpus = self.part_cpus.get(name)
+        if cpus:
+            set_affinity(cpus, name)
+
+
+def set_affinity(cpus, name):
+    """
+    Pin the calling thread to cpus. Returns whether it could.
+    """
+    if not hasattr(os, 'sched_setaffinity'):
+        print('WARN::Scheduling: no CPU affinity on this platform for {}'
+              .format(name))
+        return False
+    try:
+        # on Linux, pid 0 is the calling thread, not the whole process
+        os.sched_setaffinity(0, cpus)
+    except (OSError, ValueError) as e:
+        print('WARN::Scheduling: could not pin {} to cores {}: {}'
+              .format(name, list(cpus), e))
+        return False
+    print('Pinned {} (thread {}) to cores {}'.format(
+        name, threading.get_ident(), sorted(os.sched_getaffinity(0))))
+    return True
+
+
+def set_realtime(priority, name):
+    """
+    Run the calling thread under SCHED_FIFO at priority. Returns whether it
+    was permitted.
+    """
+    if not hasattr(os, 'SCHED_FIFO'):
+        print('WARN::Scheduling: no SCHED_FIFO on this platform for {}'
+              .format(name))
+        return False
+    try:
+        os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(priority))
+    except (OSError, ValueError) as e:
+        print('WARN::Scheduling: could not make {} real-time ({}). '
+              'Run as root or give python CAP_SYS_NICE.'.format(name, e))
+        return False
+    print('{} runs with SCHED_FIFO priority {}'.format(name, priority))
+    return True
+
+
+def set_tensorflow_threads(num_threads):
+    """
+    Set the TensorFlow intra- and inter-op thread pools to num_threads. This
+    only has an effect before TensorFlow runs its first op. TFLite pilots
+    take the count through tflite_threads().
+    """
+    set_tflite_threads(num_threads)
+    try:
+        import tensorflow as tf
+    except ImportError:
+        return
+    try:
+        tf.config.threading.set_intra_op_parallelism_threads(num_threads)
+        tf.config.threading.set_inter_op_parallelism_threads(num_threads)
+    except (AttributeError, RuntimeError) as e:
+        print('WARN::Scheduling: could not set TensorFlow threads: {}'
+              .format(e))
+
+
+_tflite_threads = None
+
+
+def set_tflite_threads(num_threads):
+    """ set the thread count returned by tflite_threads() """
+    global _tflite_threads
+    _tflite_threads = num_threads
+
+
+def tflite_threads():
+    """ thread count for TFLite interpreters, None for its default """
+    return _tflite_threads
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Timing of the start of a vehicle, from the import of donkeycar to the
+first drive loop that has everything it needs.
+
+On a Pi most of the start goes into importing TensorFlow, loading the model
+and waiting for the camera. The profiler records how long each of these
+took, and runs the independent ones on threads of their own with submit(),
+so they overlap.
+
+The module keeps one StartupProfiler, `profiler`, for the process:
+
+    from donkeycar import startup
+
+    with startup.profiler.span('import pilot', 'import'):
+        from donkeycar.parts.keras import KerasLinear
+    pilot = startup.profiler.submit('pilot', load_pilot)
+    ...
+    V.add(pilot.result(), ...)
+
+Vehicle.add records the time since the last part as the construction time
+of each part, and Vehicle.start reports the whole start once the first
+drivable loop ran.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from prettytable import PrettyTable
+
+
+class StartupProfiler:
+    """
+    Spans of the start of the process, in seconds from the import of
+    donkeycar, and the time of milestones like the first camera frame.
+    """
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self.last = self.t0
+        self.spans = []
+        self.milestones = {}
+        self.lock = threading.Lock()
+        self.executor = None
+        self.reported = False
+
+    def add_span(self, name, kind, start, end):
+        with self.lock:
+            self.spans.append((name, kind, threading.current_thread().name,
+                               start, end))
+            if threading.current_thread() is threading.main_thread():
+                self.last = max(self.last, end)
+
+    @contextmanager
+    def span(self, name, kind='step'):
+        """ context manager timing the code in its block """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_span(name, kind, start, time.perf_counter())
+
+    def part_added(self, name):
+        """
+        Record the time since the last span or part on the main thread as
+        the import and construction time of the part called name.
+        """
+        if threading.current_thread() is not threading.main_thread():
+            return
+        now = time.perf_counter()
+        self.add_span(name, 'part', self.last, now)
+
+    def submit(self, name, fn, *args, **kwargs):
+        """
+        Call fn(*args, **kwargs) on a startup thread, timed as name, while
+        the caller goes on setting up the other parts. Returns a
+        concurrent.futures.Future, whose result() re-raises the errors.
+        """
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=4,
+                                               thread_name_prefix='startup')
+
+        def timed():
+            with self.span(name, 'background'):
+                return fn(*args, **kwargs)
+
+        return self.executor.submit(timed)
+
+    def milestone(self, name):
+        """ record the first time name happened """
+        with self.lock:
+            self.milestones.setdefault(name, time.perf_counter())
+
+    def elapsed(self, name):
+        """ seconds from the start to milestone name, None before it """
+        t = self.milestones.get(name)
+        return None if t is None else t - self.t0
+
+    def report(self):
+        """ print the spans and milestones, once per process """
+        with self.lock:
+            if self.reported:
+                return
+            self.reported = True
+            spans = sorted(self.spans, key=lambda span: span[3])
+            milestones = sorted(self.milestones.items(), key=lambda m: m[1])
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+
+        print("Startup Profile: (times in s from the import of donkeycar)")
+        pt = PrettyTable()
+        pt.field_names = ['step', 'kind', 'thread', 'start', 'took']
+        pt.align['step'] = 'l'
+        for name, kind, thread, start, end in spans:
+            pt.add_row([name, kind, thread, '%.2f' % (start - self.t0),
+                        '%.2f' % (end - start)])
+        for name, t in milestones:
+            pt.add_row([name, 'milestone', '', '%.2f' % (t - self.t0), ''])
+        print(pt)
+
+
+profiler = StartupProfiler()
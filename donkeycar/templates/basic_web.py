@@ -47,8 +47,7 @@ def drive(cfg, model_path=None, model_type=None):
    
     V.add(LocalWebController(), 
           inputs=['cam/image_array'],
-          outputs=['user/angle', 'user/throttle', 'user/mode', 'recording'],
-          threaded=True)
+          outputs=['user/angle', 'user/throttle', 'user/mode', 'recording'])
 
    
     #See if we should even run the pilot module. 
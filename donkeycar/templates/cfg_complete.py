@@ -39,6 +39,31 @@ DEFAULT_MODEL_TYPE = 'coral_tflite_linear'   #(linear|tflite_linear|coral_tflite
 #VEHICLE
 DRIVE_LOOP_HZ = 50      # the vehicle loop will pause if faster than this speed.
 MAX_LOOPS = None        # the vehicle loop can abort after this many iterations, when given a positive integer.
+DRIVE_LOOP_OVERRUN_POLICY = 'drop' # (drop|catch_up) when a loop runs late, skip the missed ticks or run them back to back.
+LOW_RATE_PARTS_HZ = 5   # rate of the parts that do not need every loop: LED logic, record tracker, OLED and the speed/angle adjust parts. None runs them every loop.
+DRIVE_LOOP_PARALLEL = False # when true, parts that share no inputs/outputs run concurrently on a thread pool each loop.
+DRIVE_LOOP_TRACE_PATH = None # when set to a file path, a Chrome trace-event timeline of the parts is saved there on exit. View it in ui.perfetto.dev
+DRIVE_LOOP_SYNC_ON_FRAME = False # when true, each loop starts as soon as the camera delivers a new frame instead of at DRIVE_LOOP_HZ, so the pilot never sees a stale or repeated frame.
+DRIVE_LOOP_FRAME_TIMEOUT = None # with DRIVE_LOOP_SYNC_ON_FRAME, seconds to wait for a frame before running the loop anyway. None waits two DRIVE_LOOP_HZ periods.
+RECORD_BUDGET = None    # seconds the loop waits for the tub writer, like 0.01. a slower write keeps going in the background and steering/throttle are not held up. None waits for every write.
+TUB_FORMAT = 'catalog'  # (catalog|json) catalog appends the records to a few chunk files. json writes a record_N.json file per record, like older tubs. both are read either way.
+TUB_CHUNK_RECORDS = 1000 # records per catalog chunk file.
+TUB_FLUSH_EVERY = 1     # flush the catalog to the OS every N records. records not flushed are lost if the program crashes.
+TUB_FSYNC = 'chunk'     # (flush|chunk|never) when the catalog is forced to the SD card: on every flush, when a chunk is full and on exit, or never.
+TUB_WRITE_QUEUE = 0     # records queued for writing in the background. 0 writes each record within the drive loop.
+TUB_WRITE_WORKERS = 1   # threads encoding and writing the queued records.
+TUB_WRITE_POLICY = 'drop_oldest' # (drop_oldest|drop_newest|block) what to do with a record when the queue is full.
+TUB_COLUMNS = True      # write the channels of the tub to a column sidecar on exit, loaded for training without reading every record.
+TELEMETRY_BUDGET = 0.005 # seconds the loop waits for the jpeg encoding of the published camera images (PUB_CAMERA_IMAGES). None waits for it. the images are sent on the event loop of the vehicle.
+DISTANCE_SENSOR_PROCESS = False # when true, the distance sensor loop runs in a child process of its own, so its busy waiting does not hold the GIL of the drive loop.
+DISTANCE_SENSOR_UPDATE_HZ = 100 # the distance sensors are measured at most this often, instead of in a loop that keeps a core busy. None measures continuously.
+OVERLOAD_CONTROL = False # when true, load is shed when the loop can not keep DRIVE_LOOP_HZ, and restored when it can again. The state is recorded in the tub as overload/level and overload/shed.
+OVERLOAD_SHED_ORDER = ['low_rate_parts', 'fpv', 'recording', 'loop_hz'] # what to shed first: slow down the LOW_RATE_PARTS_HZ parts, pause the web FPV video, record every other loop, run the loop at 3/4 of DRIVE_LOOP_HZ.
+SCHED_PROFILE = None    # cores and priority of the vehicle threads on Linux, e.g. for a 4 core Pi:
+                        # {'default_cpus': [0, 1], 'loop_cpus': [3], 'part_cpus': {'PiCamera': [2]}, 'realtime_priority': 50, 'inference_threads': 2}
+                        # realtime_priority runs the drive loop under SCHED_FIFO and needs root or CAP_SYS_NICE. inference_threads sets the TensorFlow/TFLite thread counts.
+PRUNE_DEAD_PARTS = False # when true, parts whose outputs no other part reads are skipped. unread, unwritten and twice written channels are printed at start either way.
+ALLOC_SAMPLE_EVERY = None # when set to N, memory allocations are traced and every Nth run of each part is measured. net and peak KB per part are printed on exit, with the source files that grew most. slows the car down, use it to find leaks.
 
 
 #CAMERA
@@ -260,6 +285,7 @@ DONKEY_GYM_ENV_NAME = "donkey-mountain-track-v0" # ("donkey-generated-track-v0"|
 GYM_CONF = { "body_style" : "donkey", "body_rgb" : (128, 128, 128), "car_name" : "me", "font_size" : 100} # body style(donkey|bare|car01) body rgb 0-255
 SIM_HOST = "127.0.0.1"              # when racing on virtual-race-league use host "trainmydonkey.com"
 SIM_ARTIFICIAL_LATENCY = 0          # this is the millisecond latency in controls. Can use useful in emulating the delay when useing a remote server. values of 100 to 400 probably reasonable.
+SIM_UPDATE_HZ = 60                  # the simulator is stepped at most this often by its thread, rather than as fast as it answers. None steps continuously.
 
 #publish camera over network
 #This is used to create a tcp service to pushlish the camera feed
@@ -22,6 +22,7 @@ from docopt import docopt
 import numpy as np
 
 import donkeycar as dk
+from donkeycar import startup
 
 #import parts
 from donkeycar.parts.transform import Lambda, TriggeredCallback, DelayedTrigger
@@ -60,9 +61,88 @@ def drive(cfg, model_path=None, use_joystick=False, model_type=None, camera_type
         else:
             model_type = cfg.DEFAULT_MODEL_TYPE
 
+    # コア割り当て、モデル読み込みやスレッド作成より前に設定する
+    from donkeycar.scheduling import SchedulingProfile
+    sched_profile = SchedulingProfile.from_config(cfg.SCHED_PROFILE)
+    if sched_profile is not None:
+        sched_profile.apply_to_process()
+
+    def load_model(kl, model_path):
+        start = time.time()
+        print('loading model', model_path)
+        kl.load(model_path)
+        print('finished loading in %s sec.' % (str(time.time() - start)) )
+
+    def load_weights(kl, weights_path):
+        start = time.time()
+        try:
+            print('loading model weights', weights_path)
+            kl.model.load_weights(weights_path)
+            print('finished loading in %s sec.' % (str(time.time() - start)) )
+        except Exception as e:
+            print(e)
+            print('ERR>> problems loading weights', weights_path)
+
+    def load_model_json(kl, json_fnm):
+        start = time.time()
+        print('loading model json', json_fnm)
+        from tensorflow.python import keras
+        try:
+            with open(json_fnm, 'r') as handle:
+                contents = handle.read()
+                kl.model = keras.models.model_from_json(contents)
+            print('finished loading json in %s sec.' % (str(time.time() - start)) )
+        except Exception as e:
+            print(e)
+            print("ERR>> problems loading model json", json_fnm)
+
+    def load_pilot():
+        # TensorFlowのスレッド数はモデルを作る前に設定する
+        if sched_profile is not None:
+            sched_profile.apply_to_inference()
+
+        #When we have a model, first create an appropriate Keras part
+        kl = dk.utils.get_model_by_type(model_type, cfg)
+
+        if is_model_file:
+            #when we have a .h5 extension
+            #load everything from the model file
+            load_model(kl, model_path)
+        else:
+            #when we have a .json extension
+            #load the model from there and look for a matching
+            #.wts file with just weights
+            load_model_json(kl, model_path)
+            weights_path = model_path.replace('.json', '.weights')
+            load_weights(kl, weights_path)
+        return kl
+
+    if model_path:
+        is_model_file = '.h5' in model_path or '.uff' in model_path or 'tflite' in model_path or '.pkl' in model_path
+        if not is_model_file and '.json' not in model_path:
+            print("ERR>> Unknown extension type on model file!!")
+            return
+
     #Initialize car
     V = dk.vehicle.Vehicle()
 
+    # 子プロセスで動かすパーツはスレッドを起動する前にforkするので、
+    # モデル読み込みより先に追加する
+    # Distance sensor part  Nakagawa-add
+    from donkeycar.parts.DistanceSensorMulti4 import DistanceSensorMulti4
+    distanceSensorMultiPart4 = DistanceSensorMulti4()
+    V.add(distanceSensorMultiPart4,
+        outputs=['distanceLL','distanceL','distanceC','distanceR','distanceRR','prev_distanceLL', 'prev_distanceL', 'prev_distanceC', 'prev_distanceR','prev_distanceRR'],
+        #run_condition='user',
+        #run_condition='run_pilot',
+        threaded=True, process=cfg.DISTANCE_SENSOR_PROCESS,
+        update_hz=cfg.DISTANCE_SENSOR_UPDATE_HZ)
+
+    # TensorFlowのimportとモデル読み込みは時間がかかるので、カメラ等の
+    # 初期化と並行してバックグラウンドで行う
+    if model_path:
+        pilot_loading = startup.profiler.submit('load pilot model', load_pilot)
+
     print("cfg.CAMERA_TYPE", cfg.CAMERA_TYPE)
     if camera_type == "stereo":
 
@@ -106,11 +186,13 @@ def drive(cfg, model_path=None, use_joystick=False, model_type=None, camera_type
 
         inputs = []
         threaded = True
+        update_hz = None
         if cfg.DONKEY_GYM:
             from donkeycar.parts.dgym import DonkeyGymEnv 
             cam = DonkeyGymEnv(cfg.DONKEY_SIM_PATH, host=cfg.SIM_HOST, env_name=cfg.DONKEY_GYM_ENV_NAME, conf=cfg.GYM_CONF, delay=cfg.SIM_ARTIFICIAL_LATENCY)
             threaded = True
             inputs = ['angle', 'throttle']
+            update_hz = cfg.SIM_UPDATE_HZ
         elif cfg.CAMERA_TYPE == "PICAM":
             from donkeycar.parts.camera import PiCamera
             cam = PiCamera(image_w=cfg.IMAGE_W, image_h=cfg.IMAGE_H, image_d=cfg.IMAGE_DEPTH, framerate=cfg.CAMERA_FRAMERATE, vflip=cfg.CAMERA_VFLIP, hflip=cfg.CAMERA_HFLIP)
@@ -128,14 +210,18 @@ def drive(cfg, model_path=None, use_joystick=False, model_type=None, camera_type
             cam = V4LCamera(image_w=cfg.IMAGE_W, image_h=cfg.IMAGE_H, image_d=cfg.IMAGE_DEPTH, framerate=cfg.CAMERA_FRAMERATE)
         elif cfg.CAMERA_TYPE == "MOCK":
             from donkeycar.parts.camera import MockCamera
-            cam = MockCamera(image_w=cfg.IMAGE_W, image_h=cfg.IMAGE_H, image_d=cfg.IMAGE_DEPTH)
+            cam = MockCamera(image_w=cfg.IMAGE_W, image_h=cfg.IMAGE_H, image_d=cfg.IMAGE_DEPTH, framerate=cfg.CAMERA_FRAMERATE)
+            update_hz = cam.framerate
         elif cfg.CAMERA_TYPE == "IMAGE_LIST":
             from donkeycar.parts.camera import ImageListCamera
             cam = ImageListCamera(path_mask=cfg.PATH_MASK)
         else:
             raise(Exception("Unkown camera type: %s" % cfg.CAMERA_TYPE))
 
-        V.add(cam, inputs=inputs, outputs=['cam/image_array'], threaded=threaded)
+        # カメラのフレーム到着でループを回す
+        tick_on_frame = cfg.DRIVE_LOOP_SYNC_ON_FRAME and hasattr(cam, 'wait_for_frame')
+        V.add(cam, inputs=inputs, outputs=['cam/image_array'], threaded=threaded,
+              tick_on_frame=tick_on_frame, update_hz=update_hz)
 
     if use_joystick or cfg.USE_JOYSTICK_AS_DEFAULT:
         #modify max_throttle closer to 1.0 to have more power
@@ -173,12 +259,12 @@ def drive(cfg, model_path=None, use_joystick=False, model_type=None, camera_type
     else:
         #This web controller will create a web server that is capable
         #of managing steering, throttle, and modes, and more.
+        #It runs on the event loop of the vehicle, see start_async.
         ctr = LocalWebController(port=cfg.WEB_CONTROL_PORT, mode=cfg.WEB_INIT_MODE)
         
         V.add(ctr,
           inputs=['cam/image_array', 'tub/num_records'],
-          outputs=['user/angle', 'user/throttle', 'user/mode', 'recording'],
-          threaded=True)
+          outputs=['user/angle', 'user/throttle', 'user/mode', 'recording'])
 
     #this throttle filter will allow one tap back for esc reverse
     th_filter = ThrottleFilter()
@@ -195,15 +281,6 @@ def drive(cfg, model_path=None, use_joystick=False, model_type=None, camera_type
 
     V.add(PilotCondition(), inputs=['user/mode'], outputs=['run_pilot'])
     
-    # Distance sensor part  Nakagawa-add
-    from donkeycar.parts.DistanceSensorMulti4 import DistanceSensorMulti4
-    distanceSensorMultiPart4 = DistanceSensorMulti4()
-    V.add(distanceSensorMultiPart4,
-        outputs=['distanceLL','distanceL','distanceC','distanceR','distanceRR','prev_distanceLL', 'prev_distanceL', 'prev_distanceC', 'prev_distanceR','prev_distanceRR'],
-        #run_condition='user',
-        #run_condition='run_pilot',
-        threaded=True)
-
     class LedConditionLogic:
         def __init__(self, cfg):
             self.cfg = cfg
@@ -248,7 +325,7 @@ def drive(cfg, model_path=None, use_joystick=False, model_type=None, camera_type
         led.set_rgb(cfg.LED_R, cfg.LED_G, cfg.LED_B)
 
         V.add(LedConditionLogic(cfg), inputs=['user/mode', 'recording', "records/alert", 'behavior/state', 'modelfile/modified', "pilot/loc"],
-              outputs=['led/blink_rate'])
+              outputs=['led/blink_rate'], rate_hz=cfg.LOW_RATE_PARTS_HZ)
 
         V.add(led, inputs=['led/blink_rate'])
 
@@ -288,7 +365,7 @@ def drive(cfg, model_path=None, use_joystick=False, model_type=None, camera_type
             return 0
 
     rec_tracker_part = RecordTracker()
-    V.add(rec_tracker_part, inputs=["tub/num_records"], outputs=['records/alert'])
+    V.add(rec_tracker_part, inputs=["tub/num_records"], outputs=['records/alert'], rate_hz=cfg.LOW_RATE_PARTS_HZ)
 
     if cfg.AUTO_RECORD_ON_THROTTLE and isinstance(ctr, JoystickController):
         #then we are not using the circle button. hijack that to force a record count indication
@@ -335,7 +412,7 @@ def drive(cfg, model_path=None, use_joystick=False, model_type=None, camera_type
 
     # Use the FPV preview, which will show the cropped image output, or the full frame.
     if cfg.USE_FPV:
-        V.add(WebFpv(), inputs=['cam/image_array'], threaded=True)
+        V.add(WebFpv(), inputs=['cam/image_array'])
 
     #Behavioral state
     if cfg.TRAIN_BEHAVIORS:
@@ -353,72 +430,30 @@ def drive(cfg, model_path=None, use_joystick=False, model_type=None, camera_type
         #Run the pilot if the mode is not user.
         inputs=[inf_input,
             'imu/mag_x', 'imu/mag_y']
+    elif model_type in ("rnn", "3d"):
+        #Read the image sequence from the vehicle memory history.
+        inputs=[inf_input + '[-%d:]' % cfg.SEQUENCE_LENGTH]
     else:
         inputs=[inf_input]
 
-    def load_model(kl, model_path):
-        start = time.time()
-        print('loading model', model_path)
-        kl.load(model_path)
-        print('finished loading in %s sec.' % (str(time.time() - start)) )
-
-    def load_weights(kl, weights_path):
-        start = time.time()
-        try:
-            print('loading model weights', weights_path)
-            kl.model.load_weights(weights_path)
-            print('finished loading in %s sec.' % (str(time.time() - start)) )
-        except Exception as e:
-            print(e)
-            print('ERR>> problems loading weights', weights_path)
-
-    def load_model_json(kl, json_fnm):
-        start = time.time()
-        print('loading model json', json_fnm)
-        from tensorflow.python import keras
-        try:
-            with open(json_fnm, 'r') as handle:
-                contents = handle.read()
-                kl.model = keras.models.model_from_json(contents)
-            print('finished loading json in %s sec.' % (str(time.time() - start)) )
-        except Exception as e:
-            print(e)
-            print("ERR>> problems loading model json", json_fnm)
-
     if model_path:
-        #When we have a model, first create an appropriate Keras part
-        kl = dk.utils.get_model_by_type(model_type, cfg)
-
-        model_reload_cb = None
-
-        if '.h5' in model_path or '.uff' in model_path or 'tflite' in model_path or '.pkl' in model_path:
-            #when we have a .h5 extension
-            #load everything from the model file
-            load_model(kl, model_path)
+        #the model was loaded in the background since the start of drive()
+        with startup.profiler.span('wait for pilot model'):
+            kl = pilot_loading.result()
 
+        if is_model_file:
             def reload_model(filename):
                 load_model(kl, filename)
 
             model_reload_cb = reload_model
 
-        elif '.json' in model_path:
-            #when we have a .json extension
-            #load the model from there and look for a matching
-            #.wts file with just weights
-            load_model_json(kl, model_path)
-            weights_path = model_path.replace('.json', '.weights')
-            load_weights(kl, weights_path)
-
+        else:
             def reload_weights(filename):
                 weights_path = filename.replace('.json', '.weights')
                 load_weights(kl, weights_path)
 
             model_reload_cb = reload_weights
 
-        else:
-            print("ERR>> Unknown extension type on model file!!")
-            return
-
         #this part will signal visual LED, if connected
         V.add(FileWatcher(model_path, verbose=True), outputs=['modelfile/modified'])
 
@@ -620,7 +655,8 @@ def drive(cfg, model_path=None, use_joystick=False, model_type=None, camera_type
 
     V.add(angle_speed_adjustclass,
         inputs = [],
-        outputs= ['angle_speed_adjust'])
+        outputs= ['angle_speed_adjust'],
+        rate_hz=cfg.LOW_RATE_PARTS_HZ)
 
 
     from donkeycar.parts.angle_adjust import angle_adjustclass #ステアリングの切れ角を調整する
@@ -632,7 +668,8 @@ def drive(cfg, model_path=None, use_joystick=False, model_type=None, camera_type
 
     V.add(angle_adjustclass,
         inputs = [],
-        outputs= ['angle_adjust'])
+        outputs= ['angle_adjust'],
+        rate_hz=cfg.LOW_RATE_PARTS_HZ)
 
 
 
@@ -648,7 +685,8 @@ def drive(cfg, model_path=None, use_joystick=False, model_type=None, camera_type
 
     V.add(speedadjustclass,
         inputs = [],
-        outputs= ['speedadjust'])
+        outputs= ['speedadjust'],
+        rate_hz=cfg.LOW_RATE_PARTS_HZ)
 
 
     class AiRunCondition:
@@ -762,7 +800,13 @@ def drive(cfg, model_path=None, use_joystick=False, model_type=None, camera_type
         from donkeycar.parts.oled import OLEDPart
         auto_record_on_throttle = cfg.USE_JOYSTICK_AS_DEFAULT and cfg.AUTO_RECORD_ON_THROTTLE
         oled_part = OLEDPart(cfg.SSD1306_128_32_I2C_BUSNUM, auto_record_on_throttle=auto_record_on_throttle)
-        V.add(oled_part, inputs=['recording', 'tub/num_records', 'user/mode'], outputs=[], threaded=True)
+        V.add(oled_part, inputs=['recording', 'tub/num_records', 'user/mode'], outputs=[], threaded=True, rate_hz=cfg.LOW_RATE_PARTS_HZ)
+
+    # 処理が間に合わない時に負荷を下げる
+    if cfg.OVERLOAD_CONTROL:
+        from donkeycar.parts.overload import OverloadController, build_steps
+        V.add(OverloadController(V, build_steps(V, cfg.OVERLOAD_SHED_ORDER)),
+              outputs=['overload/level', 'overload/shed'])
 
     #add tub to save data
 
@@ -790,15 +834,32 @@ def drive(cfg, model_path=None, use_joystick=False, model_type=None, camera_type
         inputs += ['pilot/angle', 'pilot/throttle']
         types += ['float', 'float']
 
+    if cfg.OVERLOAD_CONTROL:
+        inputs += ['overload/level', 'overload/shed']
+        types += ['int', 'str']
+
     th = TubHandler(path=cfg.DATA_PATH)
-    tub = th.new_tub_writer(inputs=inputs, types=types, user_meta=meta)
-    V.add(tub, inputs=inputs, outputs=["tub/num_records"], run_condition='recording')
+    tub_options = dict(tub_format=cfg.TUB_FORMAT,
+                       chunk_records=cfg.TUB_CHUNK_RECORDS,
+                       flush_every=cfg.TUB_FLUSH_EVERY,
+                       fsync=cfg.TUB_FSYNC,
+                       queue_size=cfg.TUB_WRITE_QUEUE,
+                       workers=cfg.TUB_WRITE_WORKERS,
+                       policy=cfg.TUB_WRITE_POLICY,
+                       columns=cfg.TUB_COLUMNS)
+    # a tub writing in the background returns right away, no budget needed
+    record_budget = None if cfg.TUB_WRITE_QUEUE else cfg.RECORD_BUDGET
+    tub = th.new_tub_writer(inputs=inputs, types=types, user_meta=meta, **tub_options)
+    V.add(tub, inputs=inputs, outputs=["tub/num_records"], run_condition='recording',
+          budget=record_budget)
 
     if cfg.PUB_CAMERA_IMAGES:
         from donkeycar.parts.network import TCPServeValue
         from donkeycar.parts.image import ImgArrToJpg
         pub = TCPServeValue("camera")
-        V.add(ImgArrToJpg(), inputs=['cam/image_array'], outputs=['jpg/bin'])
+        V.add(ImgArrToJpg(), inputs=['cam/image_array'], outputs=['jpg/bin'],
+              budget=cfg.TELEMETRY_BUDGET)
+        # sends on the event loop of the vehicle, without holding up the loop
         V.add(pub, inputs=['jpg/bin'])
 
     if type(ctr) is LocalWebController:
@@ -814,9 +875,11 @@ def drive(cfg, model_path=None, use_joystick=False, model_type=None, camera_type
         if cfg.BUTTON_PRESS_NEW_TUB:
 
             def new_tub_dir():
-                V.parts.pop()
-                tub = th.new_tub_writer(inputs=inputs, types=types, user_meta=meta)
-                V.add(tub, inputs=inputs, outputs=["tub/num_records"], run_condition='recording')
+                nonlocal tub
+                # the drive loop shuts the old tub down once its last write is done
+                new_tub = th.new_tub_writer(inputs=inputs, types=types, user_meta=meta, **tub_options)
+                V.replace(tub, new_tub)
+                tub = new_tub
                 ctr.set_tub(tub)
 
             ctr.set_button_down_trigger('cross', new_tub_dir)
@@ -824,7 +887,14 @@ def drive(cfg, model_path=None, use_joystick=False, model_type=None, camera_type
 
     #run the vehicle for 20 seconds
     V.start(rate_hz=cfg.DRIVE_LOOP_HZ,
-            max_loop_count=cfg.MAX_LOOPS)
+            max_loop_count=cfg.MAX_LOOPS,
+            parallel=cfg.DRIVE_LOOP_PARALLEL,
+            overrun_policy=cfg.DRIVE_LOOP_OVERRUN_POLICY,
+            trace_path=cfg.DRIVE_LOOP_TRACE_PATH,
+            frame_timeout=cfg.DRIVE_LOOP_FRAME_TIMEOUT,
+            sched_profile=sched_profile,
+            prune=cfg.PRUNE_DEAD_PARTS,
+            alloc_sample=cfg.ALLOC_SAMPLE_EVERY)
 
 
 if __name__ == '__main__':
@@ -177,8 +177,7 @@ def drive(cfg):
     #This web controller will create a web server. We aren't using any controls, just for visualization.
     web_ctr = WebFpv()
     V.add(web_ctr,
-          inputs=['map/image'],
-          threaded=True)
+          inputs=['map/image'])
     
 
     #Choose what inputs should change the car.
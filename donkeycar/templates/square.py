@@ -41,8 +41,7 @@ def drive(cfg, model_path=None):
     V.add(ctr, 
           inputs=['cam/image_array'],
           outputs=['user/angle', 'user/throttle', 
-                   'user/mode', 'recording'],
-          threaded=True)
+                   'user/mode', 'recording'])
     
     #See if we should even run the pilot module. 
     #This is only needed because the part run_contion only accepts boolean
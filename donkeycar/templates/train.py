@@ -33,7 +33,7 @@ import numpy as np
 from PIL import Image
 
 import donkeycar as dk
-from donkeycar.parts.datastore import Tub
+from donkeycar.parts.datastore import Tub, load_json_record, load_column_records
 from donkeycar.parts.keras import KerasLinear, KerasIMU,\
      KerasCategorical, KerasBehavioral, Keras3D_CNN,\
      KerasRNN_LSTM, KerasLatent, KerasLocalizer
@@ -79,6 +79,8 @@ def collate_records(records, gen_records, opts):
     '''
 
     new_records = {}
+    # the records of each tub, from its column sidecar when it has one
+    column_records = {}
     
     for record_path in records:
 
@@ -91,9 +93,15 @@ def collate_records(records, gen_records, opts):
         if key in gen_records:
             continue
 
+        if basepath not in column_records:
+            column_records[basepath] = load_column_records(basepath)
+        tub_records = column_records[basepath]
+
         try:
-            with open(record_path, 'r') as fp:
-                json_data = json.load(fp)
+            if tub_records is not None and index in tub_records:
+                json_data = tub_records[index]
+            else:
+                json_data = load_json_record(record_path)
         except:
             continue
 
@@ -712,10 +720,9 @@ def sequence_train(cfg, tub_names, model_name, transfer_model, model_type, conti
     records = []
 
     for tub in tubs:
-        record_paths = glob.glob(os.path.join(tub.path, 'record_*.json'))
+        record_paths = tub.gather_records()
         print("Tub:", tub.path, "has", len(record_paths), 'records')
 
-        record_paths.sort(key=get_record_index)
         records += record_paths
 
 
@@ -724,8 +731,7 @@ def sequence_train(cfg, tub_names, model_name, transfer_model, model_type, conti
 
     for record_path in records:
 
-        with open(record_path, 'r') as fp:
-            json_data = json.load(fp)
+        json_data = load_json_record(record_path)
 
         basepath = os.path.dirname(record_path)
         image_filename = json_data["cam/image_array"]
@@ -30,10 +30,10 @@ def tubs(tmpdir, tubs=5):
     tubs = [ create_sample_tub(tub_path, records=5) for tub_path in tub_paths ]
     return (str(tubs_dir), tub_paths, tubs)
     
-def create_sample_tub(path, records=128):
+def create_sample_tub(path, records=128, tub_format='catalog'):
     inputs=['cam/image_array', 'user/angle', 'user/throttle', 'location/one_hot_state_array']
     types=['image_array', 'float', 'float', 'vector']
-    t = Tub(path, inputs=inputs, types=types)
+    t = Tub(path, inputs=inputs, types=types, tub_format=tub_format)
     cam = SquareBoxCamera()
     tel = MovingSquareTelemetry()
     num_loc = 10
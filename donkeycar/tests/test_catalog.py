@@ -0,0 +1,127 @@
+import json
+import os
+import pytest
+from donkeycar.parts.catalog import Catalog
+from donkeycar.parts.datastore import Tub, TubGroup, convert_tub, \
+    load_json_record
+from .setup import create_sample_tub
+
+
+def test_catalog_append_read_delete(tmpdir):
+    path = str(tmpdir)
+    catalog = Catalog(path, chunk_records=4)
+    for ix in range(1, 11):
+        catalog.append(ix, {'user/angle': ix / 10.0})
+    catalog.delete(3)
+    assert catalog.read(5) == {'user/angle': 0.5}
+    with pytest.raises(KeyError):
+        catalog.read(3)
+    catalog.append(3, {'user/angle': -0.3})
+    catalog.close()
+    # 12 lines, 4 per chunk
+    assert catalog.chunks() == [0, 1, 2]
+
+    reopened = Catalog(path, chunk_records=4)
+    assert reopened.indexes() == list(range(1, 11))
+    assert reopened.read(3) == {'user/angle': -0.3}
+    assert reopened.read(10) == {'user/angle': 1.0}
+    reopened.close()
+
+
+def test_catalog_recovers_after_a_crash(tmpdir):
+    path = str(tmpdir)
+    catalog = Catalog(path, chunk_records=100)
+    for ix in range(5):
+        catalog.append(ix, {'ix': ix})
+    catalog.close()
+    # the last two index entries were lost and a line was cut short
+    index_path = catalog.index_path(0)
+    with open(index_path, 'r+b') as f:
+        f.truncate(3 * 16 + 5)
+    with open(catalog.chunk_path(0), 'ab') as f:
+        f.write(b'{"_index": 5, "ix"')
+
+    reader = Catalog(path, chunk_records=100)
+    assert reader.indexes() == [0, 1, 2, 3, 4]
+    assert reader.read(4) == {'ix': 4}
+    # reading repairs nothing
+    assert os.path.getsize(index_path) == 3 * 16 + 5
+    reader.append(5, {'ix': 5})
+    reader.close()
+
+    catalog = Catalog(path, chunk_records=100)
+    assert catalog.indexes() == [0, 1, 2, 3, 4, 5]
+    assert [catalog.read(ix)['ix'] for ix in range(6)] == list(range(6))
+    assert os.path.getsize(index_path) == 6 * 16
+
+
+def test_tub_formats_read_the_same(tmpdir):
+    old = Tub(str(tmpdir.join('old')), inputs=['user/angle'], types=['float'],
+              tub_format='json')
+    new = Tub(str(tmpdir.join('new')), inputs=['user/angle'], types=['float'],
+              chunk_records=3)
+    for i in range(10):
+        old.put_record({'user/angle': i / 10.0})
+        new.put_record({'user/angle': i / 10.0})
+    new.exclude_index(2)
+    assert old.catalog is None
+    assert not [f for f in os.listdir(new.path) if f.startswith('record_')]
+    assert new.get_num_records() == old.get_num_records() == 10
+    assert new.get_index(shuffled=False) == old.get_index(shuffled=False)
+    assert new.get_record(4)['user/angle'] == old.get_record(4)['user/angle']
+    # training reads the records of both by path
+    paths = new.gather_records()
+    assert len(paths) == 9
+    assert load_json_record(paths[0])['user/angle'] == 0.0
+    for t in (old, new):
+        t.erase_last_n_records(3)
+        t.put_record({'user/angle': 1.5})
+    new.shutdown()
+
+    reopened = Tub(new.path)
+    assert reopened.catalog is not None
+    assert reopened.get_index(shuffled=False) == old.get_index(shuffled=False)
+    ix = new.current_ix
+    assert reopened.get_record(ix)['user/angle'] == 1.5
+
+
+def test_load_json_record_sees_later_writes(tmpdir):
+    tub = Tub(str(tmpdir.join('tub')), inputs=['user/angle'], types=['float'],
+              chunk_records=2)
+    tub.put_record({'user/angle': 0.1})
+    first = tub.gather_records()[0]
+    assert load_json_record(first)['user/angle'] == 0.1
+    # a new chunk, then a record deleted in it
+    for i in range(2):
+        ix = tub.put_record({'user/angle': 0.2})
+    assert load_json_record(tub.get_json_record_path(ix))['user/angle'] == 0.2
+    tub.remove_record(ix)
+    # seen on the next gather, as training does every epoch
+    tub.gather_records()
+    with pytest.raises(FileNotFoundError):
+        load_json_record(tub.get_json_record_path(ix))
+    tub.shutdown()
+
+
+def test_convert_tub(tub_path, tmpdir):
+    tub = create_sample_tub(tub_path, records=20, tub_format='json')
+    before = tub.get_df()
+    assert convert_tub(tub_path, chunk_records=8) == 20
+    with open(os.path.join(tub_path, 'meta.json')) as f:
+        assert json.load(f)['format'] == 'catalog'
+    assert not [f for f in os.listdir(tub_path) if f.startswith('record_')]
+
+    converted = Tub(tub_path)
+    after = converted.get_df()
+    assert list(after['user/angle']) == list(before['user/angle'])
+    assert list(after['milliseconds']) == list(before['milliseconds'])
+    assert converted.get_record(5)['cam/image_array'].shape == (120, 160, 3)
+
+    other = create_sample_tub(str(tmpdir.join('tubs', 'other')), records=5)
+    group = TubGroup(','.join([tub_path, other.path]))
+    assert len(group.df) == 25
+
+
+@pytest.fixture
+def tub_path(tmpdir):
+    return str(tmpdir.mkdir('tubs').join('tub'))
@@ -0,0 +1,107 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from donkeycar.parts.columns import to_column
+from donkeycar.parts.datastore import Tub, TubGroup, TubWriter, \
+    load_column_records, load_json_record
+from .setup import create_sample_tub
+
+
+def no_records(ix):
+    raise AssertionError('read record %d' % ix)
+
+
+@pytest.mark.parametrize('tub_format', ['catalog', 'json'])
+def test_df_from_columns(tmpdir, tub_format):
+    path = str(tmpdir.join('tub'))
+    tub = create_sample_tub(path, records=20, tub_format=tub_format)
+    tub.put_record({'cam/image_array': np.zeros((120, 160, 3), np.uint8),
+                    'user/angle': None, 'user/throttle': 0.1,
+                    'location/one_hot_state_array': [0, 1] + [0] * 8})
+    expected = pd.DataFrame([tub.get_json_record(ix)
+                             for ix in tub.get_index(shuffled=False)])
+    # the first df is read from the records and writes the sidecar
+    pd.testing.assert_frame_equal(tub.get_df(), expected)
+    tub.shutdown()
+
+    reopened = Tub(path)
+    if tub_format == 'json':
+        assert not reopened.record_index.rebuilt
+    ixs, columns, skipped = reopened.get_columns()
+    assert list(ixs) == reopened.get_index(shuffled=False)
+    assert skipped == []
+    assert isinstance(columns['user/angle'], np.memmap)
+    reopened.load_json_data = no_records
+    pd.testing.assert_frame_equal(reopened.get_df(), expected)
+
+    # any record written makes the sidecar out of date
+    del reopened.load_json_data
+    reopened.put_record({'user/angle': 0.5, 'user/throttle': 0.5})
+    assert reopened.get_columns() is None
+    reopened.update_df()
+    assert len(reopened.get_columns()[0]) == 22
+    reopened.erase_last_n_records(2)
+    assert reopened.get_columns() is None
+
+    # and so does a record written again in place
+    reopened.update_df()
+    ix = reopened.get_index(shuffled=False)[0]
+    reopened.write_record(ix, {'user/angle': 0.9, 'user/throttle': 0.9}, 0)
+    assert reopened.get_columns() is None
+    reopened.update_df()
+    assert reopened.get_df()['user/angle'][0] == 0.9
+
+
+def test_channels_that_fit_no_column():
+    assert to_column([1, 2.5, True]).dtype == np.float64
+    assert np.isnan(to_column([1.0, None])[1])
+    assert to_column(['a', None]) is None
+    assert to_column([[1, 2], [3]]) is None
+    assert to_column([2 ** 70]) is None
+    assert to_column([[0, 1], [1, 0]]).shape == (2, 2)
+
+
+def test_skipped_channels_are_read_from_records(tmpdir):
+    path = str(tmpdir.join('tub'))
+    tub = Tub(path, inputs=['user/angle', 'path'], types=['float', 'vector'])
+    tub.put_record({'user/angle': 0.1, 'path': [1, 2]})
+    tub.put_record({'user/angle': 0.2, 'path': [1, 2, 3]})
+    df = tub.get_df()
+    assert tub.get_columns()[2] == ['path']
+    assert load_column_records(path) is None
+    tub.df = None
+    pd.testing.assert_frame_equal(tub.get_df(), df)
+
+
+def test_column_records_for_training(tmpdir):
+    path = str(tmpdir.join('tub'))
+    tub = create_sample_tub(path, records=10)
+    tub.put_record({'cam/image_array': np.zeros((120, 160, 3), np.uint8),
+                    'user/angle': None, 'user/throttle': 0.1,
+                    'location/one_hot_state_array': [0, 1] + [0] * 8})
+    paths = tub.gather_records()
+    assert load_column_records(path) is None
+    tub.save_columns()
+
+    records = load_column_records(path)
+    assert sorted(records) == tub.get_index(shuffled=False)
+    for record_path in paths[:10]:
+        ix = int(os.path.basename(record_path).split('_')[1].split('.')[0])
+        assert records[ix] == load_json_record(record_path)
+    # no value, no key, like in the record it was read from
+    assert 'user/angle' not in records[tub.current_ix]
+
+
+def test_tub_writer_writes_columns_on_shutdown(tmpdir):
+    tub = TubWriter(str(tmpdir.join('tub')), inputs=['user/angle'],
+                    types=['float'], queue_size=4, policy='block',
+                    columns=True)
+    for i in range(8):
+        tub.run(i / 10.0)
+    tub.shutdown()
+    ixs, columns, _ = Tub(tub.path).get_columns()
+    assert list(columns['user/angle']) == [i / 10.0 for i in range(8)]
+
+    group = TubGroup(tub.path)
+    assert list(group.df['user/angle']) == [i / 10.0 for i in range(8)]
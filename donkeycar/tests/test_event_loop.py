@@ -0,0 +1,49 @@
+import asyncio
+import threading
+from donkeycar.event_loop import EventLoopThread, is_coroutine_method
+
+
+def test_event_loop_runs_coroutines_on_its_thread():
+    loop = EventLoopThread()
+    loop.start()
+
+    async def thread_name(x):
+        await asyncio.sleep(0.01)
+        return threading.current_thread().name, x
+
+    assert loop.submit(thread_name(1)).result(1.0) == ('event-loop', 1)
+    loop.stop()
+    assert not loop.running
+
+
+def test_event_loop_cancels_tasks_on_stop():
+    loop = EventLoopThread()
+    loop.start()
+    started = threading.Event()
+    cancelled = threading.Event()
+
+    async def forever():
+        started.set()
+        try:
+            await asyncio.sleep(60)
+        finally:
+            cancelled.set()
+
+    future = loop.submit(forever())
+    assert started.wait(1.0)
+    loop.stop()
+    assert cancelled.is_set()
+    assert future.cancelled()
+
+
+def test_is_coroutine_method():
+    class Part:
+        async def run_async(self):
+            pass
+
+        def run(self):
+            pass
+
+    assert is_coroutine_method(Part(), 'run_async')
+    assert not is_coroutine_method(Part(), 'run')
+    assert not is_coroutine_method(Part(), 'start_async')
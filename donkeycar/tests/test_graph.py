@@ -0,0 +1,62 @@
+import donkeycar as dk
+from donkeycar.graph import PartGraph
+from donkeycar.parts.transform import Lambda
+
+
+class Named(Lambda):
+    def __init__(self, name, f):
+        super().__init__(f)
+        self.report_name = name
+
+
+def build():
+    v = dk.Vehicle()
+    v.add(Named('camera', lambda: (1, 2)), outputs=['image', 'depth'])
+    v.add(Named('user', lambda: (0.1, 0.2)), outputs=['angle', 'throttle'])
+    v.add(Named('pilot', lambda img: 0.3), inputs=['image[-2]'],
+          outputs=['pilot/angle'])
+    v.add(Named('unused', lambda a: 0.4), inputs=['pilot/angle'],
+          outputs=['debug'])
+    v.add(Named('drive', lambda a: a), inputs=['angle'], outputs=['throttle'])
+    v.add(Named('launch', lambda t: t), inputs=['throttle'], outputs=['throttle'])
+    v.add(Named('steer', lambda a, t, imu: None),
+          inputs=['angle', 'throttle', 'imu'])
+    return v
+
+
+def test_part_graph_finds_wiring_problems():
+    v = build()
+    graph = PartGraph(v.parts, v.mem)
+    assert graph.unconsumed == ['debug', 'depth']
+    assert graph.missing == ['imu']
+    # drive overwrites the user throttle nobody read, launch changes it in place
+    assert [(key, e['part'].report_name, l['part'].report_name, read)
+            for key, e, l, read in graph.overwritten] == \
+        [('throttle', 'user', 'drive', False)]
+    graph.report()
+
+    v.mem['imu'] = 0.0
+    assert PartGraph(v.parts, v.mem).missing == []
+
+
+def test_part_graph_dead_parts():
+    v = build()
+    dead = PartGraph(v.parts).dead_parts()
+    # unused is read by nobody, pilot by unused only, the camera by pilot
+    assert [entry['part'].report_name for entry in dead] == \
+        ['camera', 'pilot', 'unused']
+
+    v.parts[3]['part'].side_effects = True
+    assert PartGraph(v.parts).dead_parts() == []
+
+
+def test_vehicle_prunes_dead_parts():
+    v = build()
+    pilot = v.parts[2]['part']
+    v.start(max_loop_count=3, prune=True)
+    assert v.profiler.records[pilot].count == 0
+    assert v.mem['throttle'] == 0.1
+    v = build()
+    pilot = v.parts[2]['part']
+    v.start(max_loop_count=3)
+    assert v.profiler.records[pilot].count == 4
@@ -1,8 +1,10 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+import time
 import unittest
 import pytest
-from donkeycar.memory import Memory
+import numpy as np
+from donkeycar.memory import Memory, History, Handoff
 
 class TestMemory(unittest.TestCase):
 
@@ -66,3 +68,103 @@ class TestMemory(unittest.TestCase):
         mem.put(['myitem'], 888)
         
         assert dict(mem.items()) == {'myitem': 888}
+
+    def test_slot_is_stable(self):
+        mem = Memory()
+        store, ix = mem.slot('myitem')
+        mem.put(['myitem'], 888)
+        assert mem.slot('myitem') == (store, ix)
+        assert store[ix] == 888
+
+    def test_getter_and_setter(self):
+        mem = Memory()
+        set_values = mem.setter(['my1stitem', 'my2nditem'])
+        get_values = mem.getter(['my2nditem', 'my1stitem'])
+        set_values((777, '999'))
+        assert list(get_values()) == ['999', 777]
+        assert mem.get(['my1stitem', 'unknown']) == [777, None]
+
+    def test_d_writes_through(self):
+        mem = Memory()
+        mem.history('angle', 2)
+        mem.put(['angle'], 0.5)
+        mem.d['angle'] = 0.25
+        mem.d.update({'mode': 'user'})
+        assert mem['angle'] == 0.25
+        assert mem['angle[-2]'] == 0.5
+        assert mem.get(['mode']) == ['user']
+        assert dict(mem.d) == {'angle': 0.25, 'mode': 'user'}
+        with pytest.raises(KeyError):
+            mem.d['unknown']
+
+    def test_history_items(self):
+        mem = Memory()
+        mem.history('distance', 3)
+        for tick, value in enumerate([1.0, 2.0, 3.0, 4.0]):
+            mem.tick = tick
+            mem.put(['distance'], value)
+        assert mem['distance[-1]'] == 4.0
+        assert mem.get(['distance[-2]', 'distance[-3]']) == [3.0, 2.0]
+        assert mem.histories['distance'].tick(-2) == 2
+        with pytest.raises(IndexError):
+            mem.histories['distance'][-4]
+
+    def test_history_window_is_a_view(self):
+        mem = Memory()
+        get_window = mem.getter(['img[-3:]'])
+        set_img = mem.setter(['img'])
+        set_img(np.zeros((2, 2)))
+        window = get_window()[0]
+        # older entries are filled with the first value
+        assert window.shape == (3, 2, 2)
+        for i in range(1, 5):
+            set_img(np.full((2, 2), i))
+        window = get_window()[0]
+        assert [w[0, 0] for w in window] == [2, 3, 4]
+        assert window.base is mem.histories['img'].values
+
+    def test_history_skips_none(self):
+        history = History(2)
+        assert history[-1] is None
+        history.push(None, 0)
+        history.push('user', 1)
+        assert len(history) == 1
+        assert history[-2] == 'user'
+
+
+def test_handoff_sequence_and_stamp():
+    handoff = Handoff()
+    assert handoff.latest() is None and handoff.age() is None
+    assert handoff.take() is None
+    assert handoff.put('a', stamp=time.monotonic() - 1.0) == 1
+    assert handoff.latest() == 'a'
+    assert handoff.age() >= 1.0
+    assert handoff.newer_than(1) is None
+    handoff.put('b')
+    seq, stamp, value = handoff.newer_than(1)
+    assert (seq, value) == (2, 'b')
+    assert handoff.wait_newer(2, timeout=0.01) is None
+
+
+def test_handoff_counts_dropped_and_repeated():
+    handoff = Handoff()
+    ages = []
+    handoff.on_take = lambda h, age: ages.append(age)
+    handoff.put(1)
+    assert handoff.take() == 1
+    for value in (2, 3, 4):
+        handoff.put(value)
+    assert handoff.take() == 4
+    assert handoff.take() == 4
+    assert (handoff.new, handoff.dropped, handoff.repeated) == (2, 2, 1)
+    assert handoff.drop_rate == 0.5
+    assert len(ages) == 3 and all(age >= 0 for age in ages)
+
+
+def test_handoff_wait_newer_wakes_on_put():
+    import threading
+    handoff = Handoff()
+    t = threading.Timer(0.01, handoff.put, args=('frame',))
+    t.start()
+    assert handoff.wait_newer(0, timeout=1.0)[2] == 'frame'
+    t.join()
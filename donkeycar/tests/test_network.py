@@ -0,0 +1,62 @@
+import socket
+import time
+import pytest
+import donkeycar as dk
+
+pytest.importorskip('zmq')
+from donkeycar.parts.network import TCPServeValue, TCPClientValue, \
+    UDPValueSub, UDPValuePub
+
+
+def free_port(kind=socket.SOCK_STREAM):
+    with socket.socket(socket.AF_INET, kind) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_until(condition, timeout=2.0):
+    end = time.monotonic() + timeout
+    while not condition() and time.monotonic() < end:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_tcp_values_on_event_loop():
+    port = free_port()
+    server = TCPServeValue('camera', port=port)
+    client = TCPClientValue('camera', '127.0.0.1', port=port)
+    v = dk.Vehicle()
+    v.add(server, inputs=['out'])
+    v.add(client, outputs=['in'])
+    v.start_async_parts()
+    assert wait_until(lambda: server.writers)
+
+    first, second = b'jpg' * 10000, b'next'
+    v.mem['out'] = first
+    v.update_parts()
+    assert wait_until(lambda: client.values.seq == 1)
+    v.mem['out'] = second
+    v.update_parts()
+    assert v.mem['in'] == first
+    assert wait_until(lambda: client.values.seq == 2)
+    v.update_parts()
+    assert v.mem['in'] == second
+    # no value lost or returned twice
+    assert client.values.new == 2
+    assert client.values.dropped == client.values.repeated == 0
+    v.stop()
+
+
+def test_udp_values_on_event_loop():
+    port = free_port(socket.SOCK_DGRAM)
+    sub = UDPValueSub('angle', port=port, def_value=0.0)
+    v = dk.Vehicle()
+    v.add(sub, outputs=['angle'])
+    v.start_async_parts()
+    pub = UDPValuePub('angle', port=port)
+    pub.run(0.5)
+    assert wait_until(lambda: sub.last == 0.5)
+    v.update_parts()
+    assert v.mem['angle'] == 0.5
+    pub.shutdown()
+    v.stop()
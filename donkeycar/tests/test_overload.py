@@ -0,0 +1,74 @@
+import pytest
+
+import donkeycar as dk
+from donkeycar.parts.transform import Lambda
+from donkeycar.parts.overload import OverloadController, build_steps
+
+
+class Fpv:
+    def __init__(self):
+        self.fpv_paused = False
+
+    def run(self):
+        return None
+
+
+def make_vehicle():
+    v = dk.Vehicle()
+    v.add(Lambda(lambda: 1), outputs=['slow'], rate_hz=2.5)
+    v.add(Fpv())
+    v.add(Lambda(lambda: 2), outputs=['tub/num_records'])
+    v.rate_hz = 10
+    v.timer = dk.vehicle.LoopTimer(10)
+    v.timer.start()
+    return v
+
+
+def run_window(v, controller, overruns, work_ms):
+    # loops until the controller looks at them, about a second's worth
+    while True:
+        v.timer.count += 1
+        v.timer.overruns += overruns
+        v.profiler.on_loop(int(work_ms * 1e6))
+        level, shed = controller.run()
+        if controller.ticks == 0:
+            return level, shed
+
+
+def test_overload_sheds_in_order_and_restores():
+    v = make_vehicle()
+    steps = build_steps(v, ['low_rate_parts', 'fpv', 'recording', 'loop_hz'])
+    controller = OverloadController(v, steps, restore_windows=2)
+    run_window(v, controller, 0, 10)
+    assert run_window(v, controller, 1, 120) == (1, 'low_rate_parts')
+    assert v.parts[0]['divisor'] == 2
+    assert run_window(v, controller, 0, 99) == (2, 'low_rate_parts,fpv')
+    assert v.parts[1]['part'].fpv_paused
+    run_window(v, controller, 1, 120)
+    assert v.parts[2]['divisor'] == 2
+    assert run_window(v, controller, 1, 120)[0] == 4
+    assert v.timer.rate_hz == v.rate_hz == 7.5
+    # the 2.5Hz part runs every 3 loops of 7.5Hz, half as often while
+    # low_rate_parts is shed
+    v.compile()
+    assert v.part_divisor(v.parts[0]) == 3 * 2
+    # nothing left to shed
+    assert run_window(v, controller, 1, 120)[0] == 4
+
+    # restore one step after every two calm windows, last shed first
+    assert run_window(v, controller, 0, 10)[0] == 4
+    assert run_window(v, controller, 0, 10)[0] == 3
+    assert v.timer.rate_hz == v.rate_hz == 10
+    assert v.plan is None
+    for _ in range(6):
+        run_window(v, controller, 0, 10)
+    assert controller.level == 0
+    assert [entry['divisor'] for entry in v.parts] == [1, 1, 1]
+    assert not v.parts[1]['part'].fpv_paused
+    actions = [event[1] for event in controller.events]
+    assert actions == ['shed'] * 4 + ['restore'] * 4
+
+
+def test_overload_unknown_step():
+    with pytest.raises(ValueError):
+        build_steps(dk.Vehicle(), ['video'])
@@ -0,0 +1,105 @@
+import os
+import time
+import numpy as np
+import pytest
+import donkeycar as dk
+from donkeycar.parts.transform import Lambda
+from donkeycar.process import SharedChannel, ProcessPart
+
+
+@pytest.fixture()
+def channel():
+    channel = SharedChannel(slot_bytes=1024, slots=3)
+    yield channel
+    channel.close(unlink=True)
+
+
+@pytest.mark.parametrize('value', [None, True, -3, 2 ** 60, 0.25, 'left',
+                                   {'a': [1, 2]}])
+def test_shared_channel_values(channel, value):
+    channel.write(value)
+    assert channel.read() == value
+    assert type(channel.read()) is type(value)
+
+
+def test_shared_channel_arrays(channel):
+    frame = np.arange(24, dtype=np.uint8).reshape(2, 4, 3)
+    channel.write(frame)
+    out = channel.read()
+    assert out.dtype == np.uint8
+    assert np.array_equal(out, frame)
+    # a read copies the frame out of shared memory
+    channel.write(frame[:, ::2].astype(np.float32))
+    assert out.shape == (2, 4, 3)
+    assert np.array_equal(channel.read(), frame[:, ::2])
+    with pytest.raises(ValueError):
+        channel.write(np.zeros(2048, dtype=np.uint8))
+
+
+def test_shared_channel_arrays_changed_in_place(channel):
+    frame = np.zeros(4, dtype=np.uint8)
+    channel.write(frame)
+    first = channel.read()
+    # the same frame again is not copied again
+    channel.write(frame)
+    assert channel.read() is first
+    frame[0] = 7
+    channel.write(frame)
+    assert channel.read()[0] == 7
+    state = {'laps': 1}
+    channel.write(state)
+    state['laps'] = 2
+    channel.write(state)
+    assert channel.read() == {'laps': 2}
+
+
+class Doubler:
+    def run(self, frame):
+        return frame * 2, os.getpid()
+
+
+def test_vehicle_process_part():
+    v = dk.Vehicle()
+    frame = np.ones((3, 4), dtype=np.float32)
+    v.add(Lambda(lambda: frame), outputs=['frame'])
+    v.add(Doubler(), inputs=['frame'], outputs=['doubled', 'pid'],
+          process=True)
+    assert isinstance(v.parts[1]['part'], ProcessPart)
+    try:
+        for _ in range(100):
+            v.update_parts()
+            if v.mem['pid'] is not None:
+                break
+            time.sleep(0.01)
+        assert v.mem['pid'] != os.getpid()
+        assert np.array_equal(v.mem['doubled'], frame * 2)
+    finally:
+        v.stop()
+    assert not v.parts[1]['part'].process.is_alive()
+
+
+class Tracker:
+    def run(self, position):
+        # nothing new without a position
+        return position
+
+
+def wait_for_output(part, value):
+    for _ in range(100):
+        if part.run(value) == value:
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_process_part_keeps_output_on_none():
+    part = ProcessPart(Tracker(), inputs=['position'], outputs=['tracked'])
+    part.start()
+    try:
+        assert wait_for_output(part, 5)
+        for _ in range(10):
+            assert part.run(None) == 5
+            time.sleep(0.01)
+        assert wait_for_output(part, 7)
+    finally:
+        part.shutdown()
@@ -0,0 +1,124 @@
+import random
+import pytest
+from donkeycar.profiler import StreamingHistogram, PartProfiler
+
+
+def test_histogram_percentiles_within_precision():
+    hist = StreamingHistogram()
+    values = [random.randint(1000, 50000000) for _ in range(10000)]
+    for v in values:
+        hist.record(v)
+    values.sort()
+    for pct in [50, 90, 99, 99.9]:
+        exact = values[int(round(pct / 100.0 * len(values))) - 1]
+        assert hist.percentile(pct) == pytest.approx(exact, rel=2 ** -5)
+    assert hist.min == values[0]
+    assert hist.max == values[-1]
+    assert hist.mean == pytest.approx(sum(values) / len(values))
+
+
+def test_histogram_memory_is_fixed():
+    hist = StreamingHistogram()
+    size = len(hist.counts)
+    for v in range(0, 1 << 45, 1 << 30):
+        hist.record(v)
+    hist.record(-5)
+    assert len(hist.counts) == size
+    assert hist.min == 0
+    assert hist.max == (1 << 40) - 1
+
+
+def test_profiler_snapshot_is_independent():
+    class Part:
+        pass
+
+    part = Part()
+    profiler = PartProfiler()
+    profiler.profile_part(part)
+    profiler.on_part_start(part)
+    profiler.on_part_finished(part)
+    profiler.recorder(part)(2000000)
+    snapshot = profiler.snapshot()
+    profiler.recorder(part)(3000000)
+    hists = {name: hist for name, hist, _ in snapshot}
+    assert hists['Part'].count == 2
+    assert hists['Part'].max == 2000000
+    assert profiler.records[part].count == 3
+    profiler.report(snapshot)
+
+
+def test_tracer_caps_events_per_thread():
+    from donkeycar.profiler import Tracer
+    tracer = Tracer(max_events=3)
+    record = tracer.recorder('part')
+    for i in range(5):
+        record(tracer.start_ns + i * 1000, tracer.start_ns + i * 1000 + 500)
+    events = [e for e in tracer.events() if e['ph'] == 'X']
+    assert [e['ts'] for e in events] == [0.0, 1.0, 2.0]
+    assert events[0]['dur'] == 0.5
+    assert tracer.dropped == 2
+    assert tracer.overhead_ns > 0
+
+
+def test_profiler_counters_in_snapshot():
+    class Part:
+        pass
+
+    part = Part()
+    profiler = PartProfiler()
+    profiler.profile_part(part)
+    count = profiler.counter(part, 'misses')
+    count()
+    count(2)
+    snapshot = profiler.snapshot()
+    count()
+    assert snapshot[0][2] == {'misses': 3}
+    assert profiler.counters[part] == {'misses': 4}
+    profiler.report(snapshot)
+
+
+def test_vehicle_allocations_per_part(capsys):
+    import tracemalloc
+    import donkeycar as dk
+
+    class Leak:
+        def __init__(self):
+            self.kept = []
+
+        def run(self):
+            self.kept.append(bytearray(10000))
+
+    class Churn:
+        def run(self):
+            return len(bytearray(1000000))
+
+    class Poll:
+        def __init__(self):
+            self.kept = []
+
+        def update_once(self):
+            self.kept.append(bytearray(10000))
+
+        def run_threaded(self):
+            return len(self.kept)
+
+    V = dk.vehicle.Vehicle()
+    V.add(Leak())
+    V.add(Churn(), outputs=['churn'])
+    V.add(Poll(), outputs=['polled'], threaded=True, update_hz=200)
+    V.start(rate_hz=200, max_loop_count=39, alloc_sample=2)
+    allocations = dict(V.profiler.allocation_snapshot())
+
+    leak = allocations['Leak']
+    assert leak.samples == 20
+    assert leak.net >= 20 * 10000
+    churn = allocations['Churn']
+    assert churn.peak_max >= 1000000
+    assert churn.net < churn.peak_max / 10
+    assert allocations['Poll.update'].samples > 0
+    assert allocations['Poll.update'].net > 0
+    assert not tracemalloc.is_tracing()
+    out = capsys.readouterr().out
+    assert 'Part Allocations' in out
+    assert 'Allocation Growth by Source File' in out
+    assert 'test_profiler.py' in out
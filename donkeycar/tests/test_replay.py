@@ -0,0 +1,109 @@
+import time
+import numpy as np
+import pytest
+import donkeycar as dk
+from donkeycar.parts.datastore import Tub, TubReader, TubWriter
+from donkeycar.parts.transform import Lambda
+from donkeycar.replay import TubReplay, VirtualClock
+from .setup import tub, tub_path
+
+
+def make_tub(path, records=10, period=0.05):
+    # a tub recorded at 1 / period Hz, on a clock of our own
+    inputs = ['cam/image_array', 'user/angle', 'user/throttle']
+    types = ['image_array', 'float', 'float']
+    clock = VirtualClock(1000.0)
+    t = Tub(path, inputs=inputs, types=types, clock=clock)
+    for i in range(records):
+        clock.now += period
+        img = np.full((12, 16, 3), i * 10, dtype=np.uint8)
+        t.put_record({'cam/image_array': img, 'user/angle': i / 10.0,
+                      'user/throttle': 0.5})
+    return t
+
+
+def test_tub_reader_reads_in_order(tub, tub_path):
+    reader = TubReader(tub_path)
+    first = reader.run('user/angle', 'user/throttle')
+    second = reader.run('user/angle', 'user/throttle')
+    records = [tub.get_record(ix) for ix in tub.get_index(shuffled=False)]
+    assert first == [records[0]['user/angle'], records[0]['user/throttle']]
+    assert second == [records[1]['user/angle'], records[1]['user/throttle']]
+    for _ in range(len(records) - 2):
+        reader.run()
+    assert reader.run('user/angle') == [None]
+
+
+def test_replay_as_fast_as_possible(tmpdir):
+    source = make_tub(str(tmpdir.join('source')), records=20)
+    replay = TubReplay(source.path)
+    assert abs(replay.rate_hz - 20) < 0.1
+    out_path = str(tmpdir.join('replayed'))
+    V = dk.vehicle.Vehicle()
+    V.add(replay, outputs=replay.keys, tick_on_frame=True)
+    V.add(Lambda(lambda angle: -angle), inputs=['user/angle'],
+          outputs=['pilot/angle'])
+    inputs = ['user/angle', 'pilot/angle']
+    writer = TubWriter(out_path, inputs=inputs, types=['float', 'float'],
+                       clock=replay.clock)
+    V.add(writer, inputs=inputs, outputs=['tub/num_records'])
+    start = time.monotonic()
+    replay.drive(V, rate_hz=20)
+    # no sleeping for the 20 Hz of the recording
+    assert time.monotonic() - start < 0.5
+
+    assert replay.done
+    replayed = Tub(out_path)
+    assert replayed.start_time == source.start_time
+    expected = [source.get_json_record(ix)
+                for ix in source.get_index(shuffled=False)]
+    got = [replayed.get_json_record(ix)
+           for ix in replayed.get_index(shuffled=False)]
+    assert len(got) == len(expected)
+    for record, original in zip(got, expected):
+        assert record['milliseconds'] == original['milliseconds']
+        assert record['user/angle'] == original['user/angle']
+        assert record['pilot/angle'] == -original['user/angle']
+
+
+def test_replay_in_real_time(tmpdir):
+    source = make_tub(str(tmpdir.join('source')), records=10, period=0.05)
+    replay = TubReplay(source.path, keys=['cam/image_array'], realtime=True,
+                       speed=2.0)
+    frames = []
+    with replay.clock:
+        V = dk.vehicle.Vehicle()
+        V.add(replay, outputs=['cam/image_array'], tick_on_frame=True)
+        V.add(Lambda(lambda img: frames.append(int(img[0, 0, 0]))),
+              inputs=['cam/image_array'])
+        start = time.monotonic()
+        replay.drive(V)
+        elapsed = time.monotonic() - start
+    # 9 gaps of 50ms replayed twice as fast, each record once
+    assert elapsed >= 0.2
+    assert frames == [i * 10 for i in range(10)]
+
+
+def test_replay_of_a_single_record(tmpdir):
+    source = make_tub(str(tmpdir.join('source')), records=1)
+    replay = TubReplay(source.path, keys=['user/angle'])
+    angles = []
+    V = dk.vehicle.Vehicle()
+    V.add(replay, outputs=['user/angle'], tick_on_frame=True)
+    V.add(Lambda(lambda angle: angles.append(angle)), inputs=['user/angle'])
+    replay.drive(V)
+    assert replay.done
+    assert angles == [0.0]
+
+
+def test_virtual_clock_replaces_time_in_a_block():
+    real_time = time.time
+    clock = VirtualClock(1000.0)
+    with pytest.raises(KeyError):
+        with clock:
+            assert time.time() == 1000.0
+            with pytest.raises(RuntimeError):
+                with VirtualClock(0.0):
+                    pass
+            raise KeyError('part error')
+    assert time.time is real_time
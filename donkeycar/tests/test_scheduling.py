@@ -0,0 +1,80 @@
+import os
+import sys
+import threading
+import pytest
+import donkeycar as dk
+from donkeycar import scheduling
+from donkeycar.scheduling import SchedulingProfile
+
+linux_only = pytest.mark.skipif(not hasattr(os, 'sched_setaffinity'),
+                                reason='needs Linux thread affinity')
+
+
+def in_thread(f):
+    result = []
+    t = threading.Thread(target=lambda: result.append(f()))
+    t.start()
+    t.join()
+    return result[0]
+
+
+def test_profile_from_config():
+    assert SchedulingProfile.from_config(None) is None
+    profile = SchedulingProfile.from_config({'loop_cpus': [0],
+                                             'inference_threads': 2})
+    assert profile.loop_cpus == [0]
+    assert profile.part_cpus == {}
+
+
+def test_apply_to_process_leaves_tensorflow_alone(monkeypatch):
+    class NoTensorFlow:
+        def find_spec(self, name, path=None, target=None):
+            assert name.split('.')[0] != 'tensorflow', 'tensorflow imported'
+
+    monkeypatch.delitem(sys.modules, 'tensorflow', raising=False)
+    monkeypatch.setattr(sys, 'meta_path', [NoTensorFlow()] + sys.meta_path)
+    monkeypatch.setattr(scheduling, '_tflite_threads', None)
+    SchedulingProfile(inference_threads=2).apply_to_process()
+    assert scheduling.tflite_threads() == 2
+    with pytest.raises(AssertionError):
+        SchedulingProfile(inference_threads=2).apply_to_inference()
+
+
+@linux_only
+def test_set_affinity_pins_calling_thread_only():
+    cpus = sorted(os.sched_getaffinity(0))
+    before = os.sched_getaffinity(0)
+    assert in_thread(lambda: scheduling.set_affinity(cpus[-1:], 'test'))
+    assert os.sched_getaffinity(0) == before
+    assert not in_thread(lambda: scheduling.set_affinity([100000], 'test'))
+
+
+def test_set_realtime_without_permission(monkeypatch):
+    def denied(*args):
+        raise PermissionError('Operation not permitted')
+    monkeypatch.setattr(os, 'sched_setscheduler', denied, raising=False)
+    monkeypatch.setattr(os, 'SCHED_FIFO', 1, raising=False)
+    monkeypatch.setattr(os, 'sched_param', lambda p: p, raising=False)
+    assert not scheduling.set_realtime(10, 'test')
+
+
+@linux_only
+def test_vehicle_applies_profile_to_part_threads():
+    cpus = sorted(os.sched_getaffinity(0))
+
+    class Reporter:
+        def __init__(self):
+            self.cpus = None
+
+        def update_once(self):
+            self.cpus = os.sched_getaffinity(0)
+
+        def run_threaded(self):
+            return self.cpus
+
+    part = Reporter()
+    profile = SchedulingProfile(loop_cpus=cpus, part_cpus={'Reporter': cpus[:1]})
+    v = dk.Vehicle()
+    v.add(part, outputs=['cpus'], threaded=True, update_hz=100)
+    v.start(rate_hz=100, max_loop_count=3, sched_profile=profile)
+    assert part.cpus == set(cpus[:1])
@@ -0,0 +1,93 @@
+import json
+import os
+import numpy as np
+import pytest
+from tornado.testing import AsyncHTTPTestCase
+from donkeycar.management.tub import WebServer
+from donkeycar.parts.datastore import Tub, pack_tub, unpack_tub
+from donkeycar.parts.shards import ImageShards, read_image_file
+from .setup import create_sample_tub
+
+
+def image_names(path):
+    return sorted(f for f in os.listdir(path) if f.endswith('.jpg'))
+
+
+@pytest.mark.parametrize('tub_format', ['catalog', 'json'])
+def test_pack_and_unpack(tmpdir, tub_format):
+    path = str(tmpdir.join('tub'))
+    tub = create_sample_tub(path, records=30, tub_format=tub_format)
+    names = image_names(path)
+    files = {name: open(os.path.join(path, name), 'rb').read()
+             for name in names}
+    images = [tub.get_record(ix)['cam/image_array']
+              for ix in tub.get_index(shuffled=False)]
+
+    # a few images per shard
+    assert pack_tub(path, shard_mb=5000 / 1024 / 1024) == 30
+    assert image_names(path) == []
+    shards = ImageShards(path)
+    assert len(shards) == 30
+    assert len(shards.shards) > 2
+    packed = Tub(path)
+    if tub_format == 'json':
+        assert not packed.record_index.rebuilt
+    for ix, image in zip(packed.get_index(shuffled=False), images):
+        assert np.array_equal(packed.get_record(ix)['cam/image_array'], image)
+
+    assert unpack_tub(path) == 30
+    assert not ImageShards.exists(path)
+    assert not [f for f in os.listdir(path) if '.shard' in f]
+    for name in names:
+        assert open(os.path.join(path, name), 'rb').read() == files[name]
+
+
+def test_image_files_come_before_packed_images(tmpdir):
+    path = str(tmpdir.join('tub'))
+    tub = create_sample_tub(path, records=5)
+    pack_tub(path, keep_files=True)
+    # kept images are not packed twice
+    assert pack_tub(path) == 0
+    assert image_names(path) == []
+
+    # a record erased and written again after packing
+    tub.erase_last_n_records(1)
+    black = np.zeros((120, 160, 3), dtype=np.uint8)
+    ix = tub.put_record({'cam/image_array': black, 'user/angle': 0.0,
+                         'user/throttle': 0.0})
+    image_path = os.path.join(path, '%d_cam-image_array_.jpg' % ix)
+    assert os.path.exists(image_path)
+    assert tub.get_record(ix)['cam/image_array'].max() < 10
+
+    assert pack_tub(path) == 1
+    assert not os.path.exists(image_path)
+    assert ImageShards(path).read(os.path.basename(image_path)) == \
+        read_image_file(image_path)
+    assert tub.get_record(ix)['cam/image_array'].max() < 10
+    with pytest.raises(FileNotFoundError):
+        read_image_file(os.path.join(path, '99_cam-image_array_.jpg'))
+
+
+class TestTubData(AsyncHTTPTestCase):
+    def get_app(self):
+        self.data_path = self.get_data_path()
+        return WebServer(self.data_path)
+
+    def get_data_path(self):
+        import tempfile
+        data_path = tempfile.mkdtemp()
+        create_sample_tub(os.path.join(data_path, 'tub'), records=3)
+        pack_tub(os.path.join(data_path, 'tub'))
+        return data_path
+
+    def test_records_and_packed_images(self):
+        response = self.fetch('/tub_data/tub/record_2.json')
+        assert response.code == 200
+        assert json.loads(response.body)['cam/image_array'] == \
+            '2_cam-image_array_.jpg'
+        response = self.fetch('/tub_data/tub/2_cam-image_array_.jpg')
+        assert response.code == 200
+        assert response.headers['Content-Type'] == 'image/jpeg'
+        assert response.body[:2] == b'\xff\xd8'
+        assert self.fetch('/tub_data/tub/9_cam-image_array_.jpg').code == 404
+        assert self.fetch('/tub_data/tub/meta.json').code == 200
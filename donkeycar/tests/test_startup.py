@@ -0,0 +1,72 @@
+import time
+import pytest
+import donkeycar as dk
+from donkeycar import startup
+from donkeycar.parts.camera import BaseCamera
+from donkeycar.startup import StartupProfiler
+
+
+@pytest.fixture
+def profiler(monkeypatch):
+    profiler = StartupProfiler()
+    monkeypatch.setattr(startup, 'profiler', profiler)
+    return profiler
+
+
+def test_startup_profiler_spans_and_background(profiler):
+    with profiler.span('import things', 'import'):
+        time.sleep(0.01)
+    slow = profiler.submit('load model', time.sleep, 0.1)
+    profiler.part_added('camera')
+    slow.result()
+    spans = {name: (kind, thread, end - start)
+             for name, kind, thread, start, end in profiler.spans}
+    assert spans['import things'][0] == 'import'
+    assert spans['import things'][2] >= 0.01
+    # the model loaded on a thread of its own, not counted in the camera
+    assert spans['load model'][1].startswith('startup')
+    assert spans['camera'][2] < 0.05
+    profiler.report()
+    assert profiler.reported
+
+
+def test_startup_profiler_reraises_background_errors(profiler):
+    def fail():
+        raise ValueError('no model')
+
+    with pytest.raises(ValueError):
+        profiler.submit('load model', fail).result()
+
+
+class SlowCamera(BaseCamera):
+    def __init__(self):
+        super().__init__()
+        self.warm_up(0.1)
+        self.on = True
+
+    def update(self):
+        while self.on:
+            self.put_frame(1)
+            time.sleep(0.01)
+
+    def shutdown(self):
+        self.on = False
+
+
+def test_vehicle_reports_first_drivable_tick(profiler):
+    v = dk.Vehicle()
+    built = time.perf_counter() - profiler.t0
+    cam = SlowCamera()
+    v.add(cam, outputs=['image'], threaded=True)
+    v.start(rate_hz=50, max_loop_count=20)
+    # the camera dropped its frames while warming up
+    assert profiler.elapsed('first camera frame') >= built + 0.1
+    assert profiler.elapsed('first drivable tick') >= \
+        profiler.elapsed('first camera frame')
+    assert [span[0] for span in profiler.spans] == ['SlowCamera']
+    # reported from a thread of its own
+    for _ in range(100):
+        if profiler.reported:
+            break
+        time.sleep(0.01)
+    assert profiler.reported
@@ -1,10 +1,15 @@
 # -*- coding: utf-8 -*-
+import errno
+import json
 import os
 import tempfile
+import threading
 import unittest
+import pytest
 
 from donkeycar.parts.datastore import TubHandler
 from donkeycar.parts.datastore import TubWriter, Tub
+from donkeycar.parts.catalog import RecordIndex
 from donkeycar.utils import arr_to_img, img_to_arr
 from PIL import ImageChops
 
@@ -142,3 +147,151 @@ class TestTubWriter(unittest.TestCase):
         assert tub.meta['location'] == "Here2"
         assert t2.meta['inputs'] == self.inputs
         assert t2.meta['location'] == "Here2"
+
+
+class SlowTubWriter(TubWriter):
+    # a worker takes a record, then waits to be let go
+    def __init__(self, *args, **kwargs):
+        self.go = threading.Event()
+        self.taken = threading.Semaphore(0)
+        super(SlowTubWriter, self).__init__(*args, **kwargs)
+
+    def write_record(self, ix, data, milliseconds):
+        self.taken.release()
+        self.go.wait()
+        super(SlowTubWriter, self).write_record(ix, data, milliseconds)
+
+
+def test_tub_writer_queue_blocks(tmpdir):
+    import numpy as np
+    inputs = ['cam/image_array', 'user/angle']
+    tub = TubWriter(str(tmpdir.join('tub')), inputs=inputs,
+                    types=['image_array', 'float'], queue_size=4, workers=2,
+                    policy='block')
+    img = np.zeros((12, 16, 3), dtype=np.uint8)
+    counts = [tub.run(img, i / 10.0) for i in range(30)]
+    assert counts == list(range(1, 31))
+    tub.shutdown()
+    assert tub.profile_counters()['dropped'] == 0
+    t = Tub(tub.path)
+    assert t.get_index(shuffled=False) == list(range(1, 31))
+    assert t.get_record(7)['user/angle'] == 0.6
+    assert t.get_record(7)['cam/image_array'].shape == (12, 16, 3)
+
+
+def test_tub_writer_queue_drops(tmpdir):
+    for policy, kept in (('drop_newest', [1, 2, 3]), ('drop_oldest', [1, 6, 7])):
+        tub = SlowTubWriter(str(tmpdir.join(policy)), inputs=['user/angle'],
+                            types=['float'], queue_size=2, policy=policy)
+        tub.run(0.0)
+        # the worker holds record 1, the queue takes 2 more
+        tub.taken.acquire()
+        counts = [tub.run(i / 10.0) for i in range(1, 7)]
+        counters = tub.profile_counters()
+        assert counters['dropped'] == 4
+        assert counters['max queued'] == 2
+        tub.go.set()
+        tub.shutdown()
+        assert Tub(tub.path).get_index(shuffled=False) == kept
+        assert counts[-1] == len(kept)
+
+
+def test_tub_writer_erase_waits_for_the_queue(tmpdir):
+    tub = SlowTubWriter(str(tmpdir.join('tub')), inputs=['user/angle'],
+                        types=['float'], queue_size=10, policy='block')
+    for i in range(5):
+        tub.run(i / 10.0)
+    tub.go.set()
+    tub.erase_last_n_records(2)
+    tub.run(1.0)
+    tub.shutdown()
+    # erases records 3 and 4 and writes 3 again, as a tub writing directly
+    assert Tub(tub.path).get_index(shuffled=False) == [1, 2, 3, 5]
+    assert Tub(tub.path).get_record(3)['user/angle'] == 1.0
+
+
+def test_json_tub_keeps_an_index(tmpdir):
+    path = str(tmpdir.join('tub'))
+    tub = Tub(path, inputs=['user/angle'], types=['float'], tub_format='json')
+    for i in range(6):
+        tub.put_record({'user/angle': i / 10.0})
+    tub.remove_record(2)
+    tub.shutdown()
+
+    t = Tub(path)
+    assert not t.record_index.rebuilt
+    assert t.get_index(shuffled=False) == [1, 3, 4, 5, 6]
+    assert t.get_num_records() == 5
+    assert t.current_ix == 7
+    t.put_record({'user/angle': 0.7})
+    t.shutdown()
+    assert Tub(path).get_index(shuffled=False) == [1, 3, 4, 5, 6, 8]
+
+    index_path = os.path.join(path, RecordIndex.NAME)
+    # files that are no records leave the index alone
+    with open(os.path.join(path, 'notes.txt'), 'w') as f:
+        f.write('wet track')
+    assert not Tub(path).record_index.rebuilt
+
+    # records written or erased at the end without the tub make it stale
+    with open(os.path.join(path, 'record_10.json'), 'w') as f:
+        json.dump({'user/angle': 1.0}, f)
+    t = Tub(path)
+    assert t.record_index.rebuilt
+    assert t.get_index(shuffled=False) == [1, 3, 4, 5, 6, 8, 10]
+    t.shutdown()
+    # opening to read leaves the index file alone, the next write saves it
+    t = Tub(path)
+    assert t.record_index.rebuilt
+    ix = t.put_record({'user/angle': 1.1})
+    t.shutdown()
+    assert not Tub(path).record_index.rebuilt
+
+    # one deleted from the middle is dropped once found missing
+    os.unlink(os.path.join(path, 'record_4.json'))
+    t = Tub(path)
+    with pytest.raises(FileNotFoundError):
+        t.get_record(4)
+    t.shutdown()
+    t = Tub(path)
+    assert not t.record_index.rebuilt
+    assert t.get_index(shuffled=False) == [1, 3, 5, 6, 8, 10, ix]
+
+    os.unlink(t.get_json_record_path(ix))
+    t = Tub(path)
+    assert t.record_index.rebuilt
+    assert t.get_index(shuffled=False) == [1, 3, 5, 6, 8, 10]
+
+    os.unlink(index_path)
+    t = Tub(path)
+    assert t.record_index.rebuilt
+    assert t.gather_records()[-1] == os.path.join(path, 'record_10.json')
+
+
+def test_json_tub_index_is_written_by_writes_only(tmpdir, monkeypatch):
+    path = str(tmpdir.join('tub'))
+    Tub(path, inputs=['user/angle'], types=['float'],
+        tub_format='json').shutdown()
+    index_path = os.path.join(path, RecordIndex.NAME)
+    # an empty index of a tub without records is current
+    assert not Tub(path).record_index.rebuilt
+
+    t = Tub(path)
+    t.put_record({'user/angle': 0.1})
+    t.put_record({'user/angle': 0.2})
+    t.shutdown()
+    os.unlink(index_path)
+    t = Tub(path)
+    assert t.record_index.rebuilt
+    assert t.get_num_records() == 2
+    t.shutdown()
+    assert not os.path.exists(index_path)
+
+    def read_only(*args):
+        raise OSError(errno.EROFS, 'Read-only file system')
+    monkeypatch.setattr(os, 'replace', read_only)
+    t = Tub(path)
+    t.put_record({'user/angle': 0.3})
+    assert t.get_num_records() == 3
+    t.shutdown()
+    assert not os.path.exists(index_path)
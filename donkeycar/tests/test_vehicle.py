@@ -1,3 +1,6 @@
+import asyncio
+import threading
+import time
 import pytest
 import donkeycar as dk
 from donkeycar.parts.transform import Lambda
@@ -54,4 +57,509 @@ def test_should_raise_assertion_on_non_boolean_threaded_for_add_part():
     threaded = 'non_boolean'
     with pytest.raises(AssertionError):
         vehicle.add(_get_sample_lambda(), threaded=threaded)
-        pytest.fail("threaded is not a boolean: %r" % threaded)
\ No newline at end of file
+        pytest.fail("threaded is not a boolean: %r" % threaded)
+
+def test_build_stages_keeps_dependencies_serial():
+    v = dk.Vehicle()
+    v.add(_get_sample_lambda(), outputs=['a'])
+    v.add(_get_sample_lambda(), outputs=['b'])
+    v.add(Lambda(lambda a: a), inputs=['a'], outputs=['c'])
+    v.add(Lambda(lambda a, b: a), inputs=['a', 'b'], outputs=['a'])
+    stages = dk.vehicle.build_stages(v.parts)
+    assert [len(stage) for stage in stages] == [2, 1, 1]
+    assert stages[1][0] is v.parts[2]
+    assert stages[2][0] is v.parts[3]
+
+
+def test_build_stages_counts_run_condition_as_input():
+    v = dk.Vehicle()
+    v.add(_get_sample_lambda(), outputs=['run'])
+    v.add(_get_sample_lambda(), outputs=['b'], run_condition='run')
+    stages = dk.vehicle.build_stages(v.parts)
+    assert len(stages) == 2
+
+
+def test_vehicle_run_parallel():
+    v = dk.Vehicle()
+    v.add(_get_sample_lambda(), outputs=['a'])
+    v.add(_get_sample_lambda(), outputs=['b'])
+    v.add(Lambda(lambda a, b: a + b), inputs=['a', 'b'], outputs=['c'])
+    v.start(rate_hz=100, max_loop_count=3, parallel=True)
+    assert v.mem['c'] == 2
+    assert v.executor is None
+
+
+def test_build_dependencies():
+    v = dk.Vehicle()
+    v.add(_get_sample_lambda(), outputs=['a'])
+    v.add(_get_sample_lambda(), outputs=['b'])
+    v.add(Lambda(lambda a: a), inputs=['a'], outputs=['c'])
+    v.add(Lambda(lambda a, b: a), inputs=['a', 'b'], outputs=['a'])
+    assert dk.vehicle.build_dependencies(v.parts) == [[], [], [0], [0, 1, 2]]
+
+
+def test_parallel_parts_do_not_wait_for_unrelated_parts():
+    v = dk.Vehicle()
+    order = []
+
+    def slow():
+        time.sleep(0.2)
+        order.append('slow')
+        return 1
+
+    def fast(name):
+        def run(*args):
+            order.append(name)
+            return 1
+        return run
+
+    v.add(Lambda(slow), outputs=['s'])
+    v.add(Lambda(fast('a')), outputs=['a'])
+    # in the stage after the slow part, but only waits for 'a'
+    v.add(Lambda(fast('b')), inputs=['a'], outputs=['b'])
+    v.add(Lambda(fast('c')), inputs=['s', 'b'], outputs=['c'])
+    v.start(rate_hz=100, max_loop_count=1, parallel=True)
+    assert order[:4] == ['a', 'b', 'slow', 'c']
+    assert v.mem['c'] == 1
+
+
+def test_compiled_plan_respects_run_condition():
+    v = dk.Vehicle()
+    v.mem['run'] = False
+    v.add(_get_sample_lambda(), outputs=['a'], run_condition='run')
+    v.update_parts()
+    assert v.mem.get(['a']) == [None]
+    v.mem['run'] = True
+    v.update_parts()
+    assert v.mem['a'] == 1
+
+
+def test_compiled_plan_is_rebuilt_when_parts_change():
+    v = dk.Vehicle()
+    v.add(_get_sample_lambda(), outputs=['a'])
+    v.update_parts()
+    assert len(v.plan) == 1
+    v.add(Lambda(lambda a: (a, a + 1)), inputs=['a'], outputs=['b', 'c'])
+    assert v.plan is None
+    v.update_parts()
+    assert v.mem.get(['b', 'c']) == [1, 2]
+    v.remove(v.parts[-1])
+    v.update_parts()
+    assert len(v.plan) == 1
+
+
+def test_vehicle_history_inputs():
+    v = dk.Vehicle()
+    counter = iter(range(100))
+    v.add(Lambda(lambda: next(counter)), outputs=['count'])
+    v.add(Lambda(lambda now, prev, window: (now - prev, list(window))),
+          inputs=['count', 'count[-2]', 'count[-3:]'],
+          outputs=['delta', 'window'])
+    for _ in range(4):
+        v.update_parts()
+    assert v.mem['delta'] == 1
+    assert v.mem['window'] == [1, 2, 3]
+    assert v.mem.histories['count'].tick() == 4
+
+
+def test_build_dependencies_on_history_inputs():
+    v = dk.Vehicle()
+    v.add(Lambda(lambda prev: prev), inputs=['a[-2]'], outputs=['b'])
+    v.add(_get_sample_lambda(), outputs=['a'])
+    v.add(Lambda(lambda window: 1), inputs=['a[-3:]'], outputs=['c'])
+    assert dk.vehicle.build_dependencies(v.parts) == [[], [0], [1]]
+
+
+def test_budget_parts_get_a_copy_of_history_windows():
+    v = dk.Vehicle()
+    counter = iter(range(100))
+    seen = []
+    v.add(Lambda(lambda: next(counter)), outputs=['count'])
+    v.add(Lambda(lambda window: seen.append(window)),
+          inputs=['count[-2:]'], budget=1.0)
+    for _ in range(4):
+        v.update_parts()
+    v.stop()
+    assert [list(window) for window in seen] == [[0, 0], [0, 1], [1, 2],
+                                                 [2, 3]]
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+
+    def monotonic_ns(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += int(seconds * 1e9)
+
+
+@pytest.fixture()
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(dk.vehicle.time, 'monotonic_ns', clock.monotonic_ns)
+    monkeypatch.setattr(dk.vehicle.time, 'sleep', clock.sleep)
+    return clock
+
+
+@pytest.mark.parametrize('policy, dropped, deadline', [
+    ('drop', 2, 50000000), ('catch_up', 0, 30000000)])
+def test_loop_timer_overrun_policy(clock, policy, dropped, deadline):
+    timer = dk.vehicle.LoopTimer(100, overrun_policy=policy)
+    timer.start()
+    clock.now += 4000000
+    assert timer.wait() == 0
+    assert clock.now == 10000000
+    # a 35ms tick misses the deadlines at 20, 30 and 40ms
+    clock.now += 35000000
+    assert timer.wait() == 25000000
+    assert timer.overruns == 1
+    assert timer.dropped == dropped
+    assert timer.deadline_ns == deadline
+    assert timer.period_max == 35000000
+    assert timer.jitter_max == 25000000
+
+
+def test_loop_timer_does_not_drift(clock):
+    timer = dk.vehicle.LoopTimer(50)
+    timer.start()
+    for _ in range(100):
+        clock.now += 3000001
+        timer.wait()
+    assert clock.now == 100 * 20000000
+    assert timer.count == 100
+    assert timer.period_mean == 20000000
+    assert timer.overruns == 0
+
+
+def test_vehicle_trace(tmpdir):
+    import json
+
+    class Polled:
+        def __init__(self):
+            self.polls = 0
+
+        def update_once(self):
+            self.polls += 1
+            time.sleep(0.001)
+
+        def run_threaded(self):
+            return self.polls
+
+    path = str(tmpdir.join('trace.json'))
+    v = dk.Vehicle()
+    v.add(Polled(), outputs=['polls'], threaded=True)
+    v.add(_get_sample_lambda(), outputs=['a'])
+    v.start(rate_hz=100, max_loop_count=5, trace_path=path)
+    with open(path) as f:
+        trace = json.load(f)
+    spans = [e for e in trace['traceEvents'] if e['ph'] == 'X']
+    names = set(e['name'] for e in spans)
+    assert names == {'Polled', 'Lambda', 'Polled.update'}
+    assert len([e for e in spans if e['name'] == 'Lambda']) == 6
+    assert trace['otherData']['dropped_spans'] == 0
+    assert v.tracer is None
+
+
+def test_vehicle_part_divisors():
+    v = dk.Vehicle()
+    calls = {'fast': 0, 'divided': 0, 'rate': 0}
+
+    def counter(name):
+        def run():
+            calls[name] += 1
+            return calls[name]
+        return Lambda(run)
+
+    v.add(counter('fast'), outputs=['fast'])
+    v.add(counter('divided'), outputs=['divided'], divisor=4)
+    v.add(counter('rate'), outputs=['rate'], rate_hz=25)
+    v.start(rate_hz=100, max_loop_count=11)
+    assert calls == {'fast': 12, 'divided': 3, 'rate': 3}
+    # skipped parts keep their outputs in memory
+    assert v.mem['divided'] == 3
+
+
+def test_should_raise_assertion_on_bad_divisor_for_add_part():
+    vehicle = dk.Vehicle()
+    with pytest.raises(AssertionError):
+        vehicle.add(_get_sample_lambda(), divisor=0)
+
+
+def test_loop_timer_wait_for_counts_timeouts(clock):
+    timer = dk.vehicle.LoopTimer(100)
+    timer.start()
+    clock.now += 7000000
+    assert timer.wait_for(lambda timeout: True, 0.02) == 0
+    assert timer.wait_for(lambda timeout: False, 0.02) == 20000000
+    assert timer.timeouts == 1
+    assert timer.count == 2
+    assert timer.period_max == 7000000
+
+
+def test_base_camera_wait_for_frame():
+    from donkeycar.parts.camera import BaseCamera
+    cam = BaseCamera()
+    assert not cam.wait_for_frame(timeout=0.01)
+    cam.put_frame('frame')
+    assert cam.wait_for_frame(timeout=0.01)
+    # the same frame is not waited for twice
+    assert not cam.wait_for_frame(timeout=0.01)
+    assert cam.run_threaded() == 'frame'
+
+
+def test_vehicle_tick_on_frame():
+    from donkeycar.parts.camera import MockCamera
+    cam = MockCamera(image_w=4, image_h=3, framerate=200)
+    v = dk.Vehicle()
+    v.add(cam, outputs=['cam/image_array'], threaded=True, tick_on_frame=True,
+          update_hz=cam.framerate)
+    v.add(Lambda(lambda: cam.frames.seq), outputs=['frame_count'])
+    start = time.monotonic()
+    v.start(rate_hz=10, max_loop_count=10, frame_timeout=1.0)
+    # ticks follow the 200fps camera rather than the 10Hz loop rate
+    assert time.monotonic() - start < 0.9
+    assert v.timer.timeouts == 0
+    assert v.mem['frame_count'] >= 10
+
+
+def test_should_raise_assertion_on_tick_on_frame_without_frames():
+    vehicle = dk.Vehicle()
+    with pytest.raises(AssertionError):
+        vehicle.add(_get_sample_lambda(), tick_on_frame=True)
+
+
+def test_vehicle_budget_keeps_last_outputs():
+    class Stalling:
+        def __init__(self):
+            self.calls = 0
+
+        def run(self, value):
+            self.calls += 1
+            if self.calls == 2:
+                time.sleep(0.2)
+            return value * 10
+
+    part = Stalling()
+    v = dk.Vehicle()
+    v.add(Lambda(lambda: v.mem.tick), outputs=['tick'])
+    v.add(part, inputs=['tick'], outputs=['slow'], budget=0.05)
+    v.compile()
+    v.update_parts()
+    assert v.mem['slow'] == 10
+    start = time.monotonic()
+    v.update_parts()
+    # the loop gave up on the stalled part and kept its last output
+    assert time.monotonic() - start < 0.15
+    assert v.mem['slow'] == 10
+    # while it is still busy the part is not run again
+    v.update_parts()
+    assert part.calls == 2
+    time.sleep(0.2)
+    # the late output is saved once the part is done
+    v.update_parts()
+    assert v.mem['slow'] == 40
+    assert v.profiler.counters[part] == {'budget misses': 2}
+    v.stop()
+
+
+def test_vehicle_budget_respects_run_condition():
+    v = dk.Vehicle()
+    v.mem['run'] = False
+    v.add(_get_sample_lambda(), outputs=['a'], run_condition='run', budget=1.0)
+    v.update_parts()
+    assert v.mem['a'] is None
+    v.mem['run'] = True
+    v.update_parts()
+    assert v.mem['a'] == 1
+    v.stop()
+
+
+class SlowWriter:
+    def __init__(self):
+        self.writes = 0
+        self.closed = False
+
+    def run(self, value):
+        time.sleep(0.05)
+        self.writes += 1
+        return self.writes
+
+    def shutdown(self):
+        self.closed = True
+
+
+def test_vehicle_stop_waits_for_late_budget_parts():
+    v = dk.Vehicle()
+    writer = SlowWriter()
+    v.add(writer, inputs=['a'], outputs=['n'], budget=0.001)
+    v.update_parts()
+    assert v.mem['n'] is None
+    v.stop()
+    # the late write is done before the part is shut down
+    assert writer.writes == 1 and writer.closed
+    assert 'executor' not in v.parts[0]
+
+
+def test_vehicle_replace_part():
+    v = dk.Vehicle()
+    old, new = SlowWriter(), SlowWriter()
+    v.add(old, inputs=['a'], outputs=['n'], budget=0.001)
+    v.update_parts()
+    v.replace(old, new)
+    v.update_parts()
+    assert old.writes == 1 and old.closed
+    assert v.parts[0]['part'] is new and len(v.parts) == 1
+    v.stop()
+    assert new.writes == 1 and new.closed
+
+
+def test_should_raise_assertion_on_bad_budget_for_add_part():
+    vehicle = dk.Vehicle()
+    with pytest.raises(AssertionError):
+        vehicle.add(_get_sample_lambda(), budget=0)
+
+
+class Updater:
+    def __init__(self, work_s=0.0, sleep_s=0.0):
+        self.work_s = work_s
+        self.sleep_s = sleep_s
+        self.updates = 0
+
+    def update_once(self):
+        self.updates += 1
+        end = time.thread_time() + self.work_s
+        while time.thread_time() < end:
+            pass
+        time.sleep(self.sleep_s)
+
+    def run_threaded(self):
+        return self.updates
+
+
+def test_supervisor_caps_update_rate():
+    part = Updater()
+    v = dk.Vehicle()
+    v.add(part, outputs=['updates'], threaded=True, update_hz=50)
+    v.start(rate_hz=50, max_loop_count=10)
+    # about 0.2s at 50Hz, rather than as fast as the thread can go
+    assert 5 <= part.updates <= 15
+    supervised = v.supervisor.threads[0]
+    assert supervised.updates == part.updates
+    assert not supervised.thread.is_alive()
+
+
+def test_supervisor_finds_spinning_threads():
+    v = dk.Vehicle()
+    v.add(Updater(work_s=0.005), outputs=['spinning'], threaded=True)
+    v.add(Updater(sleep_s=0.005), outputs=['sleeping'], threaded=True)
+    v.supervisor.start()
+    time.sleep(0.2)
+    assert v.supervisor.check() == ['Updater']
+    spinning, sleeping = v.supervisor.threads
+    assert spinning.spinning and not sleeping.spinning
+    assert spinning.cpu_time_ns() > 10 * sleeping.cpu_time_ns()
+    v.stop()
+
+
+def test_supervisor_joins_threads_with_timeout():
+    class Stuck:
+        def update(self):
+            time.sleep(0.5)
+
+        def run_threaded(self):
+            return None
+
+    v = dk.Vehicle()
+    v.supervisor.join_timeout = 0.05
+    v.add(Stuck(), threaded=True)
+    v.add(Updater(sleep_s=0.001), threaded=True)
+    v.supervisor.start()
+    v.on = False
+    assert v.supervisor.join() == ['Stuck']
+
+
+def test_should_raise_assertion_on_update_hz_without_update_once():
+    vehicle = dk.Vehicle()
+    with pytest.raises(AssertionError):
+        vehicle.add(_get_sample_lambda(), threaded=True, update_hz=10)
+
+
+def test_vehicle_profiles_camera_frames():
+    from donkeycar.parts.camera import MockCamera
+    cam = MockCamera(image_w=4, image_h=3, framerate=1000)
+    v = dk.Vehicle()
+    v.add(cam, outputs=['cam/image_array'], threaded=True,
+          update_hz=cam.framerate)
+    v.start(rate_hz=100, max_loop_count=5)
+    snapshot = {name: (hist, counters)
+                for name, hist, counters in v.profiler.snapshot()}
+    ages, _ = snapshot['MockCamera.frames age']
+    # every loop after the first frame took one
+    assert ages.count >= 5
+    counters = snapshot['MockCamera'][1]
+    assert counters['frames new'] + counters['frames dropped'] == cam.frames.taken_seq
+    assert counters['frames drop %'] > 0
+
+
+def test_loop_timer_set_rate(clock):
+    timer = dk.vehicle.LoopTimer(100)
+    timer.start()
+    timer.set_rate(50)
+    timer.wait()
+    assert clock.now == 20000000
+    timer.wait()
+    assert clock.now == 40000000
+    assert timer.rate_hz == 50
+
+
+def test_vehicle_async_parts_share_the_event_loop():
+    class Network:
+        def __init__(self):
+            self.started = None
+            self.threads = set()
+            self.release = None
+
+        async def start_async(self):
+            self.started = threading.current_thread().name
+            self.release = asyncio.Event()
+
+        async def run_async(self, value):
+            self.threads.add(threading.current_thread().name)
+            if value == 2:
+                # a slow reply
+                await self.release.wait()
+            return value * 10
+
+    a, b = Network(), Network()
+    v = dk.Vehicle()
+    v.add(Lambda(lambda: v.mem.tick), outputs=['tick'])
+    v.add(a, inputs=['tick'], outputs=['a'])
+    v.add(b, inputs=['tick'], outputs=['b'], budget=0.05)
+    v.start_async_parts()
+    assert a.started == b.started == 'event-loop'
+
+    v.update_parts()
+    # the drive loop did not wait for a, but did for b within its budget
+    assert v.mem['a'] is None
+    assert v.mem['b'] == 10
+    time.sleep(0.05)
+    v.update_parts()
+    assert v.mem['a'] == 10
+    # neither is scheduled again while the second run waits
+    start = time.monotonic()
+    v.update_parts()
+    assert time.monotonic() - start < 0.04
+    assert v.profiler.counters[a] == {'still running': 1}
+    assert v.profiler.counters[b] == {'budget misses': 2}
+    for part in (a, b):
+        v.event_loop.call_soon(part.release.set)
+    time.sleep(0.05)
+    v.update_parts()
+    # the late outputs are saved, then b runs again within its budget
+    assert v.mem['a'] == 20
+    assert v.mem['b'] == 40
+    assert a.threads == b.threads == {'event-loop'}
+    v.stop()
+    assert not v.event_loop.running
@@ -17,3 +17,25 @@ def test_json_output(server):
     assert int(d[0]) == 0
 
 
+
+
+def test_web_controller_on_vehicle_event_loop():
+    import socket
+    import requests
+    import donkeycar as dk
+
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    ctr = LocalWebController(port=port)
+    v = dk.Vehicle()
+    v.add(ctr, inputs=['img'], outputs=['angle', 'throttle', 'mode', 'recording'])
+    v.start_async_parts()
+    data = {'angle': 0.5, 'throttle': 0.25, 'drive_mode': 'local_angle',
+            'recording': False}
+    r = requests.post('http://127.0.0.1:%d/drive' % port, data=json.dumps(data))
+    assert r.status_code == 200
+    v.update_parts()
+    assert v.mem['angle'] == 0.5
+    assert v.mem['mode'] == 'local_angle'
+    v.stop()
@@ -147,8 +147,10 @@ def load_scaled_image_arr(filename, cfg):
     also apply cropping and normalize
     '''
     import donkeycar as dk
+    from donkeycar.parts.shards import open_image
     try:
-        img = Image.open(filename)
+        # from the file, or the shards of a packed tub
+        img = open_image(filename)
         if img.height != cfg.IMAGE_H or img.width != cfg.IMAGE_W:
             img = img.resize((cfg.IMAGE_W, cfg.IMAGE_H))
         img_arr = np.array(img)
@@ -454,27 +456,30 @@ def get_model_by_type(model_type, cfg):
     given the string model_type and the configuration settings in cfg
     create a Keras model and return it.
     '''
-    from donkeycar.parts.keras import KerasRNN_LSTM, KerasBehavioral, \
-        KerasCategorical, KerasIMU, KerasLinear, Keras3D_CNN, \
-        KerasLocalizer, KerasLatent
-    from donkeycar.parts.tflite import TFLitePilot
-
+    # each branch imports only the module of its model type, as keras
+    # takes long to load
     if model_type is None:
         model_type = cfg.DEFAULT_MODEL_TYPE
+
     print("\"get_model_by_type\" model Type is: {}".format(model_type))
 
     input_shape = (cfg.IMAGE_H, cfg.IMAGE_W, cfg.IMAGE_DEPTH)
     roi_crop = (cfg.ROI_CROP_TOP, cfg.ROI_CROP_BOTTOM)
 
     if model_type == "tflite_linear":
+        from donkeycar.parts.tflite import TFLitePilot
         kl = TFLitePilot()
     elif model_type == "localizer" or cfg.TRAIN_LOCALIZER:
+        from donkeycar.parts.keras import KerasLocalizer
         kl = KerasLocalizer(num_locations=cfg.NUM_LOCATIONS, input_shape=input_shape)
     elif model_type == "behavior" or cfg.TRAIN_BEHAVIORS:
+        from donkeycar.parts.keras import KerasBehavioral
         kl = KerasBehavioral(num_outputs=2, num_behavior_inputs=len(cfg.BEHAVIOR_LIST), input_shape=input_shape)
     elif model_type == "imu":
+        from donkeycar.parts.keras import KerasIMU
         kl = KerasIMU(num_outputs=2, num_imu_inputs=2, input_shape=input_shape, roi_crop=roi_crop)
     elif model_type == "linear":
+        from donkeycar.parts.keras import KerasLinear
         kl = KerasLinear(input_shape=input_shape, roi_crop=roi_crop)
     elif model_type == "tensorrt_linear":
         # Aggressively lazy load this. This module imports pycuda.autoinit which causes a lot of unexpected things
@@ -488,12 +493,16 @@ def get_model_by_type(model_type, cfg):
         from donkeycar.parts.coral import CoralImuPilot
         kl = CoralImuPilot()
     elif model_type == "3d":
+        from donkeycar.parts.keras import Keras3D_CNN
         kl = Keras3D_CNN(image_w=cfg.IMAGE_W, image_h=cfg.IMAGE_H, image_d=cfg.IMAGE_DEPTH, seq_length=cfg.SEQUENCE_LENGTH, roi_crop=roi_crop)
     elif model_type == "rnn":
+        from donkeycar.parts.keras import KerasRNN_LSTM
         kl = KerasRNN_LSTM(image_w=cfg.IMAGE_W, image_h=cfg.IMAGE_H, image_d=cfg.IMAGE_DEPTH, seq_length=cfg.SEQUENCE_LENGTH, roi_crop=roi_crop)
     elif model_type == "categorical":
+        from donkeycar.parts.keras import KerasCategorical
         kl = KerasCategorical(input_shape=input_shape, throttle_range=cfg.MODEL_CATEGORICAL_MAX_THROTTLE_RANGE, roi_crop=roi_crop)
     elif model_type == "latent":
+        from donkeycar.parts.keras import KerasLatent
         kl = KerasLatent(input_shape=input_shape)
     elif model_type == "fastai":
         from donkeycar.parts.fastai import FastAiPilot
@@ -6,55 +6,400 @@ Created on Sun Jun 25 10:44:24 2017
 @author: wroscoe
 """
 
+import threading
 import time
-import numpy as np
 from threading import Thread
-from .memory import Memory
+from concurrent.futures import ThreadPoolExecutor, TimeoutError, wait, \
+    FIRST_COMPLETED
+from .memory import Memory, Handoff
+from .profiler import PartProfiler, Tracer, part_name
+from .process import ProcessPart
+from .event_loop import EventLoopThread, is_coroutine_method
+from .graph import PartGraph, reads as graph_reads
+from . import startup
 from prettytable import PrettyTable
 import traceback
 
 
-class PartProfiler:
-    def __init__(self):
-        self.records = {}
+class LoopTimer:
+    """
+    Paces the drive loop against absolute tick deadlines on
+    time.monotonic_ns(), so sleep errors do not add up into drift and wall
+    clock jumps have no effect. It also keeps streaming statistics of the
+    loop period, the jitter against the target period and the overruns.
 
-    def profile_part(self, p):
-        self.records[p] = { "times" : [] }
+    When a tick overruns its deadline the next one starts right away. The
+    overrun_policy decides what happens to the deadlines missed meanwhile:
+    'catch_up' keeps them, so ticks run back to back until the loop is on
+    schedule again, while 'drop' skips them and counts them as dropped.
+    """
+    POLICIES = ('catch_up', 'drop')
 
-    def on_part_start(self, p):
-        self.records[p]['times'].append(time.time())
+    def __init__(self, rate_hz, overrun_policy='drop'):
+        assert overrun_policy in self.POLICIES, \
+            "overrun_policy is not one of %r: %r" % (self.POLICIES, overrun_policy)
+        self.rate_hz = rate_hz
+        self.period_ns = int(1e9 / rate_hz)
+        self.overrun_policy = overrun_policy
+        self.deadline_ns = None
+        self.tick_start_ns = None
+        self.count = 0
+        self.period_mean = 0.0
+        self.period_m2 = 0.0
+        self.period_min = None
+        self.period_max = None
+        self.jitter_mean = 0.0
+        self.jitter_max = 0
+        self.overruns = 0
+        self.dropped = 0
+        self.timeouts = 0
 
-    def on_part_finished(self, p):
-        now = time.time()
-        prev = self.records[p]['times'][-1]
-        delta = now - prev
-        thresh = 0.000001
-        if delta < thresh or delta > 100000.0:
-            delta = thresh
-        self.records[p]['times'][-1] = delta
+    def set_rate(self, rate_hz):
+        """
+        Change the loop rate from the next tick on.
+        """
+        period_ns = int(1e9 / rate_hz)
+        if self.deadline_ns is not None:
+            self.deadline_ns += period_ns - self.period_ns
+        self.rate_hz = rate_hz
+        self.period_ns = period_ns
+
+    def start(self):
+        now = time.monotonic_ns()
+        self.tick_start_ns = now
+        self.deadline_ns = now + self.period_ns
+
+    def wait(self):
+        """
+        Sleep until the deadline of the next tick. Returns how late the
+        tick starts in nanoseconds, 0 when the deadline was met.
+        """
+        if self.deadline_ns is None:
+            self.start()
+            return 0
+
+        now = time.monotonic_ns()
+        deadline = self.deadline_ns
+        late = now - deadline
+        if late < 0:
+            time.sleep(-late / 1e9)
+            now = time.monotonic_ns()
+            late = 0
+            self.deadline_ns = deadline + self.period_ns
+        else:
+            self.overruns += 1
+            if self.overrun_policy == 'drop':
+                missed = late // self.period_ns + 1
+                self.dropped += missed - 1
+                self.deadline_ns = deadline + missed * self.period_ns
+            else:
+                self.deadline_ns = deadline + self.period_ns
+
+        self.on_period(now - self.tick_start_ns)
+        self.tick_start_ns = now
+        return late
+
+    def wait_for(self, wait_for_event, timeout):
+        """
+        Start the next tick when wait_for_event(timeout) returns True
+        instead of on a deadline, as when ticking on camera frames. Returns
+        the timeout in nanoseconds when the event did not come, 0 otherwise.
+        """
+        if wait_for_event(timeout):
+            late = 0
+        else:
+            self.timeouts += 1
+            late = int(timeout * 1e9)
+        now = time.monotonic_ns()
+        self.on_period(now - self.tick_start_ns)
+        self.tick_start_ns = now
+        return late
+
+    def on_period(self, period):
+        # Welford's online mean and variance
+        self.count += 1
+        delta = period - self.period_mean
+        self.period_mean += delta / self.count
+        self.period_m2 += delta * (period - self.period_mean)
+        if self.period_min is None or period < self.period_min:
+            self.period_min = period
+        if self.period_max is None or period > self.period_max:
+            self.period_max = period
+        jitter = abs(period - self.period_ns)
+        self.jitter_mean += (jitter - self.jitter_mean) / self.count
+        self.jitter_max = max(self.jitter_max, jitter)
+
+    @property
+    def period_std(self):
+        if self.count < 2:
+            return 0.0
+        return (self.period_m2 / (self.count - 1)) ** 0.5
 
     def report(self):
-        print("Part Profile Summary: (times in ms)")
+        if self.count == 0:
+            return
+        print("Loop Timing Summary: (times in ms, target period %.2f)"
+              % (self.period_ns / 1e6))
         pt = PrettyTable()
-        field_names = ["part", "max", "min", "avg"]
-        pctile = [50, 90, 99, 99.9]
-        pt.field_names = field_names + [str(p) + '%' for p in pctile]
-        for p, val in self.records.items():
-            # remove first and last entry because you there could be one-off
-            # time spent in initialisations, and the latest diff could be
-            # incomplete because of user keyboard interrupt
-            arr = val['times'][1:-1]
-            if len(arr) == 0:
+        pt.field_names = ["loops", "period avg", "period std", "period min",
+                          "period max", "jitter avg", "jitter max",
+                          "overruns", "dropped", "timeouts"]
+        pt.add_row([self.count,
+                    "%.2f" % (self.period_mean / 1e6),
+                    "%.2f" % (self.period_std / 1e6),
+                    "%.2f" % (self.period_min / 1e6),
+                    "%.2f" % (self.period_max / 1e6),
+                    "%.2f" % (self.jitter_mean / 1e6),
+                    "%.2f" % (self.jitter_max / 1e6),
+                    self.overruns, self.dropped, self.timeouts])
+        print(pt)
+
+
+class PartThread:
+    """
+    Update thread of a threaded part, as run by the ThreadSupervisor.
+    """
+    def __init__(self, entry, update_hz=None):
+        self.entry = entry
+        self.name = part_name(entry['part'])
+        self.update_hz = update_hz
+        self.thread = None
+        self.timer = None
+        self.updates = 0
+        self.cpu_ns = 0
+        self.clock_id = None
+        self.started_ns = None
+        self.finished = False
+        # cpu and wall time at the last spin check
+        self.checked = None
+        self.spinning = False
+
+    def cpu_time_ns(self):
+        """
+        CPU time used by the thread so far. Threads running update_once()
+        keep cpu_ns up to date themselves, a plain update() thread is read
+        through its thread clock where the platform has one.
+        """
+        if self.clock_id is not None and not self.finished:
+            try:
+                return time.clock_gettime_ns(self.clock_id)
+            except OSError:
+                pass
+        return self.cpu_ns
+
+
+class ThreadSupervisor:
+    """
+    Runs the update threads of threaded parts.
+
+    Parts with an update_once() method are called in a loop for as long as
+    the vehicle is on, at no more than their update_hz when given. The CPU
+    time of every thread is measured with time.thread_time, so that parts
+    busy waiting in their thread, which take CPU from inference and slow
+    down the drive loop through the GIL, show up in check() and report().
+    On stop the threads are joined, waiting at most join_timeout seconds.
+    """
+    def __init__(self, vehicle, spin_threshold=0.5, join_timeout=2.0):
+        self.vehicle = vehicle
+        self.spin_threshold = spin_threshold
+        self.join_timeout = join_timeout
+        self.threads = []
+
+    def add(self, entry, update_hz=None):
+        supervised = PartThread(entry, update_hz)
+        supervised.thread = Thread(target=self.run, args=(supervised,),
+                                   name=supervised.name)
+        supervised.thread.daemon = True
+        self.threads.append(supervised)
+        return supervised
+
+    def remove(self, entry):
+        self.threads = [t for t in self.threads if t.entry is not entry]
+
+    def start(self):
+        for supervised in self.threads:
+            if supervised.started_ns is None:
+                supervised.started_ns = time.monotonic_ns()
+                supervised.thread.start()
+
+    def run(self, supervised):
+        '''
+        body of the thread of a threaded part
+        '''
+        part = supervised.entry['part']
+        vehicle = self.vehicle
+        clock = time.perf_counter_ns
+        cpu_clock = time.thread_time_ns
+        cpu_start = cpu_clock()
+        if vehicle.sched_profile is not None:
+            vehicle.sched_profile.apply_to_part(supervised.name)
+        trace = None
+        if vehicle.tracer is not None:
+            trace = vehicle.tracer.recorder(supervised.name + '.update')
+
+        update_once = getattr(part, 'update_once', None)
+        if update_once is not None:
+            update_once = vehicle.profiler.measure_allocations(
+                part, update_once, 'update')
+        try:
+            if update_once is None:
+                if hasattr(time, 'pthread_getcpuclockid'):
+                    supervised.clock_id = time.pthread_getcpuclockid(
+                        threading.get_ident())
+                start = clock()
+                part.update()
+                if trace:
+                    trace(start, clock())
+                supervised.updates += 1
+                return
+
+            timer = None
+            if supervised.update_hz:
+                timer = LoopTimer(supervised.update_hz)
+                timer.start()
+                supervised.timer = timer
+            while vehicle.on:
+                start = clock()
+                update_once()
+                if trace:
+                    trace(start, clock())
+                supervised.updates += 1
+                supervised.cpu_ns = cpu_clock() - cpu_start
+                if timer is not None:
+                    timer.wait()
+        finally:
+            supervised.cpu_ns = cpu_clock() - cpu_start
+            supervised.finished = True
+
+    def check(self):
+        """
+        Find the threads that used more than spin_threshold of a core since
+        the last check, and warn about each the first time. Returns their
+        names.
+        """
+        now = time.monotonic_ns()
+        spinning = []
+        for supervised in self.threads:
+            if supervised.started_ns is None or supervised.finished:
+                continue
+            cpu = supervised.cpu_time_ns()
+            last_cpu, last_wall = supervised.checked or (0, supervised.started_ns)
+            supervised.checked = (cpu, now)
+            if now <= last_wall:
                 continue
-            row = [p.__class__.__name__,
-                   "%.2f" % (max(arr) * 1000),
-                   "%.2f" % (min(arr) * 1000),
-                   "%.2f" % (sum(arr) / len(arr) * 1000)]
-            row += ["%.2f" % (np.percentile(arr, p) * 1000) for p in pctile]
-            pt.add_row(row)
+            share = (cpu - last_cpu) / (now - last_wall)
+            if share >= self.spin_threshold:
+                spinning.append(supervised.name)
+                if not supervised.spinning:
+                    print('WARN::Vehicle: thread of part {} uses {:.0f}% of a '
+                          'core, it may be busy waiting. Give it a sleep or '
+                          'an update_hz.'.format(supervised.name, share * 100))
+                supervised.spinning = True
+        return spinning
+
+    def join(self):
+        """
+        Wait for the threads to finish, join_timeout seconds at most for
+        all of them. Returns the names of the threads still running.
+        """
+        deadline = time.monotonic() + self.join_timeout
+        running = []
+        for supervised in self.threads:
+            if supervised.started_ns is None:
+                continue
+            supervised.thread.join(max(0.0, deadline - time.monotonic()))
+            if supervised.thread.is_alive():
+                running.append(supervised.name)
+        if running:
+            print('WARN::Vehicle: threads still running after {}s: {}'.format(
+                self.join_timeout, ', '.join(running)))
+        return running
+
+    def report(self):
+        started = [t for t in self.threads if t.started_ns is not None]
+        if not started:
+            return
+        print("Part Thread Summary:")
+        now = time.monotonic_ns()
+        pt = PrettyTable()
+        pt.field_names = ["thread", "updates", "update Hz", "cpu s",
+                          "cpu %", "spinning", "running"]
+        for supervised in started:
+            wall = (now - supervised.started_ns) / 1e9
+            cpu = supervised.cpu_time_ns() / 1e9
+            pt.add_row([supervised.name,
+                        supervised.updates,
+                        "%.1f" % (supervised.updates / wall) if wall else "-",
+                        "%.2f" % cpu,
+                        "%.0f" % (100 * cpu / wall) if wall else "-",
+                        "yes" if supervised.spinning else "",
+                        "yes" if supervised.thread.is_alive() else ""])
         print(pt)
 
 
+def build_dependencies(parts):
+    """
+    Find the earlier parts each part entry has to wait for.
+
+    A part depends on an earlier part when it reads a channel the earlier
+    part writes, writes a channel the earlier part reads, or writes the
+    same channel. The run_condition counts as an input, and an input like
+    'channel[-2]' as a read of the channel, whose history the writer
+    updates.
+
+    Parameters
+    ----------
+        parts : list
+            Part entries as stored in Vehicle.parts.
+
+    Returns
+    -------
+        list with the indexes of the earlier parts each part depends on.
+    """
+    dependencies = []
+    placed = []
+    for entry in parts:
+        reads = graph_reads(entry)
+        writes = set(entry['outputs'])
+
+        dependencies.append([ix for ix, (prev_reads, prev_writes)
+                             in enumerate(placed)
+                             if (reads & prev_writes) or (writes & prev_reads)
+                             or (writes & prev_writes)])
+        placed.append((reads, writes))
+    return dependencies
+
+
+def build_stages(parts):
+    """
+    Group part entries into stages that can run concurrently.
+
+    Each part is placed in the stage after its latest dependency, see
+    build_dependencies, so parts within a stage share no channels and keep
+    the order they were added in. The drive loop does not wait for whole
+    stages, it starts every part once the parts it depends on are done,
+    the stages only tell how wide the part graph is.
+
+    Parameters
+    ----------
+        parts : list
+            Part entries as stored in Vehicle.parts.
+
+    Returns
+    -------
+        list of lists of part entries, in execution order.
+    """
+    stages = []
+    placed = []
+    for entry, dependencies in zip(parts, build_dependencies(parts)):
+        stage = max([placed[ix] + 1 for ix in dependencies] + [0])
+        placed.append(stage)
+        if stage == len(stages):
+            stages.append([])
+        stages[stage].append(entry)
+    return stages
+
+
 class Vehicle:
     def __init__(self, mem=None):
 
@@ -63,54 +408,196 @@ class Vehicle:
         self.mem = mem
         self.parts = []
         self.on = True
-        self.threads = []
         self.profiler = PartProfiler()
+        self.parallel = False
+        self.executor = None
+        self.plan = None
+        self.timer = None
+        self.rate_hz = None
+        self.tracer = None
+        self.trace_path = None
+        self.supervisor = ThreadSupervisor(self)
+        self.sched_profile = None
+        self.event_loop = EventLoopThread()
+        self.prune = False
+        # (part, new part) swaps for the drive loop to make
+        self.replacements = []
 
     def add(self, part, inputs=[], outputs=[],
-            threaded=False, run_condition=None):
+            threaded=False, run_condition=None, rate_hz=None, divisor=1,
+            tick_on_frame=False, budget=None, process=False,
+            update_hz=None):
         """
         Method to add a part to the vehicle drive loop.
 
+        A part that is neither threaded nor in a process can define
+        coroutine methods to run on the event loop the vehicle shares
+        between its I/O-bound parts, see donkeycar.event_loop. Its
+        start_async() is awaited when the vehicle starts, and its
+        run_async() is scheduled in place of run(). The drive loop does not
+        wait for run_async() unless the part has a budget, and saves its
+        outputs on the first loop that finds it done. It is not scheduled
+        again while the last run is still going.
+
         Parameters
         ----------
             part: class
                 donkey vehicle part has run() attribute
             inputs : list
-                Channel names to get from memory.
+                Channel names to get from memory. A name like 'channel[-2]'
+                reads the value before the latest one and 'channel[-3:]'
+                the latest three values stacked, oldest first.
             outputs : list
                 Channel names to save to memory.
             threaded : boolean
-                If a part should be run in a separate thread.
+                If a part should be run in a separate thread. The thread
+                calls the part's update(), or, if the part has an
+                update_once() method doing one iteration of its update
+                loop, calls update_once() for as long as the vehicle is on.
             run_condition : boolean
                 If a part should be run or not
+            rate_hz : float
+                Run the part at about this rate instead of every loop.
+                Converted to a divisor of the drive loop rate at start.
+            divisor : int
+                Run the part every divisor loops only. Its outputs keep
+                their last values in memory in between.
+            tick_on_frame : boolean
+                Start each drive loop when this part has a new frame rather
+                than at a fixed rate. The part needs a wait_for_frame()
+                method, like the cameras derived from BaseCamera.
+            budget : float
+                Longest time in seconds the drive loop waits for the part.
+                The part then runs on a worker thread of its own, and when
+                it takes longer the loop moves on with its last outputs
+                left in memory. The late outputs are saved on the next loop
+                that finds the part done, and the part is not run again
+                until then. Misses are counted in the profiler report.
+                A part with run_async() runs on the event loop instead of
+                a worker thread.
+            process : boolean
+                Run the part in a child process of its own, so it does not
+                compete for the GIL with the drive loop. Its channels are
+                passed through shared memory, see ProcessPart. Like a
+                threaded part, the drive loop gets its latest outputs
+                without waiting for the current run. The child is forked
+                right away, so add such parts before starting any thread,
+                like a model loading in the background.
+            update_hz : float
+                Call the update_once() of a threaded part at no more than
+                this rate, so a polling loop does not spin a whole core.
         """
         assert type(inputs) is list, "inputs is not a list: %r" % inputs
         assert type(outputs) is list, "outputs is not a list: %r" % outputs
         assert type(threaded) is bool, "threaded is not a boolean: %r" % threaded
+        assert type(divisor) is int and divisor > 0, \
+            "divisor is not a positive integer: %r" % divisor
+        assert not tick_on_frame or hasattr(part, 'wait_for_frame'), \
+            "part has no wait_for_frame method to tick on: %r" % part
+        assert budget is None or budget > 0, \
+            "budget is not a positive number of seconds: %r" % budget
+        assert type(process) is bool, "process is not a boolean: %r" % process
+        assert update_hz is None or (threaded and hasattr(part, 'update_once')), \
+            "update_hz needs a threaded part with update_once: %r" % part
 
         p = part
         print('Adding part {}.'.format(p.__class__.__name__))
+        startup.profiler.part_added(part_name(p))
+        if process:
+            # the part itself runs threaded or not in the child process
+            part = p = ProcessPart(part, inputs, outputs, threaded, update_hz)
+            threaded = False
+            p.start()
         entry = {}
         entry['part'] = p
         entry['inputs'] = inputs
         entry['outputs'] = outputs
         entry['run_condition'] = run_condition
+        entry['rate_hz'] = rate_hz
+        entry['divisor'] = divisor
+        entry['tick_on_frame'] = tick_on_frame
+        entry['budget'] = budget
+        entry['process'] = process
+        entry['async'] = not threaded and is_coroutine_method(p, 'run_async')
+
+        # give every channel its memory slot up front, and start keeping
+        # history for inputs like 'channel[-2]' or 'channel[-3:]'
+        for key in inputs:
+            self.mem.reader(key)
+        for key in outputs + ([run_condition] if run_condition else []):
+            self.mem.slot(key)
 
         if threaded:
-            t = Thread(target=part.update, args=())
-            t.daemon = True
-            entry['thread'] = t
+            supervised = self.supervisor.add(entry, update_hz)
+            entry['thread'] = supervised.thread
 
         self.parts.append(entry)
         self.profiler.profile_part(part)
+        for name, value in list(getattr(part, '__dict__', {}).items()):
+            if isinstance(value, Handoff):
+                self.profiler.profile_handoff(part, name, value)
+        # the drive loop recompiles its plan on the next tick
+        self.plan = None
 
     def remove(self, part):
         """
         remove part form list
         """
         self.parts.remove(part)
+        self.supervisor.remove(part)
+        self.plan = None
+
+    def replace(self, part, new_part):
+        """
+        Swap a part of the vehicle for a new one, with the same inputs,
+        outputs and options, like a tub writer for one writing a new tub.
 
-    def start(self, rate_hz=10, max_loop_count=None, verbose=False):
+        The swap is made by the drive loop before its next tick, so it
+        can be asked for from any thread. The loop waits for the run of
+        the old part still going, if any, then shuts the old part down.
+        Threaded parts and parts in a process can not be replaced.
+        """
+        parts = [entry['part'] for entry in self.parts
+                 if not entry.get('thread') and not entry.get('process')]
+        parts += [new for _, new in self.replacements]
+        assert any(p is part for p in parts), \
+            "not a part that can be replaced: %r" % part
+        self.replacements.append((part, new_part))
+        self.plan = None
+
+    def make_replacements(self):
+        '''
+        swap the parts asked for by replace()
+        '''
+        while self.replacements:
+            part, new_part = self.replacements.pop(0)
+            entry = next(entry for entry in self.parts
+                         if entry['part'] is part)
+            self.drain_pending([entry])
+            try:
+                part.shutdown()
+            except AttributeError:
+                pass
+            print('Replacing part {}.'.format(part_name(part)))
+            entry['part'] = new_part
+            entry['async'] = is_coroutine_method(new_part, 'run_async')
+            self.profiler.profile_part(new_part)
+
+    def set_rate(self, rate_hz):
+        """
+        Change the rate of the running drive loop. The parts added with a
+        rate_hz get their divisors of the new rate when the plan is
+        compiled again, on the next tick.
+        """
+        self.rate_hz = rate_hz
+        if self.timer is not None:
+            self.timer.set_rate(rate_hz)
+        self.plan = None
+
+    def start(self, rate_hz=10, max_loop_count=None, verbose=False,
+              parallel=False, max_workers=None, overrun_policy='drop',
+              trace_path=None, frame_timeout=None, sched_profile=None,
+              prune=False, alloc_sample=None):
         """
         Start vehicle's main drive loop.
 
@@ -129,43 +616,152 @@ class Vehicle:
             used for testing that all the parts of the vehicle work.
         verbose: bool
             If debug output should be printed into shell
+        parallel: bool
+            If parts that share no channels should run concurrently on a
+            thread pool. Parts still run in the order they were added
+            wherever one consumes or overwrites the channels of another.
+        max_workers: int
+            Size of the thread pool used when parallel is set. Defaults
+            to the widest stage of the part graph.
+        overrun_policy: str
+            What to do with the tick deadlines missed when a loop overruns:
+            'catch_up' runs the late ticks back to back, 'drop' skips them.
+            See LoopTimer.
+        trace_path: str
+            When given, record every part run and threaded part update
+            and save them to this path as a Chrome trace-event JSON file
+            when the vehicle stops.
+        frame_timeout: float
+            When a part was added with tick_on_frame, the longest time in
+            seconds to wait for its next frame before running the loop
+            anyway. Defaults to two periods of rate_hz.
+        sched_profile: SchedulingProfile
+            Cores and real-time priority for the drive loop and the update
+            threads of the parts, see donkeycar.scheduling. Threads the
+            drive loop starts itself, like the parallel scheduler workers,
+            share its cores and priority.
+        prune: bool
+            Skip the parts whose outputs no other part reads, see
+            PartGraph.dead_parts. Parts without outputs and parts with a
+            true side_effects attribute are always run. The channels
+            nobody reads or writes and the channels written twice are
+            reported either way.
+        alloc_sample: int
+            When given, trace memory allocations with tracemalloc and
+            measure the memory allocated by every alloc_sample-th run of
+            each part and update_once() of each threaded part. The net and
+            peak allocations of each are reported with the part timings,
+            followed by the source files whose allocations grew the most.
+            Tracing slows down every allocation, so keep it off unless
+            looking for a leak.
         """
 
         try:
 
             self.on = True
+            startup.profiler.milestone('vehicle start')
 
-            for entry in self.parts:
-                if entry.get('thread'):
-                    # start the update thread
-                    entry.get('thread').start()
+            self.rate_hz = rate_hz
+
+            if trace_path:
+                self.tracer = Tracer()
+                self.trace_path = trace_path
+
+            graph = PartGraph(self.parts, self.mem)
+            graph.report()
+            self.prune = prune
+            if prune:
+                dead = graph.dead_parts()
+                if dead:
+                    print('Skipping parts whose outputs are never read: {}'
+                          .format(', '.join(part_name(entry['part'])
+                                            for entry in dead)))
+
+            if alloc_sample:
+                self.profiler.track_allocations(alloc_sample)
+
+            if parallel:
+                stages = build_stages(self.parts)
+                widest = max([len(stage) for stage in stages] + [1])
+                self.parallel = True
+                self.executor = ThreadPoolExecutor(
+                    max_workers=max_workers or widest)
+                print('Parallel schedule: {} parts in {} stages'.format(
+                    len(self.parts), len(stages)))
+            self.compile()
+
+            # start the update threads
+            self.sched_profile = sched_profile
+            self.supervisor.start()
+            self.start_async_parts()
+
+            # pin the loop only now, so the part threads do not inherit it
+            if sched_profile is not None:
+                sched_profile.apply_to_loop()
 
             # wait until the parts warm up.
             print('スタート前確認、スロットル値調整、AiLauncher ON(R2)、"Select"->local_Angle、"Startボタン”')
             print('Starting vehicle at {} Hz'.format(rate_hz))
 
+            self.timer = LoopTimer(rate_hz, overrun_policy)
+            self.timer.start()
+
+            # tick on the frames of a camera instead of the clock
+            frame_part = None
+            for entry in self.parts:
+                if entry.get('tick_on_frame'):
+                    frame_part = entry['part']
+            if frame_part is not None:
+                frame_timeout = frame_timeout or 2.0 / rate_hz
+                print('Vehicle loop runs on new frames from {}'.format(
+                    frame_part.__class__.__name__))
+
+            # look for spinning part threads every 5 seconds or so
+            spin_check_loops = max(1, int(5 * rate_hz))
+
+            # the vehicle can drive once the part threads, like the camera,
+            # have given all their outputs
+            drivable = False
+            sensor_outputs = [key for entry in self.parts
+                              if entry.get('thread') or entry.get('process')
+                              for key in entry['outputs']]
+
             loop_count = 0
             while self.on:
-                start_time = time.time()
                 loop_count += 1
 
                 self.update_parts()
 
+                if not drivable:
+                    drivable = self.check_drivable(sensor_outputs)
+
                 # stop drive loop if loop_count exceeds max_loopcount
                 if max_loop_count and loop_count > max_loop_count:
                     self.on = False
 
-                sleep_time = 1.0 / rate_hz - (time.time() - start_time)
-                if sleep_time > 0.0:
-                    time.sleep(sleep_time)
+                if not self.on:
+                    # the part threads stop with the loop, no frame is coming
+                    late = 0
+                elif frame_part is not None:
+                    late = self.timer.wait_for(frame_part.wait_for_frame,
+                                               frame_timeout)
                 else:
+                    late = self.timer.wait()
+                if late and verbose:
                     # print a message when could not maintain loop rate.
-                    if verbose:
-                        print('WARN::Vehicle: jitter violation in vehicle loop '
-                              'with {0:4.0f}ms'.format(abs(1000 * sleep_time)))
+                    print('WARN::Vehicle: jitter violation in vehicle loop '
+                          'with {0:4.0f}ms'.format(late / 1e6))
+
+                if loop_count % spin_check_loops == 0:
+                    self.supervisor.check()
 
                 if verbose and loop_count % 200 == 0:
-                    self.profiler.report()
+                    # format the report off the drive loop thread
+                    t = Thread(target=self.profiler.report,
+                               args=(self.profiler.snapshot(),
+                                     self.profiler.allocation_snapshot()))
+                    t.daemon = True
+                    t.start()
 
         except KeyboardInterrupt:
             pass
@@ -174,39 +770,381 @@ class Vehicle:
         finally:
             self.stop()
 
+    def check_drivable(self, sensor_outputs):
+        '''
+        after a loop, whether the outputs of all the part threads are in
+        memory. The first time, report the startup times.
+        '''
+        startup.profiler.milestone('first tick')
+        if any(self.mem[key] is None for key in sensor_outputs):
+            return False
+        startup.profiler.milestone('first drivable tick')
+        print('Drivable {:.2f}s after the import of donkeycar'.format(
+            startup.profiler.elapsed('first drivable tick')))
+        # format the report off the drive loop thread
+        t = Thread(target=startup.profiler.report)
+        t.daemon = True
+        t.start()
+        return True
+
+    def start_async_parts(self):
+        '''
+        start the event loop thread if any part uses it, and await the
+        start_async() of the parts
+        '''
+        parts = [entry['part'] for entry in self.parts
+                 if not entry.get('thread') and not entry.get('process')]
+        starting = [p for p in parts if is_coroutine_method(p, 'start_async')]
+        if not starting and not any(entry.get('async')
+                                    for entry in self.parts):
+            return
+        self.event_loop.start()
+        for p in starting:
+            print('Starting {} on the event loop'.format(p.__class__.__name__))
+            self.event_loop.submit(p.start_async()).result()
+
     def update_parts(self):
         '''
         loop over all parts
         '''
-        for entry in self.parts:
+        plan = self.plan
+        if plan is None:
+            plan = self.compile()
+        self.mem.tick += 1
+        start = time.perf_counter_ns()
+        for step in plan:
+            step()
+        self.profiler.on_loop(time.perf_counter_ns() - start)
+
+    def compile(self):
+        """
+        Compile the part list into the plan run by update_parts.
+
+        Every step is a closure with the part method, memory channels and
+        run condition bound ahead of time, so a tick does no lookups
+        beyond the part calls themselves. When running in parallel, the
+        parts are wrapped into a single step that starts each of them on
+        the thread pool once the parts it depends on are done. Adding or
+        removing a part drops the plan so it is compiled again on the next
+        tick. With prune set, the parts whose outputs are never read are
+        left out.
+        """
+        self.make_replacements()
+        parts = self.parts
+        if self.prune:
+            dead = set(id(entry) for entry in PartGraph(parts).dead_parts())
+            parts = [entry for entry in parts if id(entry) not in dead]
+
+        # spread parts running at the same divisor over different ticks
+        phases = {}
+        for ix, entry in enumerate(parts):
+            phases[id(entry)] = ix % self.part_divisor(entry)
+
+        plan = [self.compile_part(entry, phases[id(entry)]) for entry in parts]
+        if self.parallel and any(len(stage) > 1
+                                 for stage in build_stages(parts)):
+            plan = [self.compile_graph(plan, build_dependencies(parts))]
+        self.plan = plan
+        return plan
+
+    def compile_graph(self, steps, dependencies):
+        '''
+        make a step that runs the steps on the thread pool, each as soon as
+        the steps it depends on are done
+        '''
+        submit = self.executor.submit
+        dependents = [[] for _ in steps]
+        for ix, earlier in enumerate(dependencies):
+            for dependency in earlier:
+                dependents[dependency].append(ix)
+        counts = [len(earlier) for earlier in dependencies]
+        roots = [ix for ix, count in enumerate(counts) if not count]
+
+        def run_graph():
+            waiting = list(counts)
+            running = {submit(steps[ix]): ix for ix in roots}
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    ix = running.pop(future)
+                    # re-raise any part error
+                    future.result()
+                    for dependent in dependents[ix]:
+                        waiting[dependent] -= 1
+                        if not waiting[dependent]:
+                            running[submit(steps[dependent])] = dependent
+
+        return run_graph
+
+    def part_divisor(self, entry):
+        '''
+        number of loops between two runs of a part
+        '''
+        divisor = entry.get('divisor', 1)
+        if entry.get('rate_hz') and self.rate_hz:
+            divisor *= max(1, int(round(self.rate_hz / entry['rate_hz'])))
+        return divisor
+
+    def compile_part(self, entry, phase=0):
+        '''
+        make a step that runs a single part entry against the memory
+        '''
+        step = self.compile_run(entry)
+        divisor = self.part_divisor(entry)
+        if divisor == 1:
+            return step
+
+        mem = self.mem
+
+        def divided_step():
+            # skip the ticks where the part is not due
+            if mem.tick % divisor == phase:
+                step()
+
+        return divided_step
+
+    def compile_run(self, entry):
+        '''
+        make a step that runs a part and saves its outputs, if its run
+        condition is set
+        '''
+        part = entry['part']
+        inputs = entry['inputs']
+        outputs = entry['outputs']
+        condition = entry.get('run_condition')
+        if entry.get('thread'):
+            method = part.run_threaded
+        elif entry.get('async'):
+            method = part.run_async
+        else:
+            method = part.run
+        if not entry.get('async'):
+            # a coroutine allocates once awaited, on the event loop
+            method = self.profiler.measure_allocations(part, method)
 
-            run = True
+        if not inputs:
+            call = method
+        elif len(inputs) == 1 and inputs[0] in self.mem.slots:
+            input_store, input_ix = self.mem.slot(inputs[0])
+
+            def call():
+                return method(input_store[input_ix])
+        else:
+            # the update thread of the part may still use a history window
+            # after the drive loop wrote the channel again
+            get_inputs = self.mem.getter(inputs,
+                                         copy=bool(entry.get('thread')))
+
+            def call():
+                return method(*get_inputs())
+
+        store = self.mem.setter(outputs)
+        if condition:
+            condition_store, condition_ix = self.mem.slot(condition)
+
+        record = self.profiler.recorder(part)
+        clock = time.perf_counter_ns
+
+        if entry.get('async'):
+            trace = None
+            if self.tracer is not None:
+                trace = self.tracer.recorder(part_name(part))
+
+            async def timed_run(args):
+                # the time from start to end, awaits included
+                start = clock()
+                values = await method(*args)
+                end = clock()
+                record(end - start)
+                if trace:
+                    trace(start, end)
+                return values
+
+            get_inputs = self.mem.getter(inputs, copy=True)
+            run = self.compile_async(entry, get_inputs, timed_run, store)
+            if not condition:
+                return run
+
+            def conditional_run():
+                if condition_store[condition_ix]:
+                    run()
+
+            return conditional_run
+
+        if entry.get('budget'):
+            trace = None
+            if self.tracer is not None:
+                trace = self.tracer.recorder(part_name(part))
+
+            def timed_call(args):
+                start = clock()
+                values = method(*args)
+                end = clock()
+                record(end - start)
+                if trace:
+                    trace(start, end)
+                return values
+
+            # inputs are read on the drive loop thread, not the worker, and
+            # history windows copied as the loop goes on writing channels
+            get_inputs = self.mem.getter(inputs, copy=True)
+            run = self.compile_budget(entry, get_inputs, timed_call, store)
+            if not condition:
+                return run
+
+            def conditional_run():
+                if condition_store[condition_ix]:
+                    run()
+
+            return conditional_run
+
+        if self.tracer is not None:
+            trace = self.tracer.recorder(part_name(part))
+
+            def traced_step():
+                if condition and not condition_store[condition_ix]:
+                    return
+                start = clock()
+                values = call()
+                if values is not None:
+                    store(values)
+                end = clock()
+                record(end - start)
+                trace(start, end)
+
+            return traced_step
+
+        def step():
             # check run condition, if it exists
-            if entry.get('run_condition'):
-                run_condition = entry.get('run_condition')
-                run = self.mem.get([run_condition])[0]
-            
-            if run:
-                # get part
-                p = entry['part']
-                # start timing part run
-                self.profiler.on_part_start(p)
-                # get inputs from memory
-                inputs = self.mem.get(entry['inputs'])
-                # run the part
-                if entry.get('thread'):
-                    outputs = p.run_threaded(*inputs)
-                else:
-                    outputs = p.run(*inputs)
+            if condition and not condition_store[condition_ix]:
+                return
+            start = clock()
+            values = call()
+            # save the output to memory
+            if values is not None:
+                store(values)
+            record(clock() - start)
+
+        return step
 
-                # save the output to memory
-                if outputs is not None:
-                    self.mem.put(entry['outputs'], outputs)
-                # finish timing part run
-                self.profiler.on_part_finished(p)
+    def compile_budget(self, entry, get_inputs, call, store):
+        '''
+        make a step that runs call with the inputs on the worker thread of
+        the part, and stores its outputs unless it overruns its budget
+        '''
+        part = entry['part']
+        budget = entry['budget']
+        executor = entry.get('executor')
+        if executor is None:
+            executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix=part.__class__.__name__)
+            # start the worker now, before a scheduling profile pins the
+            # drive loop, so it does not inherit the loop's core and priority
+            executor.submit(int).result()
+            entry['executor'] = executor
+            entry['pending'] = None
+        count_miss = self.profiler.counter(part, 'budget misses')
+
+        def submit(args):
+            return executor.submit(call, args)
+
+        return self.compile_deferred(entry, get_inputs, submit, store,
+                                     count_miss)
+
+    def compile_async(self, entry, get_inputs, run, store):
+        '''
+        make a step that schedules the coroutine run with the inputs on the
+        event loop, and stores its outputs once it is done
+        '''
+        entry.setdefault('pending', None)
+        if entry.get('budget'):
+            count_miss = self.profiler.counter(entry['part'], 'budget misses')
+        else:
+            count_miss = self.profiler.counter(entry['part'], 'still running')
+        event_loop = self.event_loop
+
+        def submit(args):
+            return event_loop.submit(run(args))
+
+        return self.compile_deferred(entry, get_inputs, submit, store,
+                                     count_miss)
+
+    def compile_deferred(self, entry, get_inputs, submit, store, count_miss):
+        '''
+        make a step that submits the part with its inputs and waits up to
+        the budget of the part, if any, for the future submit returns. A
+        future not done by then is kept in entry['pending'] and its outputs
+        are stored on the first loop that finds it done, the part not being
+        submitted again until then.
+        '''
+        budget = entry.get('budget')
+
+        def deferred_step():
+            future = entry['pending']
+            if future is not None:
+                if not future.done():
+                    # still busy with an earlier loop
+                    count_miss()
+                    return
+                entry['pending'] = None
+                values = future.result()
+                if values is not None:
+                    store(values)
+
+            future = submit(get_inputs())
+            if not budget:
+                entry['pending'] = future
+                return
+            try:
+                values = future.result(timeout=budget)
+            except TimeoutError:
+                # keep the last outputs and collect these ones later
+                entry['pending'] = future
+                count_miss()
+                return
+            if values is not None:
+                store(values)
+
+        return deferred_step
+
+    def drain_pending(self, entries):
+        '''
+        wait for the runs of budget and async part entries still going, so
+        a part is not shut down in the middle of a run, but no longer than
+        the join timeout of the part threads in all
+        '''
+        deadline = time.monotonic() + self.supervisor.join_timeout
+        running = []
+        for entry in entries:
+            future = entry.get('pending')
+            if future is not None:
+                try:
+                    future.result(max(0.0, deadline - time.monotonic()))
+                except TimeoutError:
+                    running.append(part_name(entry['part']))
+                except Exception as e:
+                    print(e)
+            executor = entry.pop('executor', None)
+            if executor is not None:
+                # do not wait for a part that is stuck past the timeout
+                executor.shutdown(wait=future is None or future.done())
+            if 'pending' in entry:
+                entry['pending'] = None
+        if running:
+            print('WARN::Vehicle: parts still running after {}s: {}'.format(
+                self.supervisor.join_timeout, ', '.join(running)))
+        return running
 
     def stop(self):        
         print('Shutting down vehicle and its parts...')
+        self.on = False
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+        self.parallel = False
+        self.plan = None
+        self.make_replacements()
+        self.drain_pending(self.parts)
         for entry in self.parts:
             try:
                 entry['part'].shutdown()
@@ -215,5 +1153,19 @@ class Vehicle:
                 pass
             except Exception as e:
                 print(e)
+        self.supervisor.join()
+        # after the shutdown of the parts, so callbacks they queued on the
+        # event loop still run
+        self.event_loop.stop()
 
+        growth = self.profiler.allocation_growth(
+            [entry['part'] for entry in self.parts])
+        self.profiler.stop_allocations()
         self.profiler.report()
+        self.profiler.report_allocation_growth(growth)
+        if self.timer is not None:
+            self.timer.report()
+        self.supervisor.report()
+        if self.tracer is not None:
+            self.tracer.save(self.trace_path)
+            self.tracer = None
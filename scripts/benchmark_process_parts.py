@@ -0,0 +1,137 @@
+"""
+Script to compare running parts in threads and in child processes
+
+Builds a drive loop with a camera, a busy-waiting sensor, an inference
+part that holds the GIL while it works and a tub writer, then runs it once
+with the camera, sensor and inference as threads of the drive loop process
+and once with each of them in a process of its own (Vehicle.add with
+process=True). Prints the loop rate and jitter and how many fresh
+inference results the loop got in each mode.
+
+Usage:
+    benchmark_process_parts.py [--hz=<hz>] [--loops=<n>] [--infer-ms=<ms>] [--tub=<path>]
+
+Options:
+    -h --help         Show this screen.
+    --hz=<hz>         Drive loop rate. [default: 20]
+    --loops=<n>       Number of drive loops per mode. [default: 200]
+    --infer-ms=<ms>   CPU time of one inference. [default: 20]
+    --tub=<path>      Directory for the recorded tubs, a temporary one when not given.
+"""
+import os
+import tempfile
+import time
+from docopt import docopt
+from prettytable import PrettyTable
+import numpy as np
+import donkeycar as dk
+from donkeycar.parts.datastore import TubWriter
+from donkeycar.parts.transform import Lambda
+
+
+class FrameSource:
+    '''
+    camera producing a new random frame at a fixed framerate
+    '''
+    def __init__(self, framerate=20):
+        self.framerate = framerate
+        self.frame = None
+        self.on = True
+
+    def update(self):
+        rng = np.random.RandomState(0)
+        while self.on:
+            self.frame = rng.randint(0, 255, (120, 160, 3), dtype=np.uint8)
+            time.sleep(1.0 / self.framerate)
+
+    def run_threaded(self):
+        return self.frame
+
+    def shutdown(self):
+        self.on = False
+
+
+class SpinningSensor:
+    '''
+    sensor thread polling without sleeping, like the distance sensors
+    '''
+    def __init__(self):
+        self.distance = 0.0
+        self.on = True
+
+    def update(self):
+        while self.on:
+            self.distance = (self.distance + 1.0) % 1000.0
+
+    def run_threaded(self):
+        return self.distance
+
+    def shutdown(self):
+        self.on = False
+
+
+class BusyPilot:
+    '''
+    inference stand-in that holds the GIL for infer_ms per frame
+    '''
+    def __init__(self, infer_ms):
+        self.infer_s = infer_ms / 1000.0
+        self.count = 0
+
+    def run(self, img_arr, distance):
+        if img_arr is None:
+            return None, None, 0
+        end = time.thread_time() + self.infer_s
+        total = 0
+        while time.thread_time() < end:
+            total += 1
+        self.count += 1
+        return float(img_arr.mean() / 255.0 - 0.5), 0.3, self.count
+
+
+def build_vehicle(process, infer_ms, tub_path):
+    V = dk.vehicle.Vehicle()
+    V.add(FrameSource(), outputs=['cam/image_array'], threaded=True,
+          process=process)
+    V.add(SpinningSensor(), outputs=['distance'], threaded=True,
+          process=process)
+    V.add(BusyPilot(infer_ms), inputs=['cam/image_array', 'distance'],
+          outputs=['angle', 'throttle', 'pilot/count'], process=process)
+    inputs = ['cam/image_array', 'angle', 'throttle']
+    types = ['image_array', 'float', 'float']
+    # record once the first frame came through
+    V.add(Lambda(lambda img: img is not None), inputs=['cam/image_array'],
+          outputs=['recording'])
+    V.add(TubWriter(path=tub_path, inputs=inputs, types=types),
+          inputs=inputs, outputs=['tub/num_records'], run_condition='recording')
+    return V
+
+
+def benchmark(rate_hz, loops, infer_ms, tub_dir):
+    pt = PrettyTable()
+    pt.field_names = ['mode', 'loop Hz', 'period std ms', 'jitter max ms',
+                      'overruns', 'inferences', 'records']
+    for mode in ('thread', 'process'):
+        tub_path = os.path.join(tub_dir, 'tub_' + mode)
+        V = build_vehicle(mode == 'process', infer_ms, tub_path)
+        start = time.perf_counter()
+        V.start(rate_hz=rate_hz, max_loop_count=loops)
+        elapsed = time.perf_counter() - start
+        timer = V.timer
+        pt.add_row([mode,
+                    '%.1f' % (loops / elapsed),
+                    '%.2f' % (timer.period_std / 1e6),
+                    '%.2f' % (timer.jitter_max / 1e6),
+                    timer.overruns,
+                    V.mem['pilot/count'],
+                    V.mem['tub/num_records']])
+    print(pt)
+
+
+if __name__ == '__main__':
+    args = docopt(__doc__)
+    with tempfile.TemporaryDirectory() as tmp:
+        benchmark(rate_hz=int(args['--hz']),
+                  loops=int(args['--loops']),
+                  infer_ms=float(args['--infer-ms']),
+                  tub_dir=args['--tub'] or tmp)
@@ -0,0 +1,104 @@
+"""
+Script to measure drive loop jitter with and without a scheduling profile
+
+Runs a light drive loop while other processes and a numpy part thread keep
+the cores busy, the way inference and the web server do on the car. It
+runs once with the default scheduling and once with the drive loop pinned
+to the last core, everything else on the other cores and, with --rt, the
+loop under SCHED_FIFO. Then it prints the tick jitter of both runs.
+
+Usage:
+    benchmark_sched_profile.py [--hz=<hz>] [--loops=<n>] [--load=<n>] [--rt=<prio>]
+
+Options:
+    -h --help      Show this screen.
+    --hz=<hz>      Drive loop rate. [default: 100]
+    --loops=<n>    Number of drive loops per run. [default: 1000]
+    --load=<n>     Number of busy background processes, one per core when 0. [default: 0]
+    --rt=<prio>    Also run the drive loop under SCHED_FIFO at this priority.
+"""
+import multiprocessing
+import os
+from docopt import docopt
+from prettytable import PrettyTable
+import numpy as np
+import donkeycar as dk
+from donkeycar.parts.transform import Lambda
+from donkeycar.scheduling import SchedulingProfile
+
+
+def burn(cpus):
+    if cpus:
+        os.sched_setaffinity(0, cpus)
+    while True:
+        pass
+
+
+class MatMul:
+    '''
+    threaded part doing numpy work, which releases the GIL
+    '''
+    def __init__(self):
+        self.a = np.random.rand(200, 200)
+        self.result = None
+
+    def update_once(self):
+        self.result = float(np.dot(self.a, self.a).sum())
+
+    def run_threaded(self):
+        return self.result
+
+
+def run(rate_hz, loops, num_load, profile, results):
+    load_cpus = profile.default_cpus if profile else None
+    burners = [multiprocessing.Process(target=burn, args=(load_cpus,), daemon=True)
+               for _ in range(num_load)]
+    for p in burners:
+        p.start()
+    try:
+        V = dk.vehicle.Vehicle()
+        V.add(MatMul(), outputs=['matmul'], threaded=True)
+        V.add(Lambda(lambda x: x), inputs=['matmul'], outputs=['out'])
+        V.start(rate_hz=rate_hz, max_loop_count=loops, sched_profile=profile)
+    finally:
+        for p in burners:
+            p.terminate()
+    timer = V.timer
+    results.put([timer.period_mean, timer.period_std, timer.jitter_mean,
+                 timer.jitter_max, timer.overruns])
+
+
+def benchmark(rate_hz, loops, num_load, rt_priority):
+    cpus = sorted(os.sched_getaffinity(0))
+    num_load = num_load or len(cpus)
+    profile = SchedulingProfile(default_cpus=cpus[:-1] or cpus,
+                                loop_cpus=cpus[-1:],
+                                realtime_priority=rt_priority)
+    pt = PrettyTable()
+    pt.field_names = ['scheduling', 'period avg ms', 'period std ms',
+                      'jitter avg ms', 'jitter max ms', 'overruns']
+    for name, p in (('default', None), ('profile', profile)):
+        # run each in a process of its own, as pinning the loop thread or
+        # making it real-time can not be undone
+        results = multiprocessing.Queue()
+        child = multiprocessing.Process(
+            target=run, args=(rate_hz, loops, num_load, p, results))
+        child.start()
+        mean, std, jitter_mean, jitter_max, overruns = results.get()
+        child.join()
+        pt.add_row([name,
+                    '%.2f' % (mean / 1e6),
+                    '%.2f' % (std / 1e6),
+                    '%.3f' % (jitter_mean / 1e6),
+                    '%.2f' % (jitter_max / 1e6),
+                    overruns])
+    print('%d cores, %d busy background processes' % (len(cpus), num_load))
+    print(pt)
+
+
+if __name__ == '__main__':
+    args = docopt(__doc__)
+    benchmark(rate_hz=int(args['--hz']),
+              loops=int(args['--loops']),
+              num_load=int(args['--load']),
+              rt_priority=int(args['--rt']) if args['--rt'] else None)
@@ -8,18 +8,17 @@ Note:
     as it selects records to remove.
 '''
 
-import os
+import random
 
 from docopt import docopt
-import json
 
-import donkeycar as dk
-from donkeycar.utils import *
-from donkeycar.parts.datastore import TubGroup
+from donkeycar.parts.datastore import Tub
 
 def main(tub_path, count):
-    cfg = dk.load_config('config.py')
-    records_paths = gather_records(cfg, tub_path)
+    # read and removed through the tub, whether it has a record_N.json file
+    # per record or a catalog
+    tub = Tub(tub_path)
+    ixs = [ix for ix in tub.get_index(shuffled=False) if ix not in tub.exclude]
 
     record_name = "user/angle"
     num_bins = 20
@@ -31,19 +30,17 @@ def main(tub_path, count):
         bins[i] = []
 
 
-    if len(records_paths) <= count:
+    if len(ixs) <= count:
         print("we have fewer records than target count.")
         return
 
     #put the record in a bin based on angle. expecting -1 to 1
-    for record_path in records_paths:
-        with open(record_path, 'r') as fp:
-            record = json.load(fp)
+    for ix in ixs:
+        record = tub.load_json_data(ix)
         user_angle = float(record["user/angle"])
-        record["filename"] = record_path
         iBin = round((user_angle * half_bins)  + (half_bins - 1)) % num_bins
-        bins[iBin].append(record)
-        records.append(record)
+        bins[iBin].append(ix)
+        records.append(ix)
 
 
     for i in range(num_bins):
@@ -65,12 +62,13 @@ def main(tub_path, count):
     print("have", count, "records selected. removing the rest...")
 
     
-    for record in records:
-        if record in keep:
+    keep = set(keep)
+    for ix in records:
+        if ix in keep:
             continue
-        img_filename = os.path.join(tub_path, record['cam/image_array'])
-        os.unlink(img_filename)
-        os.unlink(record["filename"])
+        # the record and its image
+        tub.erase_record(ix)
+    tub.shutdown()
 
     print('done')
     
@@ -0,0 +1,61 @@
+"""
+Script to measure the per tick overhead of the Vehicle drive loop
+
+Runs a chain of no-op parts, each reading the output of the previous one,
+so the time measured is spent in the framework rather than in the parts.
+
+Usage:
+    profile_vehicle.py [--parts=<n>] [--hz=<hz>] [--loops=<n>] [--parallel]
+
+Options:
+    -h --help        Show this screen.
+    --parts=<n>      Number of no-op parts in the chain. [default: 50]
+    --hz=<hz>        Drive loop rate. [default: 1000]
+    --loops=<n>      Number of drive loops to run. [default: 5000]
+    --parallel       Use the parallel part scheduler.
+"""
+import time
+from docopt import docopt
+import donkeycar as dk
+
+
+class NoOp:
+    def run(self, value=None):
+        return value
+
+
+def build_vehicle(num_parts):
+    V = dk.vehicle.Vehicle()
+    V.add(NoOp(), outputs=['noop/0'])
+    for i in range(1, num_parts):
+        V.add(NoOp(), inputs=['noop/%d' % (i - 1)], outputs=['noop/%d' % i])
+    return V
+
+
+def profile(num_parts, rate_hz, loops, parallel):
+    V = build_vehicle(num_parts)
+
+    # overhead of a tick with nothing else going on
+    V.compile()
+    start = time.perf_counter()
+    for _ in range(loops):
+        V.update_parts()
+    elapsed = time.perf_counter() - start
+    per_tick = elapsed / loops
+    print('update_parts: %.1f us per tick, %.2f us per part'
+          % (per_tick * 1e6, per_tick * 1e6 / num_parts))
+
+    # the achieved loop rate when driven by Vehicle.start
+    start = time.perf_counter()
+    V.start(rate_hz=rate_hz, max_loop_count=loops, parallel=parallel)
+    elapsed = time.perf_counter() - start
+    print('drive loop: %d loops at %d Hz target, %.1f Hz achieved'
+          % (loops, rate_hz, loops / elapsed))
+
+
+if __name__ == '__main__':
+    args = docopt(__doc__)
+    profile(num_parts=int(args['--parts']),
+            rate_hz=int(args['--hz']),
+            loops=int(args['--loops']),
+            parallel=args['--parallel'])
@@ -0,0 +1,94 @@
+"""
+Script to replay a recorded tub through a drive loop on a laptop
+
+Feeds the records of a tub, in the order they were recorded, to a drive
+loop with the image preprocessing, an optional pilot, the choice between
+user and pilot and a tub writer, then prints the part timings and how far
+the pilot steered from the recorded user angles. Without --realtime the
+loop runs as fast as the parts allow, so the time it takes is the cost of
+the pipeline. Run it from the car directory when giving a model, for its
+config.py.
+
+Usage:
+    replay_tub.py (--tub=<path>) [--model=<model>] [--type=<type>] [--realtime] [--speed=<x>] [--out=<path>] [--myconfig=<filename>]
+
+Options:
+    -h --help             Show this screen.
+    --tub=<path>          The tub to replay.
+    --model=<model>       Pilot to run on the replayed images.
+    --type=<type>         Model type of the pilot. [default: linear]
+    --realtime            Pace the loop by the record timestamps.
+    --speed=<x>           With --realtime, how many times faster than recorded. [default: 1.0]
+    --out=<path>          Tub to record the replay to, a temporary one when not given.
+    --myconfig=<filename> Specify myconfig file to use. [default: myconfig.py]
+"""
+import os
+import tempfile
+from docopt import docopt
+import numpy as np
+import donkeycar as dk
+from donkeycar.parts.datastore import TubWriter
+from donkeycar.parts.transform import Lambda
+from donkeycar.replay import TubReplay
+from donkeycar.utils import normalize_and_crop
+
+
+def choose(mode, user_angle, user_throttle, pilot_angle, pilot_throttle):
+    if mode in (None, 'user') or pilot_angle is None:
+        return user_angle, user_throttle
+    if mode == 'local_angle':
+        return pilot_angle, user_throttle
+    return pilot_angle, pilot_throttle
+
+
+def replay_tub(tub_path, model_path, model_type, realtime, speed, out_path,
+               myconfig):
+    replay = TubReplay(tub_path, realtime=realtime, speed=speed)
+    for key in ('user/angle', 'user/throttle', 'user/mode'):
+        if key not in replay.keys:
+            replay.keys.append(key)
+    out_path = out_path or os.path.join(tempfile.mkdtemp(), 'replay')
+
+    V = dk.vehicle.Vehicle()
+    V.add(replay, outputs=replay.keys, tick_on_frame=True)
+
+    if model_path:
+        cfg = dk.load_config(myconfig=myconfig)
+        kl = dk.utils.get_model_by_type(model_type, cfg)
+        kl.load(os.path.expanduser(model_path))
+        V.add(Lambda(lambda img_arr: normalize_and_crop(img_arr, cfg)),
+              inputs=['cam/image_array'],
+              outputs=['cam/normalized/cropped'])
+        V.add(kl, inputs=['cam/normalized/cropped'],
+              outputs=['pilot/angle', 'pilot/throttle'])
+
+    V.add(Lambda(choose),
+          inputs=['user/mode', 'user/angle', 'user/throttle',
+                  'pilot/angle', 'pilot/throttle'],
+          outputs=['angle', 'throttle'])
+
+    inputs = ['cam/image_array', 'user/angle', 'user/throttle',
+              'user/mode', 'pilot/angle', 'pilot/throttle']
+    types = ['image_array', 'float', 'float', 'str', 'float', 'float']
+    tub = TubWriter(out_path, inputs=inputs, types=types, clock=replay.clock)
+    V.add(tub, inputs=inputs, outputs=['tub/num_records'])
+
+    replay.drive(V)
+
+    print('Recorded the replay to {}'.format(out_path))
+    if model_path:
+        df = tub.get_df()
+        error = np.abs(df['pilot/angle'] - df['user/angle'])
+        print('pilot angle against the recorded user angle: mean error '
+              '%.3f, max error %.3f' % (error.mean(), error.max()))
+
+
+if __name__ == '__main__':
+    args = docopt(__doc__)
+    replay_tub(tub_path=args['--tub'],
+               model_path=args['--model'],
+               model_type=args['--type'],
+               realtime=args['--realtime'],
+               speed=float(args['--speed']),
+               out_path=args['--out'],
+               myconfig=args['--myconfig'])